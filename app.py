@@ -1,10 +1,22 @@
-import xgboost as xgb
 import streamlit as st
-import pandas as pd
 import time
-import google.generativeai as genai
+import io
 import os
 
+# Only lightweight modules are imported up front; numpy, pandas, xgboost and
+# google.generativeai are imported by the resource loaders on first use
+from pricing import load_xgb_model, convert_currencies, price_csv
+from diamond_insights import generate_diamond_insights
+from response_cache import ResponseCache
+from expert_advisor import ask_expert, stream_expert
+from knowledge_index import build_knowledge_index
+from audit_log import AUDIT_DIR, AuditLog
+from llm_client import AsyncLLMClient
+from lazy_resources import LazyResource, start_warmup
+from chat_history import ChatHistory
+from metrics import REGISTRY, histogram, span, start_metrics_server, traced
+import knowledge_content
+
 # Page configuration
 st.set_page_config(
     page_title="Admads AI",
@@ -210,160 +222,251 @@ st.markdown("""
 # In a production environment, this should be stored securely using environment variables
 # or a secret management service
 GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]  # Replace with your actual API key
-genai.configure(api_key=GEMINI_API_KEY)
 
-# Function to initialize and configure Gemini model
-@st.cache_resource
+# Function to initialize and configure Gemini model. With FAKE_GEMINI_LATENCY
+# set (seconds before the first chunk; FAKE_GEMINI_CHUNK_LATENCY before each
+# following one) a local stub answers instead, for load tests and offline runs.
 def init_gemini_model():
+    if os.environ.get('FAKE_GEMINI_LATENCY'):
+        from fake_gemini import FakeGenerativeModel
+
+        return FakeGenerativeModel('gemini-2.0-flash', latency=env_float('FAKE_GEMINI_LATENCY'),
+                                   chunk_latency=env_float('FAKE_GEMINI_CHUNK_LATENCY', 0.0))
+
+    import google.generativeai as genai
+
+    genai.configure(api_key=GEMINI_API_KEY)
     # Configure the generative model with diamond-specific context
     model = genai.GenerativeModel('gemini-2.0-flash')
     return model
 
-# Loading up the Regression model
-@st.cache_resource
-def load_model():
-    model = xgb.XGBRegressor()
-    model.load_model('xgb_model.json')
-    return model
+# Optional float setting from the environment
+def env_float(name, default=None):
+    value = os.environ.get(name)
+    return float(value) if value else default
 
-model = load_model()
-gemini_model = init_gemini_model()
+# Shared async client in front of Gemini: deadlines, bounded concurrency,
+# optional rate limiting and hedging, retries with jittered backoff
+def init_llm_client():
+    return AsyncLLMClient(
+        init_gemini_model(),
+        max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', 8)),
+        rate_limit=env_float('LLM_RATE_LIMIT'),
+        timeout=env_float('LLM_TIMEOUT', 30.0),
+        retries=int(os.environ.get('LLM_RETRIES', 2)),
+        hedge_after=env_float('LLM_HEDGE_AFTER')
+    )
 
-# Define the prediction function
-def predict(carat, cut, color, clarity, depth, table, x, y, z):
-    # Mapping categorical variables
-    cut_mapping = {'Fair': 0, 'Good': 1, 'Very Good': 2, 'Premium': 3, 'Ideal': 4}
-    color_mapping = {'J': 0, 'I': 1, 'H': 2, 'G': 3, 'F': 4, 'E': 5, 'D': 6}
-    clarity_mapping = {'I1': 0, 'SI2': 1, 'SI1': 2, 'VS2': 3, 'VS1': 4, 'VVS2': 5, 'VVS1': 6, 'IF': 7}
-    
-    # Use the mappings directly
-    cut_encoded = cut_mapping[cut]
-    color_encoded = color_mapping[color]
-    clarity_encoded = clarity_mapping[clarity]
-    
-    # Create prediction dataframe
-    prediction_df = pd.DataFrame([[carat, cut_encoded, color_encoded, clarity_encoded, depth, table, x, y, z]], 
-                                columns=['carat', 'cut', 'color', 'clarity', 'depth', 'table', 'x', 'y', 'z'])
-    
-    # Make prediction
-    prediction = model.predict(prediction_df)
-    return prediction
-
-# Function to convert USD to other currencies
-def convert_currencies(usd_price):
-    # Exchange rates (as of March 2025 - for simulation purposes)
-    exchange_rates = {
-        'INR': 83.5,  # 1 USD = 83.5 INR
-        'JPY': 149.8, # 1 USD = 149.8 JPY
-        'AED': 3.67   # 1 USD = 3.67 AED
-    }
-    
+# Memoized predictions on the slider lattice; set PREDICTION_CACHE_PREWARM=<n>
+# to pre-price the n most common configurations from diamonds.csv at startup
+def load_prediction_cache(engine):
+    from prediction_cache import PredictionCache, popular_configurations
+
+    cache = PredictionCache(engine, maxsize=int(os.environ.get('PREDICTION_CACHE_SIZE', 10000)))
+    prewarm = int(os.environ.get('PREDICTION_CACHE_PREWARM', 0))
+    if prewarm > 0:
+        cache.warm(popular_configurations(top=prewarm))
+    return cache
+
+# Everything served from one model artifact: the flattened tree engine for
+# single-row predictions with its prediction and sensitivity caches, and the
+# XGBoost model for batch pricing, loaded on first use
+def load_model_bundle(path):
+    from sensitivity import SweepCache
+    from tree_engine import load_tree_ensemble
+
+    engine = load_tree_ensemble(path)
     return {
-        'USD': usd_price,
-        'INR': usd_price * exchange_rates['INR'],
-        'JPY': usd_price * exchange_rates['JPY'],
-        'AED': usd_price * exchange_rates['AED']
+        'engine': engine,
+        'prediction_cache': load_prediction_cache(engine),
+        'sweeps': SweepCache(engine, maxsize=int(os.environ.get('SENSITIVITY_CACHE_SIZE', 256))),
+        'model': LazyResource('XGBoost model', lambda: load_xgb_model(path))
     }
 
-# Function to generate diamond insights based on characteristics
-def generate_diamond_insights(carat, cut, color, clarity):
-    insights = {
-        "Fair": "A fair cut reflects less light, resulting in less brilliance. While economical, this cut doesn't showcase a diamond's potential sparkle.",
-        "Good": "Good cuts offer decent brilliance at a reasonable price point, making them suitable for budget-conscious buyers who still want quality.",
-        "Very Good": "Very Good cuts provide excellent brilliance and fire. They're an excellent value, offering nearly the same visual appeal as Ideal cuts at a lower price.",
-        "Premium": "Premium cuts display exceptional brilliance and fire. They're precision-cut to maximize light reflection, though sometimes with slightly deeper proportions.",
-        "Ideal": "Ideal cuts represent the pinnacle of diamond cutting, with perfect proportions to maximize brilliance and fire. They reflect nearly all light that enters the diamond."
-    }
-    
-    color_insights = {
-        "D": "Completely colorless and extremely rare. The highest color grade available.",
-        "E": "Colorless, but slightly less rare than D. Differences are not visible to the untrained eye.",
-        "F": "Colorless, but detectable by gemologists. Still considered colorless to the naked eye.",
-        "G": "Near-colorless with slight traces of color, visible only to expert gemologists.",
-        "H": "Near-colorless with minimal color visible under magnification.",
-        "I": "Near-colorless with slight warmth that may be visible in larger diamonds.",
-        "J": "Near-colorless with noticeable warmth that provides good value."
-    }
-    
-    clarity_insights = {
-        "IF": "Internally Flawless: No internal inclusions visible under 10x magnification.",
-        "VVS1": "Very, Very Slightly Included 1: Contains minute inclusions difficult for expert gemologists to see.",
-        "VVS2": "Very, Very Slightly Included 2: Contains minute inclusions slightly easier to see than VVS1.",
-        "VS1": "Very Slightly Included 1: Contains minor inclusions difficult to see under 10x magnification.",
-        "VS2": "Very Slightly Included 2: Contains minor inclusions visible under 10x magnification.",
-        "SI1": "Slightly Included 1: Contains noticeable inclusions under 10x magnification but often not visible to naked eye.",
-        "SI2": "Slightly Included 2: Contains noticeable inclusions under 10x magnification, sometimes visible to the naked eye.",
-        "I1": "Included 1: Contains inclusions visible to the naked eye that may affect brilliance."
-    }
-    
-    carat_insight = f"At {carat} carats, this diamond has significant presence. "
-    if carat < 0.5:
-        carat_insight = f"At {carat} carats, this diamond is delicate and subtle. "
-    elif carat < 1.0:
-        carat_insight = f"At {carat} carats, this diamond has a good balance of presence and value. "
-    elif carat < 2.0:
-        carat_insight = f"At {carat} carats, this diamond makes a substantial statement. "
-    else:
-        carat_insight = f"At {carat} carats, this diamond has exceptional presence and rarity. "
-    
+# Finish preparing a bundle off the request path: the XGBoost model for batch
+# pricing and the engine's attribution tables for the price drivers
+def warm_model_bundle(bundle):
+    bundle['model'].get()
+    bundle['engine'].prepare_explain()
+
+# Active model from the registry in models/ (falling back to xgb_model.json).
+# Activating another version swaps it in within MODEL_POLL_INTERVAL seconds;
+# the new version is loaded and warmed on the watcher thread first.
+def init_models():
+    from model_registry import HotSwapModel, ModelRegistry
+
+    models = HotSwapModel(ModelRegistry(os.environ.get('MODEL_REGISTRY_DIR', 'models')), load_model_bundle,
+                          warm=warm_model_bundle,
+                          poll_interval=env_float('MODEL_POLL_INTERVAL', 5.0))
+    models.start_watcher()
+    return models
+
+# Spatial index over diamonds.csv for the nearest real transactions
+def load_comparables():
+    from comparables import load_comparables_index
+
+    return load_comparables_index()
+
+# Market statistics by cut, color, clarity and carat range, built once from
+# diamonds.csv and updated when rows are appended to it
+def load_market_cube():
+    from market_cube import load_market_cube
+
+    return load_market_cube()
+
+# Every valuation is appended to an audit log (audit_log.py) by a background
+# writer, in AUDIT_LOG_DIR; AUDIT_LOG=0 turns it off
+def init_audit_log():
+    if os.environ.get('AUDIT_LOG', '1') == '0':
+        return None
+    return AuditLog(os.environ.get('AUDIT_LOG_DIR', AUDIT_DIR),
+                    max_bytes=int(env_float('AUDIT_LOG_MAX_MB', 64.0) * 2 ** 20),
+                    max_age=env_float('AUDIT_LOG_MAX_AGE', 24 * 3600.0))
+
+# Persistent cache of expert answers shared by every session and process
+def load_response_cache():
+    return ResponseCache(
+        os.environ.get('EXPERT_CACHE_PATH', 'expert_cache.sqlite3'),
+        ttl=env_float('EXPERT_CACHE_TTL', 7 * 24 * 3600),
+        max_entries=int(os.environ.get('EXPERT_CACHE_SIZE', 5000)),
+        near_duplicate=env_float('EXPERT_CACHE_NEAR_DUPLICATE')
+    )
+
+# Heavy resources, created once per process on first use rather than at import
+@st.cache_resource
+def app_resources():
     return {
-        "cut": insights.get(cut, ""),
-        "color": color_insights.get(color, ""),
-        "clarity": clarity_insights.get(clarity, ""),
-        "carat": carat_insight
+        'models': LazyResource('Model registry', init_models),
+        'llm_client': LazyResource('Gemini client', init_llm_client),
+        'response_cache': LazyResource('Response cache', load_response_cache),
+        'comparables': LazyResource('Comparables index', load_comparables),
+        'knowledge': LazyResource('Knowledge index', build_knowledge_index),
+        'market': LazyResource('Market cube', load_market_cube),
+        'audit_log': LazyResource('Audit log', init_audit_log)
     }
 
+# Build the resources in the background once the first page has been rendered.
+# Set WARMUP_AFTER_FIRST_PAINT=0 to load strictly on demand.
+@st.cache_resource
+def start_background_warmup():
+    if os.environ.get('WARMUP_AFTER_FIRST_PAINT', '1') == '0':
+        return None
+    order = ['models', 'comparables', 'market', 'knowledge', 'response_cache', 'llm_client']
+    bundle_extras = LazyResource('Model warm-up', lambda: warm_model_bundle(resources['models'].get().current))
+    return start_warmup([resources[name] for name in order] + [bundle_extras],
+                        delay=env_float('WARMUP_DELAY', 1.0))
+
+resources = app_resources()
+
+# Counters the app's components already keep, read at each scrape
+def app_metrics():
+    families = []
+    if resources['models'].loaded:
+        models = resources['models'].get()
+        bundle = models.current
+        prediction, sweeps = bundle['prediction_cache'].stats(), bundle['sweeps'].stats()
+        families.append(('model_info', 'gauge', "Active model version", [({'version': models.version}, 1)]))
+        families.append(('model_swaps_total', 'counter', "Model hot swaps", [({}, models.swaps)]))
+        families.append(('prediction_cache_entries', 'gauge', "Entries in the prediction cache",
+                         [({}, prediction['size'])]))
+        families.append(('cache_lookups_total', 'counter', "Cache lookups by cache and result", [
+            ({'cache': 'prediction', 'result': 'hit'}, prediction['hits']),
+            ({'cache': 'prediction', 'result': 'partial'}, prediction['partial_hits']),
+            ({'cache': 'prediction', 'result': 'miss'}, prediction['misses']),
+            ({'cache': 'sensitivity', 'result': 'hit'}, sweeps['hits']),
+            ({'cache': 'sensitivity', 'result': 'miss'}, sweeps['misses'])
+        ] + ([
+            ({'cache': 'expert', 'result': result}, count)
+            for result, count in resources['response_cache'].get().stats().items() if result != 'size'
+        ] if resources['response_cache'].loaded else [])))
+        families.append(('prediction_cache_evictions_total', 'counter', "Prediction cache evictions",
+                         [({}, prediction['evictions'])]))
+    if resources['llm_client'].loaded:
+        llm_stats = resources['llm_client'].get().stats()
+        families.append(('llm_client_events_total', 'counter', "Gemini client requests, retries, hedges and errors",
+                         [({'event': event}, count) for event, count in llm_stats.items()
+                          if not event.endswith('_ms')]))
+    if resources['audit_log'].loaded and resources['audit_log'].get() is not None:
+        audit_stats = resources['audit_log'].get().stats()
+        families.append(('audit_records_total', 'counter', "Valuations by audit log outcome",
+                         [({'result': result}, audit_stats[result]) for result in ('written', 'dropped', 'errors')]))
+        families.append(('audit_queue_depth', 'gauge', "Valuations waiting for the audit writer",
+                         [({}, audit_stats['queued'])]))
+    families.append(('resource_load_seconds', 'gauge', "Time taken to build each lazily loaded resource",
+                     [({'resource': resource.name}, resource.load_seconds)
+                      for resource in resources.values() if resource.load_seconds is not None]))
+    return families
+
+# Prometheus metrics and recent traces on http://127.0.0.1:METRICS_PORT
+# (/metrics, /traces), once per process; METRICS_PORT=0 turns the endpoint off
+@st.cache_resource
+def init_metrics():
+    REGISTRY.add_collector(app_metrics)
+    port = int(os.environ.get('METRICS_PORT', 9464))
+    return start_metrics_server(port) if port else None
+
+init_metrics()
+
+# The spinners' deliberate pauses. They are traced, so they no longer hide
+# inside interaction latency; ARTIFICIAL_DELAYS=0 removes them.
+def artificial_delay(seconds):
+    if os.environ.get('ARTIFICIAL_DELAYS', '1') == '0':
+        return
+    with span('artificial_delay'):
+        time.sleep(seconds)
+
+# Define the prediction function; returns the price, each feature's contribution
+# to it (plus the expected price last) and the model version that produced them
+def predict(carat, cut, color, clarity, depth, table, x, y, z):
+    # One bundle per call, so a model swap mid-request cannot mix versions.
+    # Repeated inputs are answered from the cache; misses walk the trees natively.
+    with span('predict'):
+        bundle = resources['models'].get().current
+        price, contributions = bundle['prediction_cache'].explain(carat, cut, color, clarity, depth, table, x, y, z)
+    return price, contributions, bundle['version']
+
+# Contribution table for the valuation, largest effect first
+def price_drivers(contributions, carat, cut, color, clarity, depth, table, x, y, z):
+    labels = [('Carat', f"{carat:.2f}"), ('Cut', cut), ('Color', color), ('Clarity', clarity),
+              ('Depth %', f"{depth:.1f}"), ('Table %', f"{table:.1f}"), ('Length (X)', f"{x:.1f} mm"),
+              ('Width (Y)', f"{y:.1f} mm"), ('Height (Z)', f"{z:.1f} mm")]
+    drivers = [{'Feature': name, 'Value': value, 'Effect (USD)': float(effect)}
+               for (name, value), effect in zip(labels, contributions[:-1])]
+    drivers.sort(key=lambda driver: abs(driver['Effect (USD)']), reverse=True)
+    return drivers
+
+# How the chat uses the bundled content (knowledge_index.py): KNOWLEDGE_RETRIEVAL
+# is 'answer' (default: answer covered questions locally, ground the rest),
+# 'ground' (never answer locally) or 'off'
+def knowledge_options():
+    mode = os.environ.get('KNOWLEDGE_RETRIEVAL', 'answer')
+    knowledge = resources['knowledge'].get() if mode in ('answer', 'ground') else None
+    return {'knowledge': knowledge, 'local_answers': mode == 'answer'}
+
 # Function to generate expert response using Gemini API
-def generate_expert_response(prompt):
-    try:
-        # Create a system prompt that guides Gemini to act as a diamond expert
-        system_prompt = """
-        You are DiamondGenius, an expert AI advisor specializing in diamonds. Provide accurate, helpful information about:
-        - Diamond quality factors (4Cs: Cut, Color, Clarity, Carat)
-        - Pricing considerations and market trends
-        - Diamond investment advice
-        - Ethical considerations and lab-grown diamonds
-        - Diamond maintenance and care
-        - Diamond price estimation
-        - Diamond shopping tips
-        
-        Keep responses concise (under 250 words) yet informative. Use formal but accessible language.
-        Always provide balanced information, considering both traditional and modern perspectives on diamonds.
-        """
-        
-        # Create a safety context for the model
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            }
-        ]
-        
-        # Combine the system prompt with the user's query
-        full_prompt = f"{system_prompt}\n\nUser question: {prompt}"
-        
-        # Generate response from Gemini
-        response = gemini_model.generate_content(
-            full_prompt,
-            generation_config={"temperature": 0.2, "max_output_tokens": 500}
-        )
-        
-        return response.text
-    except Exception as e:
-        # Fallback response in case of API errors
-        return f"I apologize, but I'm having trouble connecting to my knowledge base at the moment. Please try again in a few moments. (Error: {str(e)})"
+def generate_expert_response(prompt, context=''):
+    with span('expert_answer'):
+        return ask_expert(resources['llm_client'].get(), prompt, cache=resources['response_cache'].get(),
+                          context=context, **knowledge_options())
+
+# Streaming variant for the chat; timings receives time-to-first-token and total time
+def stream_expert_response(prompt, timings=None, context=''):
+    return stream_expert(resources['llm_client'].get(), prompt, cache=resources['response_cache'].get(),
+                         timings=timings, context=context, **knowledge_options())
+
+# Per-session chat history: at most CHAT_MAX_MESSAGES kept, and the model sees
+# the recent turns within CHAT_TOKEN_BUDGET plus a summary of older ones
+def new_chat_history():
+    return ChatHistory(
+        greeting="Hello! I'm the DiamondGenius AI advisor. Ask me anything about diamonds, from selection tips to investment advice!",
+        token_budget=int(os.environ.get('CHAT_TOKEN_BUDGET', 1500)),
+        summary_budget=int(os.environ.get('CHAT_SUMMARY_BUDGET', 300)),
+        max_messages=int(os.environ.get('CHAT_MAX_MESSAGES', 200))
+    )
+
+# Move the chat view one page older (+1) or newer (-1)
+def turn_chat_page(step):
+    st.session_state.chat_page = max(0, st.session_state.chat_page + step)
 
 # Sidebar content
 with st.sidebar:
@@ -387,14 +490,65 @@ with st.sidebar:
     # Simulate loading
     if st.sidebar.button("Refresh Data"):
         with st.spinner("Refreshing data..."):
-            time.sleep(1.5)
+            artificial_delay(1.5)
         st.success("Data refreshed successfully!")
 
-# Main content with tabs
-tab1, tab2, tab3 = st.tabs(["💼 Quality Analysis", "📚 About Diamonds", "🤖 Expert Advice"])
+    # Prediction cache counters
+    with st.expander("Prediction Cache"):
+        if resources['models'].loaded:
+            models = resources['models'].get()
+            cache_stats = models.current['prediction_cache'].stats()
+            st.write(f"Model version: {models.version} · Swaps: {models.swaps:,}")
+            if models.last_error:
+                st.warning(f"Model reload failed: {models.last_error}")
+            st.write(f"Hits: {cache_stats['hits']:,} · Partial hits (price only): {cache_stats['partial_hits']:,} · "
+                     f"Misses: {cache_stats['misses']:,} · Evictions: {cache_stats['evictions']:,}")
+            st.write(f"Entries: {cache_stats['size']:,} / {cache_stats['maxsize']:,} · Hit rate: {cache_stats['hit_rate']:.1%}")
+        else:
+            st.write("Not loaded yet.")
+
+    # Expert advisor client counters
+    with st.expander("Expert Advisor Client"):
+        if resources['llm_client'].loaded:
+            llm_stats = resources['llm_client'].get().stats()
+            st.write(f"Requests: {llm_stats['requests']:,} · Retries: {llm_stats['retries']:,} · Hedges: {llm_stats['hedges']:,}")
+            st.write(f"Timeouts: {llm_stats['timeouts']:,} · Failures: {llm_stats['failures']:,}")
+            st.write(f"Queue p50/p99: {llm_stats['queue_p50_ms']:.0f} / {llm_stats['queue_p99_ms']:.0f} ms")
+            st.write(f"Upstream p50/p99: {llm_stats['upstream_p50_ms']:.0f} / {llm_stats['upstream_p99_ms']:.0f} ms")
+        else:
+            st.write("Not loaded yet.")
+
+# Each panel below is a fragment: a widget inside it reruns just that panel
+# instead of the whole script, so moving a slider no longer re-executes the
+# sidebar, the other tabs or the CSS, and only the panel's deltas are sent.
+# The sidebar counters therefore refresh on full reruns only.
+
+# Inputs the sensitivity chart can vary, with their slider labels
+SENSITIVITY_INPUTS = {
+    'carat': "Carat Weight", 'cut': "Cut Rating", 'color': "Color Rating", 'clarity': "Clarity Rating",
+    'depth': "Diamond Depth Percentage", 'table': "Diamond Table Percentage",
+    'x': "Diamond Length (X) in mm", 'y': "Diamond Width (Y) in mm", 'z': "Diamond Height (Z) in mm"
+}
+
+# Price of the current stone as one input sweeps its range (or every grade);
+# all the sweeps come from one batched model call, cached per input
+@traced('sensitivity')
+def sensitivity_chart(carat, cut, color, clarity, depth, table, x, y, z):
+    from sensitivity import sweep_chart_spec
+
+    bundle = resources['models'].get().current
+    sweeps = bundle['sweeps'].get(carat, cut, color, clarity, depth, table, x, y, z)
+    column = st.selectbox("Vary", list(SENSITIVITY_INPUTS), format_func=SENSITIVITY_INPUTS.get)
+    current = {'carat': carat, 'cut': cut, 'color': color, 'clarity': clarity, 'depth': depth,
+               'table': table, 'x': x, 'y': y, 'z': z}[column]
+    st.vega_lite_chart(sweep_chart_spec(column, sweeps[column], current, SENSITIVITY_INPUTS[column]),
+                       width='stretch')
+    st.caption("Every other characteristic is held at its current value (marked).")
 
 # Tab 1: Quality Analysis
-with tab1:
+@st.fragment
+@traced('render_predictor')
+def predictor_panel():
     st.markdown("<h1 class='animate-slide'>Diamond Price Predictor</h1>", unsafe_allow_html=True)
     
     # Diamond analysis icon
@@ -430,12 +584,18 @@ with tab1:
     
     if st.button('Predict Diamond Price'):
         with st.spinner("Analyzing diamond characteristics..."):
-            time.sleep(1)  # For dramatic effect
-            price = predict(carat, cut, color, clarity, depth, table, x, y, z)
+            artificial_delay(1)  # For dramatic effect
+            started = time.perf_counter()
+            price_value, contributions, model_version = predict(carat, cut, color, clarity, depth, table, x, y, z)
             
             # Convert price to multiple currencies
-            price_value = price[0]
-            currencies = convert_currencies(price_value)
+            with span('convert'):
+                currencies = convert_currencies(price_value)
+            audit_log = resources['audit_log'].get()
+            if audit_log is not None:
+                audit_log.record({'carat': carat, 'cut': cut, 'color': color, 'clarity': clarity, 'depth': depth,
+                                  'table': table, 'x': x, 'y': y, 'z': z},
+                                 model_version, price_value, currencies, time.perf_counter() - started)
         
         # Display price in multiple currencies
         st.markdown("### Diamond Valuation")
@@ -465,6 +625,16 @@ with tab1:
             st.markdown("<div class='currency-name'>AED (UAE Dirham)</div>", unsafe_allow_html=True)
             st.markdown(f"<div class='currency-value'>د.إ{currencies['AED']:,.2f}</div>", unsafe_allow_html=True)
             st.markdown("</div>", unsafe_allow_html=True)
+
+        st.caption(f"Model version {model_version}")
+
+        # How each characteristic moves this stone away from the average price
+        st.markdown("### Price Drivers")
+        st.dataframe(price_drivers(contributions, carat, cut, color, clarity, depth, table, x, y, z),
+                     hide_index=True, width='stretch',
+                     column_config={'Effect (USD)': st.column_config.NumberColumn(format="%+.2f")})
+        st.caption(f"Starting from an average stone at ${contributions[-1]:,.2f}; the effects add up to the "
+                   f"predicted price (SHAP values).")
         
         # Display insights
         insights = generate_diamond_insights(carat, cut, color, clarity)
@@ -479,11 +649,80 @@ with tab1:
         with insights_cols[1]:
             st.markdown(f"**Color Grade**: {insights['color']}")
             st.markdown(f"**Clarity Assessment**: {insights['clarity']}")
-    
+
+        # How the estimate compares with reference stones of the same grades and carat range
+        st.markdown("### Market Context")
+        with span('market_context'):
+            market = resources['market'].get()
+            cell = market.stats(cut, color, clarity, carat)
+            rank = market.rank(price_value, cut, color, clarity, carat)
+            profile = market.carat_profile(cut, color, clarity)
+        if cell['stones']:
+            market_cols = st.columns(3)
+            market_cols[0].metric("Median price", f"${cell['median_price']:,.0f}")
+            market_cols[1].metric("Median price per carat", f"${cell['median_price_per_carat']:,.0f}")
+            market_cols[2].metric("Estimate above", f"{rank['price_percentile']:.0f}% of stones" if rank else "—")
+            st.caption(f"{cell['stones']:,} reference stones graded {cut}, {color}, {clarity} at "
+                       f"{cell['carat_range']}; the middle half sold between ${cell['price_p25']:,.0f} and "
+                       f"${cell['price_p75']:,.0f}.")
+        else:
+            st.write(f"No reference stones graded {cut}, {color}, {clarity} at {cell['carat_range']}.")
+        with st.expander(f"{cut}, {color}, {clarity} by carat range"):
+            st.dataframe(profile, hide_index=True, width='stretch',
+                         column_order=['carat_range', 'stones', 'median_price', 'median_price_per_carat'],
+                         column_config={'median_price': st.column_config.NumberColumn(format="$%.0f"),
+                                        'median_price_per_carat': st.column_config.NumberColumn(format="$%.0f")})
+
+        # Nearest real stones of the same cut, color and clarity
+        st.markdown("### Comparable Stones")
+        with span('comparables'):
+            comparables = resources['comparables'].get().query(carat, cut, color, clarity, depth, table, x, y, z,
+                                                                k=int(os.environ.get('COMPARABLES_K', 5)))
+        if comparables:
+            st.dataframe(comparables, hide_index=True, width='stretch',
+                         column_order=['carat', 'cut', 'color', 'clarity', 'depth', 'table', 'x', 'y', 'z', 'price'])
+        else:
+            st.write("No stones with this cut, color and clarity in the reference data.")
+
+    # Off by default so the first paint does not wait on the model and the charts
+    if st.toggle("Show price sensitivity"):
+        sensitivity_chart(carat, cut, color, clarity, depth, table, x, y, z)
+
+    st.markdown("</div>", unsafe_allow_html=True)
+
+# Batch valuation for whole inventory lists
+@st.fragment
+@traced('render_batch_valuation')
+def batch_valuation_panel():
+    st.markdown("<div class='card animate-fade'>", unsafe_allow_html=True)
+    st.markdown("### Batch Valuation")
+    st.markdown("Upload a CSV in the same format as `diamonds.csv` to price every stone at once.")
+    inventory_file = st.file_uploader("Inventory CSV", type=["csv"])
+    explain = st.checkbox("Include each feature's contribution to the price")
+
+    if inventory_file is not None and st.button('Price Inventory'):
+        with st.spinner("Pricing inventory..."):
+            output = io.StringIO()
+            try:
+                start = time.perf_counter()
+                bundle = resources['models'].get().current
+                with span('batch_pricing'):
+                    rows = price_csv(bundle['model'].get(), inventory_file, output,
+                                     explainer=bundle['engine'] if explain else None)
+                elapsed = time.perf_counter() - start
+            except ValueError as e:
+                st.error(f"Could not price this file: {e}")
+            else:
+                st.success(f"Priced {rows:,} diamonds in {elapsed:.2f} seconds with model {bundle['version']}.")
+                st.download_button("Download Priced CSV", output.getvalue(),
+                                   file_name="priced_diamonds.csv", mime="text/csv")
+
     st.markdown("</div>", unsafe_allow_html=True)
 
 # Tab 2: About Diamonds
-with tab2:
+@st.fragment
+@traced('render_knowledge')
+def knowledge_center():
     st.markdown("<h1 class='animate-slide'>Diamond Knowledge Center</h1>", unsafe_allow_html=True)
     
     # Diamond info icon
@@ -503,37 +742,7 @@ with tab2:
     </div>
     """, unsafe_allow_html=True)
     
-    st.markdown("""
-    Diamonds are evaluated based on four main characteristics, known as the 4 Cs:
-    
-    ### 1. Carat
-    Carat refers to the weight of a diamond, not its size. One carat equals 200 milligrams.
-    - **Significance**: Larger diamonds are rarer and thus typically more valuable per carat.
-    - **Common Sizes**: Engagement rings often feature diamonds between 0.5 and 2.0 carats.
-    
-    ### 2. Cut
-    Cut refers to how well a diamond has been shaped and faceted, affecting its brilliance and sparkle.
-    - **Fair**: Minimal light reflection, less sparkle
-    - **Good**: Decent light reflection at a lower price point
-    - **Very Good**: Excellent sparkle, nearly comparable to Ideal
-    - **Premium**: Exceptional sparkle, sometimes with deeper proportions
-    - **Ideal**: Maximum brilliance and fire, perfect proportions
-    
-    ### 3. Color
-    Diamond color grading assesses the absence of color, with colorless diamonds being the most valuable.
-    - **D-F**: Colorless (most valuable)
-    - **G-J**: Near colorless
-    - **K-M**: Faint yellow
-    - **N-Z**: Very light to light yellow
-    
-    ### 4. Clarity
-    Clarity measures the presence of inclusions and blemishes.
-    - **FL/IF**: Flawless/Internally Flawless
-    - **VVS1/VVS2**: Very, Very Slightly Included
-    - **VS1/VS2**: Very Slightly Included
-    - **SI1/SI2**: Slightly Included
-    - **I1/I2/I3**: Included
-    """)
+    st.markdown(knowledge_content.FOUR_CS)
     st.markdown("</div>", unsafe_allow_html=True)
     
     st.markdown("<div class='card animate-fade'>", unsafe_allow_html=True)
@@ -542,67 +751,26 @@ with tab2:
     col1, col2 = st.columns(2)
     
     with col1:
-        st.markdown("""
-        ### Natural Diamonds
-        Formed over billions of years deep within the Earth under extreme pressure and heat.
-        
-        **Uses**:
-        - Fine jewelry and engagement rings
-        - Status symbols and investments
-        - Industrial cutting and grinding
-        
-        ### Lab-Grown Diamonds
-        Chemically identical to natural diamonds but created in controlled laboratory environments.
-        
-        **Uses**:
-        - Affordable alternative for jewelry
-        - Ethical and environmentally conscious choice
-        - Scientific and technological applications
-        """)
+        st.markdown(knowledge_content.NATURAL_AND_LAB_GROWN)
     
     with col2:
-        st.markdown("""
-        ### Fancy Color Diamonds
-        Natural diamonds with distinct colors like blue, pink, or yellow.
-        
-        **Uses**:
-        - Collector's items and luxury jewelry
-        - Ultra-high-end investments
-        - Museum pieces
-        
-        ### Industrial Diamonds
-        Lower quality diamonds used for their physical properties rather than appearance.
-        
-        **Uses**:
-        - Cutting, grinding, and polishing tools
-        - Thermal conductors in electronics
-        - Medical equipment and scientific instruments
-        """)
+        st.markdown(knowledge_content.FANCY_AND_INDUSTRIAL)
     
     st.markdown("</div>", unsafe_allow_html=True)
     
     st.markdown("<div class='card animate-fade'>", unsafe_allow_html=True)
     st.markdown("## Diamond Care and Maintenance")
-    st.markdown("""
-    ### Proper Cleaning
-    - Soak diamonds in a solution of mild dish soap and warm water
-    - Gently scrub with a soft toothbrush
-    - Rinse thoroughly and pat dry with a lint-free cloth
-    
-    ### Storage
-    - Store separately from other jewelry to prevent scratches
-    - Keep in a fabric-lined jewelry box or individual pouches
-    - Avoid exposure to household chemicals that can damage settings
-    
-    ### Professional Maintenance
-    - Have professional cleaning every six months
-    - Check prongs and settings annually for security
-    - Insure valuable diamond pieces
-    """)
+    st.markdown(knowledge_content.CARE_AND_MAINTENANCE)
     st.markdown("</div>", unsafe_allow_html=True)
 
+# Expert answer latency as the user sees it, cache hits included
+expert_first_token = histogram('expert_first_token_seconds', "Time to the first streamed token of an expert answer")
+expert_response = histogram('expert_response_seconds', "Time to the complete expert answer")
+
 # Tab 3: Expert Advice
-with tab3:
+@st.fragment
+@traced('render_chat')
+def expert_chat():
     st.markdown("<h1 class='animate-slide'>Diamond Expert Advisor</h1>", unsafe_allow_html=True)
     
     # Chatbot icon
@@ -618,33 +786,70 @@ with tab3:
     st.markdown("</div>", unsafe_allow_html=True)
     
     # Initialize chat history
-    if "messages" not in st.session_state:
-        st.session_state.messages = [
-            {"role": "assistant", "content": "Hello! I'm the DiamondGenius AI advisor. Ask me anything about diamonds, from selection tips to investment advice!"}
-        ]
-    
-    # Display chat messages
+    if "chat_history" not in st.session_state:
+        st.session_state.chat_history = new_chat_history()
+        st.session_state.chat_page = 0
+    history = st.session_state.chat_history
+    page_size = int(os.environ.get('CHAT_PAGE_SIZE', 20))
+    pages = history.pages(page_size)
+    page = min(st.session_state.chat_page, pages - 1)
+    
+    # Display one page of chat messages, so long sessions render no more per rerun
     st.markdown("<div class='card animate-fade'>", unsafe_allow_html=True)
-    for message in st.session_state.messages:
+    messages, first = history.page(page, page_size)
+    if pages > 1:
+        earlier_col, later_col = st.columns(2)
+        earlier_col.button("◀ Earlier messages", on_click=turn_chat_page, args=(1,), disabled=page >= pages - 1)
+        later_col.button("Later messages ▶", on_click=turn_chat_page, args=(-1,), disabled=page == 0)
+        st.caption(f"Messages {first + 1}–{first + len(messages)} of {history.total}")
+    if first == 0:
+        with st.chat_message("assistant"):
+            st.markdown(history.greeting)
+    elif page == pages - 1:
+        st.caption(f"{first} earlier messages are no longer shown; the advisor still has a summary of them.")
+    for message in messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
     
     # Chat input
     if prompt := st.chat_input("Ask about diamonds..."):
-        # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        # Earlier turns go to the model as context; then record the question
+        context = history.context_text()
+        history.append("user", prompt)
+        st.session_state.chat_page = 0
         
         # Display user message
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Generate response
+        # Generate response, rendering chunks as Gemini produces them
         with st.chat_message("assistant"):
-            with st.spinner("Consulting diamond expertise..."):
-                # Generate expert response using Gemini API
-                response_text = generate_expert_response(prompt)
-                
-                st.markdown(response_text)
-                st.session_state.messages.append({"role": "assistant", "content": response_text})
+            timings = {}
+            response_text = st.write_stream(stream_expert_response(prompt, timings, context))
+            if isinstance(response_text, list):
+                response_text = "".join(map(str, response_text))
+            history.append("assistant", response_text)
+            expert_first_token.observe(timings['first_token'])
+            expert_response.observe(timings['total'])
+            if timings.get('route') == 'local':
+                st.caption(f"Answered from the Knowledge Center in {timings['total'] * 1000:.1f} ms")
+            else:
+                st.caption(f"First token in {timings['first_token']:.2f}s · complete in {timings['total']:.2f}s")
     
     st.markdown("</div>", unsafe_allow_html=True)
+
+# Main content with tabs
+tab1, tab2, tab3 = st.tabs(["💼 Quality Analysis", "📚 About Diamonds", "🤖 Expert Advice"])
+
+with tab1:
+    predictor_panel()
+    batch_valuation_panel()
+
+with tab2:
+    knowledge_center()
+
+with tab3:
+    expert_chat()
+
+# Everything above has been sent to the browser; warm the rest up off the request path
+start_background_warmup()
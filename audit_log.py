@@ -0,0 +1,235 @@
+import argparse
+import atexit
+import csv
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+from feature_pipeline import FEATURE_COLUMNS, FEATURE_SCHEMA_VERSION, encode_row
+from pricing import DATASET_PATH
+
+# Append-only audit log of valuations.
+#
+#   audit = AuditLog('audit_logs')
+#   audit.record(inputs, model_version, price, currencies, latency_s)
+#
+#   python audit_log.py stats
+#   python audit_log.py replay --out audited.csv        # diamonds.csv schema
+#
+# record() only puts a tuple on a bounded in-memory queue, so the caller never
+# waits on disk. A background writer drains the queue in batches. For each
+# batch it encodes the features and serializes one compact JSON line per
+# valuation, then appends the whole batch with a single write. Each process
+# writes its own audit-<start time>-<pid>.jsonl file and starts a new one once
+# the current file reaches max_bytes or is max_age seconds old. When the queue
+# is full (the disk has stalled or the writer cannot keep up), new records are
+# dropped and counted rather than blocking the click or growing memory.
+# Pending records are flushed at interpreter exit.
+#
+# A line holds the time, model version, feature schema, the raw inputs, the
+# encoded feature row, the USD price, the converted prices and the latency. A
+# torn last line (a crash mid-write) is skipped on replay.
+#
+# Replayed prices are the model's own estimates, not sales, so replay only
+# ever writes a separate file: it refuses to write to the training dataset,
+# which would feed the model its own output on the next training run and skew
+# the comparables and market context drawn from diamonds.csv.
+
+AUDIT_DIR = 'audit_logs'
+DIAMONDS_COLUMNS = ['carat', 'cut', 'color', 'clarity', 'depth', 'table', 'price', 'x', 'y', 'z']
+
+_STOP = object()
+
+class AuditLog:
+    def __init__(self, directory=AUDIT_DIR, max_bytes=64 << 20, max_age=24 * 3600, batch_size=512,
+                 max_queue=10000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._file = None
+        self._opened = 0.0
+        self.path = None
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.batches = 0
+        self.files = 0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # Queue one valuation; returns False if it was dropped because the queue is full
+    def record(self, inputs, model_version, price, currencies, latency_s):
+        try:
+            self._queue.put_nowait((time.time(), inputs, model_version, price, currencies, latency_s))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    # Write everything queued so far and stop the writer
+    def close(self, timeout=5.0):
+        if self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                return
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {'written': self.written, 'dropped': self.dropped, 'errors': self.errors, 'batches': self.batches,
+                'files': self.files, 'queued': self._queue.qsize(), 'path': self.path}
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                self._rotate_if_due()
+                continue
+            batch = []
+            while item is not _STOP:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            if item is _STOP:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write(self, batch):
+        lines = []
+        for timestamp, inputs, model_version, price, currencies, latency_s in batch:
+            try:
+                features = encode_row(*(inputs[column] for column in FEATURE_COLUMNS))
+            except (KeyError, ValueError):
+                features = None
+            try:
+                # default=float covers numpy scalars in prices and inputs
+                lines.append(json.dumps({
+                    'time': round(timestamp, 3), 'model': model_version, 'schema': FEATURE_SCHEMA_VERSION,
+                    'inputs': inputs, 'features': features, 'price': round(float(price), 2),
+                    'currencies': {code: round(float(value), 2) for code, value in currencies.items()},
+                    'latency_ms': round(latency_s * 1000, 3)
+                }, separators=(',', ':'), default=float))
+            except (TypeError, ValueError):
+                self.errors += 1
+        if not lines:
+            return
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        try:
+            self._rotate_if_due(len(data))
+            if self._file is None:
+                self._open()
+            self._file.write(data)
+            self._file.flush()
+        except OSError:
+            # A failing disk loses this batch but must not kill the writer
+            self.errors += len(lines)
+            return
+        self.written += len(lines)
+        self.batches += 1
+
+    def _open(self):
+        stamp = time.strftime('%Y%m%dT%H%M%S')
+        self.path = os.path.join(self.directory, f'audit-{stamp}-{os.getpid()}.jsonl')
+        # Two rotations within one second would share a name
+        suffix = 1
+        while os.path.exists(self.path):
+            self.path = os.path.join(self.directory, f'audit-{stamp}-{os.getpid()}-{suffix}.jsonl')
+            suffix += 1
+        self._file = open(self.path, 'ab')
+        self._opened = time.monotonic()
+        self.files += 1
+
+    def _rotate_if_due(self, incoming=0):
+        if self._file is None:
+            return
+        if self._file.tell() + incoming > self.max_bytes or time.monotonic() - self._opened >= self.max_age:
+            self._file.close()
+            self._file = None
+
+# Every audit record in the directory, oldest file first
+def read_audit_log(directory=AUDIT_DIR):
+    for path in sorted(glob.glob(os.path.join(directory, 'audit-*.jsonl')), key=os.path.getmtime):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+# Audited valuations as rows of the diamonds.csv schema, the estimate as the
+# price; invalid inputs are skipped and, unless keep_duplicates, repeated stones
+# are kept once (latest estimate)
+def replay_rows(directory=AUDIT_DIR, keep_duplicates=False):
+    import pandas as pd
+
+    from feature_pipeline import valid_measurements
+
+    rows = [dict(record['inputs'], price=int(round(record['price']))) for record in read_audit_log(directory)
+            if record.get('inputs') and record.get('features') is not None]
+    df = pd.DataFrame(rows, columns=DIAMONDS_COLUMNS)
+    if df.empty:
+        return df
+    df = df[valid_measurements(df)]
+    if not keep_duplicates:
+        df = df.drop_duplicates(subset=FEATURE_COLUMNS, keep='last')
+    return df.reset_index(drop=True)
+
+# Whether path names the training dataset (or a link to it)
+def is_dataset(path, dataset=DATASET_PATH):
+    if os.path.realpath(path) == os.path.realpath(dataset):
+        return True
+    return os.path.exists(path) and os.path.exists(dataset) and os.path.samefile(path, dataset)
+
+# Write replayed rows to a new file in the diamonds.csv layout; never to the
+# training dataset itself
+def write_diamonds_csv(df, path, dataset=DATASET_PATH):
+    if is_dataset(path, dataset):
+        raise ValueError(f"{path} is the training dataset; replayed estimates are not sales. "
+                         f"Write them to a separate file.")
+    df.set_axis(range(1, len(df) + 1)).to_csv(path, quoting=csv.QUOTE_NONNUMERIC)
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and replay the valuation audit log.")
+    parser.add_argument('--dir', default=AUDIT_DIR, help="audit log directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help="count records, files and bytes")
+    replay = commands.add_parser('replay', help="convert audited valuations to diamonds.csv rows")
+    replay.add_argument('--out', required=True, help="CSV to write; never the training dataset")
+    replay.add_argument('--data', default=DATASET_PATH, help="training dataset replay must not overwrite")
+    replay.add_argument('--keep-duplicates', action='store_true', help="keep every valuation of a repeated stone")
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        paths = glob.glob(os.path.join(args.dir, 'audit-*.jsonl'))
+        records = sum(1 for _ in read_audit_log(args.dir))
+        size = sum(os.path.getsize(path) for path in paths)
+        print(f"{records:,} records in {len(paths)} files ({size / 2 ** 20:.2f} MiB, "
+              f"{size / records if records else 0:.0f} bytes per record)")
+        return
+
+    if is_dataset(args.out, args.data):
+        parser.error(f"--out {args.out} is the training dataset; replayed estimates are not sales")
+    df = replay_rows(args.dir, args.keep_duplicates)
+    write_diamonds_csv(df, args.out, args.data)
+    print(f"Wrote {len(df):,} estimated valuations to {args.out}")
+
+if __name__ == '__main__':
+    main()
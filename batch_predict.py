@@ -0,0 +1,38 @@
+import argparse
+import time
+
+from pricing import MODEL_PATH, load_xgb_model, price_csv
+
+# Batch valuation: price a whole inventory CSV (diamonds.csv schema) in one pass.
+#
+#   python batch_predict.py inventory.csv priced.csv --chunksize 50000
+#
+# --explain also writes each feature's contribution to every price (TreeSHAP
+# values from the native tree engine).
+
+def main():
+    parser = argparse.ArgumentParser(description="Price every diamond in a CSV file.")
+    parser.add_argument('src', help="input CSV in the diamonds.csv schema")
+    parser.add_argument('dst', help="output CSV with predicted prices appended")
+    parser.add_argument('--model', default=MODEL_PATH, help="path to the XGBoost model")
+    parser.add_argument('--chunksize', type=int, default=50000, help="rows priced per model call")
+    parser.add_argument('--explain', action='store_true', help="add per-feature price contributions")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    model = load_xgb_model(args.model)
+    explainer = None
+    if args.explain:
+        from tree_engine import load_tree_ensemble
+
+        explainer = load_tree_ensemble(args.model)
+    loaded = time.perf_counter()
+    rows = price_csv(model, args.src, args.dst, chunksize=args.chunksize, explainer=explainer)
+    done = time.perf_counter()
+
+    elapsed = done - loaded
+    print(f"Model loaded in {loaded - start:.2f}s")
+    print(f"Priced {rows:,} diamonds in {elapsed:.2f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s) -> {args.dst}")
+
+if __name__ == '__main__':
+    main()
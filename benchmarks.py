@@ -0,0 +1,272 @@
+import argparse
+import atexit
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Microbenchmarks for the prediction and rendering hot paths.
+#
+#   python benchmarks.py --save benchmark_baseline.json     # record a baseline
+#   python benchmarks.py --check benchmark_baseline.json    # fail on regressions
+#
+# Each benchmark reports throughput, p50/p99 latency per call and the peak
+# memory allocated during one call (tracemalloc: Python objects and numpy
+# buffers, not xgboost's native heap). --check exits non-zero when a benchmark
+# in the baseline is missing, or a figure exceeds the baseline by more than its
+# tolerance: --tolerance for the median and peak memory, the much wider
+# --p99-tolerance for p99, which swings with whatever else shares the machine.
+# Throughput is items over the median, so the median gate covers it too.
+# BUDGETS_MS caps a few medians outright, such as the cost of a span. The
+# baseline records the machine and model it was taken with, and --check warns
+# when either differs. Everything runs offline; the Gemini model is never
+# touched and no API key is needed.
+
+BATCH_SIZES = [1, 100, 10000, 50000]
+EXPLAIN_BATCH_SIZES = [1, 100, 10000]
+# Metric -> the tolerance argument that bounds it
+CHECKED_METRICS = {'p50_ms': 'tolerance', 'peak_kb': 'tolerance', 'p99_ms': 'p99_tolerance'}
+# Absolute p50 budgets (ms per call) that --check enforces whatever the
+# baseline says. A metrics_span call is 1000 spans, so these read as us per span.
+BUDGETS_MS = {'metrics_span': 1.4, 'metrics_span_traced': 1.6}
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+# Time fn until min_time has passed (at least min_runs calls, at most max_runs),
+# then run it once more under tracemalloc for its peak allocation
+def measure(fn, items=1, min_runs=5, max_runs=10000, min_time=0.5):
+    fn()
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < max_runs and (len(samples) < min_runs or time.perf_counter() - start < min_time):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    p50 = _percentile(samples, 50)
+    return {
+        'runs': len(samples),
+        'items_per_call': items,
+        'throughput_per_s': items / p50 if p50 else float('inf'),
+        'p50_ms': p50 * 1000,
+        'p99_ms': _percentile(samples, 99) * 1000,
+        'peak_kb': peak / 1024
+    }
+
+# Representative single-row inputs from the dataset
+def sample_rows(df, n=200):
+    from feature_pipeline import FEATURE_COLUMNS
+
+    return df[FEATURE_COLUMNS].sample(n=min(n, len(df)), random_state=0).to_dict('records')
+
+# Run the app once to the first paint, then time clicks on Predict Diamond Price,
+# including the script's spinner sleep. Clicks are audited as in production, but
+# into a scratch directory removed at exit, never the real audit_logs/
+def app_predict_click(app_path):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ['WARMUP_AFTER_FIRST_PAINT'] = '0'
+    os.environ['AUDIT_LOG'] = '1'
+    os.environ['AUDIT_LOG_DIR'] = tempfile.mkdtemp(prefix='benchmark-audit-')
+    # Registered before the app creates its AuditLog, so this runs after the log's own flush at exit
+    atexit.register(shutil.rmtree, os.environ['AUDIT_LOG_DIR'], ignore_errors=True)
+    app = AppTest.from_file(app_path, default_timeout=120)
+    app.secrets['GEMINI_API_KEY'] = 'benchmark'
+    app.run()
+
+    def click():
+        app.button[0].click().run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].value)
+    return click
+
+# 1000 spans nested inside one root span, the shape of an instrumented rerun;
+# items=1000, so the per-item latency is the cost of one span. traced records
+# the root's trace, as for the sampled roots once /traces is served
+def metrics_spans(n=1000, traced=False):
+    import metrics
+
+    root, stage = metrics.span('benchmark_root'), metrics.span('benchmark_stage')
+
+    def run():
+        previous = metrics.set_tracing(1 if traced else 0)
+        try:
+            with root:
+                for _ in range(n):
+                    with stage:
+                        pass
+        finally:
+            metrics.set_tracing(previous)
+    return run
+
+def build_benchmarks(data_path, model_path, app_path):
+    import pandas as pd
+
+    from comparables import load_comparables_index
+    from diamond_insights import generate_diamond_insights
+    from market_cube import load_market_cube
+    from prediction_cache import PredictionCache
+    from feature_pipeline import encode_features, encode_row
+    from pricing import convert_currencies, load_xgb_model, price_frame
+    from sensitivity import SweepCache, price_sweeps
+    from tree_engine import load_tree_ensemble
+
+    df = pd.read_csv(data_path, index_col=0)
+    model = load_xgb_model(model_path)
+    engine = load_tree_ensemble(model_path)
+    rows = sample_rows(df)
+    row_iter = iter(())
+
+    def next_row():
+        nonlocal row_iter
+        try:
+            return next(row_iter)
+        except StopIteration:
+            row_iter = iter(rows)
+            return next(row_iter)
+
+    comparables = load_comparables_index(data_path)
+    market = load_market_cube(data_path)
+
+    def market_context():
+        row = next_row()
+        market.stats(row['cut'], row['color'], row['clarity'], row['carat'])
+        market.rank(4000.0, row['cut'], row['color'], row['clarity'], row['carat'])
+        return market.carat_profile(row['cut'], row['color'], row['clarity'])
+    cache = PredictionCache(engine)
+    sweeps = SweepCache(engine)
+    for row in rows:
+        cache.explain(**row)
+        sweeps.get(**row)
+
+    benchmarks = {
+        'load_model': (lambda: load_xgb_model(model_path), 1, {'min_runs': 3, 'min_time': 1.0}),
+        'load_engine': (lambda: load_tree_ensemble(model_path), 1, {'min_runs': 3, 'min_time': 1.0}),
+        'build_comparables': (lambda: load_comparables_index(data_path), 1, {'min_runs': 3, 'min_time': 1.0}),
+        'encode_single': (lambda: encode_row(**next_row()), 1, {}),
+        'predict_single_native': (lambda: engine.predict_row(encode_row(**next_row())), 1, {}),
+        'predict_single_cached': (lambda: cache.predict(**next_row()), 1, {}),
+        'prepare_explain': (lambda: load_tree_ensemble(model_path).prepare_explain(), 1,
+                            {'min_runs': 3, 'min_time': 1.0}),
+        'explain_single_native': (lambda: engine.explain_row(encode_row(**next_row())), 1, {}),
+        'explain_single_cached': (lambda: cache.explain(**next_row()), 1, {}),
+        'sensitivity_sweep': (lambda: price_sweeps(engine, **next_row()), 1, {}),
+        'sensitivity_sweep_cached': (lambda: sweeps.get(**next_row()), 1, {}),
+        'comparables_query': (lambda: comparables.query(**next_row()), 1, {}),
+        'market_context': (market_context, 1, {}),
+        'convert_currencies': (lambda: convert_currencies(1234.5), 1, {}),
+        'generate_diamond_insights': (lambda: generate_diamond_insights(1.2, 'Ideal', 'G', 'VS2'), 1, {}),
+        'metrics_span': (metrics_spans(), 1000, {}),
+        'metrics_span_traced': (metrics_spans(traced=True), 1000, {})
+    }
+    for size in BATCH_SIZES:
+        batch = df.head(size)
+        benchmarks[f'encode_batch_{size}'] = (lambda batch=batch: encode_features(batch, errors='mask'), size, {})
+        benchmarks[f'predict_batch_{size}'] = (lambda batch=batch: price_frame(model, batch), size, {})
+    # Pricing with per-feature contributions, to compare against predict_batch_*
+    for size in EXPLAIN_BATCH_SIZES:
+        batch = df.head(size)
+        benchmarks[f'explain_batch_{size}'] = (lambda batch=batch: price_frame(model, batch, engine), size,
+                                               {'min_runs': 3, 'min_time': 0} if size >= 10000 else {})
+    if app_path:
+        benchmarks['app_predict_click'] = (app_predict_click(app_path), 1, {'min_runs': 3, 'min_time': 0})
+    return benchmarks
+
+# What a baseline was taken with: machine, interpreter and model file
+def environment(model_path):
+    from tree_engine import load_tree_ensemble
+
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+            'processor': platform.processor(), 'model_version': load_tree_ensemble(model_path).version}
+
+# Compare results against a baseline and the absolute budgets; returns a list
+# of human-readable regressions
+def check_regressions(results, baseline, tolerance, p99_tolerance):
+    tolerances = {'tolerance': tolerance, 'p99_tolerance': p99_tolerance}
+    regressions = []
+    for name, budget in BUDGETS_MS.items():
+        actual = results.get(name)
+        if actual is not None and actual['p50_ms'] > budget:
+            regressions.append(f"{name}: p50_ms {actual['p50_ms']:.3f} over its budget of {budget:.3f}")
+    for name, expected in baseline['results'].items():
+        actual = results.get(name)
+        if actual is None:
+            regressions.append(f"{name}: missing from this run")
+            continue
+        for metric, option in CHECKED_METRICS.items():
+            limit = expected[metric] * (1 + tolerances[option])
+            if actual[metric] > limit:
+                regressions.append(f"{name}: {metric} {actual[metric]:.3f} > {limit:.3f} "
+                                   f"(baseline {expected[metric]:.3f})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the prediction and rendering hot paths.")
+    parser.add_argument('--data', default='diamonds.csv')
+    parser.add_argument('--model', default='xgb_model.json')
+    parser.add_argument('--app', default='app.py', help="app to time Predict clicks on; '' to skip")
+    parser.add_argument('--only', nargs='*', default=None, help="benchmark names to run")
+    parser.add_argument('--save', default=None, help="write the results to this JSON baseline")
+    parser.add_argument('--check', default=None, help="compare against this JSON baseline")
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help="allowed relative increase of the median and peak memory (0.5 = +50%%)")
+    parser.add_argument('--p99-tolerance', type=float, default=3.0,
+                        help="allowed relative increase of p99 latency (3.0 = +300%%)")
+    args = parser.parse_args()
+
+    benchmarks = build_benchmarks(args.data, args.model, os.path.abspath(args.app) if args.app else None)
+    if args.only:
+        unknown = set(args.only) - set(benchmarks)
+        if unknown:
+            parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+        benchmarks = {name: benchmarks[name] for name in args.only}
+
+    results = {}
+    print(f"{'benchmark':<28}{'runs':>7}{'items/s':>14}{'p50 ms':>11}{'p99 ms':>11}{'peak KiB':>11}")
+    for name, (fn, items, options) in benchmarks.items():
+        result = results[name] = measure(fn, items, **options)
+        print(f"{name:<28}{result['runs']:>7}{result['throughput_per_s']:>14,.0f}{result['p50_ms']:>11.3f}"
+              f"{result['p99_ms']:>11.3f}{result['peak_kb']:>11.1f}")
+    print(f"Process max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+    env = environment(args.model)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(dict(env, timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'), results=results), f, indent=2)
+            f.write('\n')
+
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        differences = [f"{key} {baseline.get(key)!r} here {value!r}" for key, value in env.items()
+                       if baseline.get(key) != value]
+        if differences:
+            print(f"Warning: {args.check} was recorded with {'; '.join(differences)}. "
+                  f"Re-record it on this machine with --save for a meaningful check.")
+        if args.only:
+            baseline['results'] = {name: r for name, r in baseline['results'].items() if name in args.only}
+        regressions = check_regressions(results, baseline, args.tolerance, args.p99_tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.check}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions against {args.check} (median and memory {args.tolerance:.0%}, "
+              f"p99 {args.p99_tolerance:.0%}).")
+
+if __name__ == '__main__':
+    main()
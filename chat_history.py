@@ -0,0 +1,113 @@
+import re
+from collections import deque
+
+# Bounded, token-budgeted conversation history for the expert chat.
+#
+# Messages are kept in a deque of at most max_messages for display. The model
+# sees the most recent turns verbatim, newest first until token_budget is
+# spent, and everything older as a running summary. The summary is built
+# incrementally: each message is compacted exactly once, when it first falls
+# out of the verbatim window (or out of the deque), and the result is cached on
+# the history, so a long session costs the same per question as a short one.
+# Compaction is extractive (the opening sentence of each message), so it needs
+# no extra model call. Token counts are estimated at four characters per token.
+
+CHARS_PER_TOKEN = 4
+SUMMARY_SENTENCE_CHARS = 160
+
+def estimate_tokens(text):
+    return max(1, -(-len(text) // CHARS_PER_TOKEN))
+
+# First sentence of a message, shortened to fit one summary line
+def _first_sentence(text):
+    text = ' '.join(text.split())
+    match = re.match(r'(.+?[.!?])(\s|$)', text)
+    sentence = match.group(1) if match else text
+    if len(sentence) > SUMMARY_SENTENCE_CHARS:
+        sentence = sentence[:SUMMARY_SENTENCE_CHARS - 1].rstrip() + '…'
+    return sentence
+
+def summarize_message(message):
+    speaker = 'User asked' if message['role'] == 'user' else 'Advisor said'
+    return f"{speaker}: {_first_sentence(message['content'])}"
+
+class ChatHistory:
+    def __init__(self, greeting=None, token_budget=1500, summary_budget=300, max_messages=200):
+        self.greeting = greeting
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.messages = deque(maxlen=max_messages)
+        self.total = 0
+        self._summary_lines = deque()
+        self._summary_tokens = 0
+        self._summarized = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    # Absolute index of the oldest message still held
+    @property
+    def first_index(self):
+        return self.total - len(self.messages)
+
+    @property
+    def summary(self):
+        return '\n'.join(self._summary_lines)
+
+    def append(self, role, content):
+        if len(self.messages) == self.messages.maxlen:
+            self._summarize_until(self.first_index + 1)
+        self.messages.append({'role': role, 'content': content, 'tokens': estimate_tokens(content)})
+        self.total += 1
+
+    # Summary and the verbatim recent messages that together fit the token budget.
+    # Once anything has to be summarized, summary_budget is reserved for it.
+    def context(self):
+        count = self._recent_count(self.token_budget)
+        if self._summary_lines or count < len(self.messages):
+            count = self._recent_count(self.token_budget - self.summary_budget)
+        # A message already folded into the summary is never repeated verbatim
+        count = min(count, self.total - self._summarized)
+        self._summarize_until(self.total - count)
+        return self.summary, list(self.messages)[len(self.messages) - count:]
+
+    # How many of the newest messages fit in budget tokens
+    def _recent_count(self, budget):
+        count = 0
+        for message in reversed(self.messages):
+            if message['tokens'] > budget:
+                break
+            budget -= message['tokens']
+            count += 1
+        return count
+
+    # Conversation context as prompt text; empty for a new conversation
+    def context_text(self):
+        summary, recent = self.context()
+        parts = []
+        if summary:
+            parts.append(f"Summary of the earlier conversation:\n{summary}")
+        if recent:
+            lines = [f"{'User' if m['role'] == 'user' else 'DiamondGenius'}: {m['content']}" for m in recent]
+            parts.append("Recent conversation:\n" + '\n'.join(lines))
+        return '\n\n'.join(parts)
+
+    # Fold messages before absolute index `until` into the running summary, each once
+    def _summarize_until(self, until):
+        for index in range(max(self._summarized, self.first_index), until):
+            line = summarize_message(self.messages[index - self.first_index])
+            self._summary_lines.append(line)
+            self._summary_tokens += estimate_tokens(line)
+        self._summarized = max(self._summarized, until)
+        # The summary itself is bounded: the oldest lines go first
+        while self._summary_tokens > self.summary_budget and len(self._summary_lines) > 1:
+            self._summary_tokens -= estimate_tokens(self._summary_lines.popleft())
+
+    # Messages for one page, page 0 being the newest; returns (messages, first absolute index)
+    def page(self, number, page_size):
+        end = len(self.messages) - number * page_size
+        start = max(0, end - page_size)
+        return [self.messages[i] for i in range(start, max(start, end))], self.first_index + start
+
+    def pages(self, page_size):
+        return max(1, -(-len(self.messages) // page_size))
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from pricing import MODEL_PATH
+from tree_engine import COMPACT_LEAVES, load_tree_ensemble
+
+# Export the model as a compact binary tree ensemble and report the tradeoff.
+#
+#   python compact_model.py --output xgb_model.trees --leaves float16 --trees 200
+#
+# The artifact is what tree_engine.save_compact writes and load_tree_ensemble
+# reads (pricing_service.py --model accepts it as well). The report prices the
+# held-out test split that train_model.py uses (the notebook's 80/20 split)
+# with the JSON model and with the export, compares MAE, R2 and the largest
+# per-stone difference, and measures file size, load time and memory of each in
+# a fresh interpreter. A tree-count sweep shows what pruning costs in accuracy.
+
+LOAD_SNIPPET = """
+import json, time
+
+def status(field):
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(field + ':'))
+
+from tree_engine import load_tree_ensemble
+rss_before = status('VmRSS')
+start = time.perf_counter()
+engine = load_tree_ensemble({path!r})
+seconds = time.perf_counter() - start
+engine.predict_row([1.0, 4, 3, 3, 61.5, 57.0, 6.4, 6.4, 4.0])
+print(json.dumps({{'load_ms': seconds * 1000, 'rss_kb': status('VmRSS') - rss_before,
+                   'peak_kb': status('VmHWM') - rss_before}}))
+"""
+
+# Median load time and memory growth over fresh interpreters (memory figures need /proc)
+def profile_load(path, runs=5):
+    code = LOAD_SNIPPET.format(path=os.path.abspath(path))
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {key: sorted(sample[key] for sample in samples)[runs // 2] for key in samples[0]}
+
+def held_out_split(data_path, seed):
+    from train_model import prepare_splits
+
+    X, y = prepare_splits(data_path, seed)['test']
+    return np.asarray(X), np.asarray(y, dtype=np.float64)
+
+def accuracy(predictions, y):
+    errors = predictions - y
+    return {'mae': float(np.mean(np.abs(errors))),
+            'r2': 1.0 - float(np.sum(errors ** 2)) / float(np.sum((y - y.mean()) ** 2))}
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a compact tree ensemble and report size, speed and accuracy.")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--output', default='xgb_model.trees')
+    parser.add_argument('--leaves', choices=COMPACT_LEAVES, default='float32', help="storage type of leaf values")
+    parser.add_argument('--trees', type=int, default=None, help="keep only the first N trees")
+    parser.add_argument('--data', default='diamonds.csv', help="source of the held-out split for the report")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-report', action='store_true', help="only write the artifact")
+    args = parser.parse_args()
+
+    engine = load_tree_ensemble(args.model)
+    kept = engine.save_compact(args.output, leaves=args.leaves, max_trees=args.trees)
+    print(f"Wrote {args.output}: {kept} of {engine.n_trees} trees, {args.leaves} leaves, "
+          f"{os.path.getsize(args.output) / 1024:.0f} KiB (JSON {os.path.getsize(args.model) / 1024:.0f} KiB)")
+    if args.no_report:
+        return
+
+    X, y = held_out_split(args.data, args.seed)
+    reference = engine.predict(X).astype(np.float64)
+    compact = load_tree_ensemble(args.output).predict(X).astype(np.float64)
+
+    print(f"\n{'artifact':<12}{'KiB':>8}{'load ms':>10}{'RSS KiB':>10}{'peak KiB':>10}{'MAE':>10}{'R2':>10}{'max diff':>10}")
+    for name, path, predictions in (('json', args.model, reference), ('compact', args.output, compact)):
+        load = profile_load(path)
+        score = accuracy(predictions, y)
+        print(f"{name:<12}{os.path.getsize(path) / 1024:>8.0f}{load['load_ms']:>10.1f}{load['rss_kb']:>10}"
+              f"{load['peak_kb']:>10}{score['mae']:>10.2f}{score['r2']:>10.5f}"
+              f"{np.abs(predictions - reference).max():>10.2f}")
+
+    # Accuracy of smaller prefixes of the ensemble, at the chosen leaf type
+    print(f"\n{'trees':>6}{'KiB':>8}{'MAE':>10}{'R2':>10}{'max diff':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for fraction in (0.25, 0.5, 0.75, 1.0):
+            path = os.path.join(tmp_dir, 'pruned.trees')
+            trees = engine.save_compact(path, leaves=args.leaves, max_trees=max(1, int(engine.n_trees * fraction)))
+            predictions = load_tree_ensemble(path).predict(X).astype(np.float64)
+            score = accuracy(predictions, y)
+            print(f"{trees:>6}{os.path.getsize(path) / 1024:>8.0f}{score['mae']:>10.2f}{score['r2']:>10.5f}"
+                  f"{np.abs(predictions - reference).max():>10.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from feature_pipeline import CATEGORY_MAPPINGS, FEATURE_COLUMNS, encode_grades
+from pricing import DATASET_PATH
+
+# Typed, columnar cache of diamonds.csv.
+#
+#   python dataset_cache.py            # build (if stale) and compare load paths
+#
+# The CSV is parsed once and every column written as a raw .npy file: the 4Cs
+# ordinally encoded as uint8 (same codes as feature_pipeline.py),
+# measurements as float32 and price as int32. load_dataset() memory-maps the
+# arrays, so loading costs a few page-table entries instead of a CSV parse,
+# and every process reading the cache shares one copy in the page cache. The
+# cache records the sha256 of its source and is rebuilt when the CSV changes.
+#
+# The cache directory holds generations, each a complete set of files built
+# in its own uniquely named subdirectory, and a CURRENT file naming the live
+# one. A rebuild publishes by replacing CURRENT with os.replace, as the model
+# registry does, so a reader sees the old or the new generation, never a
+# missing or half-written one, and concurrent builders each publish a
+# complete cache (the last one wins). Superseded generations are deleted once
+# they are STALE_SECONDS old; files a reader has already mapped stay readable
+# after deletion, and a reader that loses the race to open them re-reads the
+# pointer.
+
+CACHE_DIR = '.dataset_cache'
+CACHE_FORMAT = 1
+POINTER_FILE = 'CURRENT'
+STALE_SECONDS = 600
+ABANDONED_SECONDS = 3600
+
+CATEGORY_COLUMNS = list(CATEGORY_MAPPINGS)
+FLOAT_COLUMNS = ['carat', 'depth', 'table', 'x', 'y', 'z']
+COLUMN_DTYPES = dict([(column, 'uint8') for column in CATEGORY_COLUMNS] +
+                     [(column, 'float32') for column in FLOAT_COLUMNS] + [('price', 'int32')])
+
+class DiamondDataset:
+    def __init__(self, columns, meta):
+        self.columns = columns
+        self.meta = meta
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    # Model-ready feature matrix in FEATURE_COLUMNS order (a copy, not a view)
+    def feature_matrix(self, dtype='float32'):
+        return np.column_stack([self.columns[column].astype(dtype, copy=False) for column in FEATURE_COLUMNS])
+
+    # pandas view of the data; decode=True maps the 4Cs back to their grade names
+    def to_frame(self, decode=False):
+        import pandas as pd
+
+        df = pd.DataFrame({column: self.columns[column] for column in self.meta['columns']}, copy=False)
+        if decode:
+            for column, mapping in CATEGORY_MAPPINGS.items():
+                grades = np.array(sorted(mapping, key=mapping.get), dtype=object)
+                df[column] = grades[df[column].to_numpy()]
+        return df
+
+def source_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Directory of the live generation under root, or None before the first build
+def current_generation(root):
+    try:
+        with open(os.path.join(root, POINTER_FILE)) as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    return os.path.join(root, name) if name else None
+
+# Build a new generation under root: write(directory) fills a fresh, uniquely
+# named build directory, which is renamed into a generation and made live
+def publish_generation(root, write):
+    os.makedirs(root, exist_ok=True)
+    build_dir = tempfile.mkdtemp(prefix='build-', dir=root)
+    try:
+        write(build_dir)
+        directory = os.path.join(root, f'gen-{time.time_ns()}-{os.path.basename(build_dir)[6:]}')
+        os.rename(build_dir, directory)
+        pointer = tempfile.NamedTemporaryFile('w', dir=root, prefix=f'{POINTER_FILE}.', delete=False)
+        with pointer:
+            pointer.write(os.path.basename(directory))
+            pointer.flush()
+            os.fsync(pointer.fileno())
+        os.replace(pointer.name, os.path.join(root, POINTER_FILE))
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    _remove_stale(root, os.path.basename(directory))
+    return directory
+
+# Delete generations other than the live one once they are STALE_SECONDS old,
+# build directories a crashed builder left behind, and files of the flat
+# layout caches had before generations
+def _remove_stale(root, live):
+    now = time.time()
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith('gen-') or name.startswith('build-'):
+            max_age = STALE_SECONDS if name.startswith('gen-') else ABANDONED_SECONDS
+            try:
+                if name != live and os.path.getmtime(path) < now - max_age:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+        elif name == 'meta.json' or name.endswith('.npy'):
+            os.remove(path)
+
+def _read_meta(cache_dir):
+    if cache_dir is None:
+        return None
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# Parse the CSV once and write one typed .npy file per column as a new generation
+def build_dataset_cache(path=DATASET_PATH, cache_dir=CACHE_DIR, sha256=None):
+    import pandas as pd
+
+    df = pd.read_csv(path, index_col=0)
+    missing = [column for column in COLUMN_DTYPES if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    meta = {'format': CACHE_FORMAT, 'source': os.path.abspath(path), 'sha256': sha256 or source_sha256(path),
+            'rows': len(df), 'columns': list(COLUMN_DTYPES), 'dtypes': COLUMN_DTYPES}
+
+    def write(directory):
+        for column, dtype in COLUMN_DTYPES.items():
+            values = encode_grades(column, df[column]) if column in CATEGORY_MAPPINGS else df[column].to_numpy()
+            np.save(os.path.join(directory, f'{column}.npy'), values.astype(dtype))
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    return publish_generation(cache_dir, write), meta
+
+# Memory-map the cached columns, (re)building the cache first if it is missing or stale
+def load_dataset(path=DATASET_PATH, cache_dir=CACHE_DIR, attempts=3):
+    sha256 = source_sha256(path)
+    for attempt in range(attempts):
+        generation = current_generation(cache_dir)
+        meta = _read_meta(generation)
+        if meta is None or meta.get('format') != CACHE_FORMAT or meta.get('sha256') != sha256:
+            generation, meta = build_dataset_cache(path, cache_dir, sha256)
+        try:
+            columns = {column: np.load(os.path.join(generation, f'{column}.npy'), mmap_mode='r')
+                       for column in meta['columns']}
+        except FileNotFoundError:
+            # The generation was superseded and deleted after we read the pointer
+            if attempt == attempts - 1:
+                raise
+            continue
+        return DiamondDataset(columns, meta)
+
+# Peak RSS comes from VmHWM: ru_maxrss survives exec, so it would include the parent's peak
+LOAD_SNIPPET = """
+import resource, time
+start = time.perf_counter()
+{load}
+seconds = time.perf_counter() - start
+try:
+    with open('/proc/self/status') as f:
+        peak_kb = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+except OSError:
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(seconds, peak_kb)
+"""
+
+CSV_LOAD = """
+import pandas as pd
+from feature_pipeline import encode_features
+df = pd.read_csv({path!r}, index_col=0)
+X = encode_features(df, errors='mask')[0].to_numpy()
+"""
+
+CACHE_LOAD = """
+from dataset_cache import load_dataset
+X = load_dataset({path!r}, {cache_dir!r}).feature_matrix()
+"""
+
+# Load time and peak RSS of a fresh interpreter that loads the features one way
+def _profile_load(load):
+    code = LOAD_SNIPPET.format(load=load.strip())
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+    return float(output[0]), int(output[1]) / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the columnar diamonds cache and compare load paths.")
+    parser.add_argument('--data', default=DATASET_PATH)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--rebuild', action='store_true', help="rebuild even if the cache is current")
+    args = parser.parse_args()
+
+    data, cache_dir = os.path.abspath(args.data), os.path.abspath(args.cache_dir)
+    if args.rebuild:
+        build_dataset_cache(data, cache_dir)
+    dataset = load_dataset(data, cache_dir)
+    print(f"{len(dataset):,} rows cached in {args.cache_dir} (source sha256 {dataset.meta['sha256'][:12]})")
+
+    print(f"{'load path':<14}{'seconds':>10}{'peak RSS MiB':>14}")
+    for name, load in (('csv', CSV_LOAD), ('mmap cache', CACHE_LOAD)):
+        seconds, rss = _profile_load(load.format(path=data, cache_dir=cache_dir))
+        print(f"{name:<14}{seconds:>10.3f}{rss:>14.1f}")
+
+if __name__ == '__main__':
+    main()
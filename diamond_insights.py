@@ -0,0 +1,51 @@
+# Plain-language commentary on a diamond's 4Cs, shown under the valuation.
+# Kept free of Streamlit so it can be reused and benchmarked from scripts.
+
+# What each grade means, also indexed for the expert chat (knowledge_index.py)
+CUT_INSIGHTS = {
+    "Fair": "A fair cut reflects less light, resulting in less brilliance. While economical, this cut doesn't showcase a diamond's potential sparkle.",
+    "Good": "Good cuts offer decent brilliance at a reasonable price point, making them suitable for budget-conscious buyers who still want quality.",
+    "Very Good": "Very Good cuts provide excellent brilliance and fire. They're an excellent value, offering nearly the same visual appeal as Ideal cuts at a lower price.",
+    "Premium": "Premium cuts display exceptional brilliance and fire. They're precision-cut to maximize light reflection, though sometimes with slightly deeper proportions.",
+    "Ideal": "Ideal cuts represent the pinnacle of diamond cutting, with perfect proportions to maximize brilliance and fire. They reflect nearly all light that enters the diamond."
+}
+
+COLOR_INSIGHTS = {
+    "D": "Completely colorless and extremely rare. The highest color grade available.",
+    "E": "Colorless, but slightly less rare than D. Differences are not visible to the untrained eye.",
+    "F": "Colorless, but detectable by gemologists. Still considered colorless to the naked eye.",
+    "G": "Near-colorless with slight traces of color, visible only to expert gemologists.",
+    "H": "Near-colorless with minimal color visible under magnification.",
+    "I": "Near-colorless with slight warmth that may be visible in larger diamonds.",
+    "J": "Near-colorless with noticeable warmth that provides good value."
+}
+
+CLARITY_INSIGHTS = {
+    "IF": "Internally Flawless: No internal inclusions visible under 10x magnification.",
+    "VVS1": "Very, Very Slightly Included 1: Contains minute inclusions difficult for expert gemologists to see.",
+    "VVS2": "Very, Very Slightly Included 2: Contains minute inclusions slightly easier to see than VVS1.",
+    "VS1": "Very Slightly Included 1: Contains minor inclusions difficult to see under 10x magnification.",
+    "VS2": "Very Slightly Included 2: Contains minor inclusions visible under 10x magnification.",
+    "SI1": "Slightly Included 1: Contains noticeable inclusions under 10x magnification but often not visible to naked eye.",
+    "SI2": "Slightly Included 2: Contains noticeable inclusions under 10x magnification, sometimes visible to the naked eye.",
+    "I1": "Included 1: Contains inclusions visible to the naked eye that may affect brilliance."
+}
+
+# Function to generate diamond insights based on characteristics
+def generate_diamond_insights(carat, cut, color, clarity):
+    carat_insight = f"At {carat} carats, this diamond has significant presence. "
+    if carat < 0.5:
+        carat_insight = f"At {carat} carats, this diamond is delicate and subtle. "
+    elif carat < 1.0:
+        carat_insight = f"At {carat} carats, this diamond has a good balance of presence and value. "
+    elif carat < 2.0:
+        carat_insight = f"At {carat} carats, this diamond makes a substantial statement. "
+    else:
+        carat_insight = f"At {carat} carats, this diamond has exceptional presence and rarity. "
+    
+    return {
+        "cut": CUT_INSIGHTS.get(cut, ""),
+        "color": COLOR_INSIGHTS.get(color, ""),
+        "clarity": CLARITY_INSIGHTS.get(clarity, ""),
+        "carat": carat_insight
+    }
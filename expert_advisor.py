@@ -0,0 +1,156 @@
+import time
+
+from knowledge_index import grounding_text
+from metrics import counter
+
+# Expert-advice prompting for the DiamondGenius chat.
+#
+# Kept free of Streamlit so it can be driven by the real Gemini model or by
+# fake_gemini.FakeGenerativeModel. Given a knowledge_index.KnowledgeIndex,
+# questions the app's own content covers are answered from it without a model
+# call, and partial matches are passed to the model as reference material.
+
+# Answers replaced by FALLBACK_MESSAGE because the model call failed
+fallbacks = {mode: counter('expert_fallbacks_total', "Expert answers that fell back to the error message",
+                           {'mode': mode}) for mode in ('ask', 'stream')}
+# Questions by knowledge index route: answered locally, grounded, or model only
+routes = {mode: counter('expert_retrieval_total', "Expert questions by knowledge index route", {'route': mode})
+          for mode in ('local', 'grounded', 'model')}
+
+# System prompt that guides Gemini to act as a diamond expert
+SYSTEM_PROMPT = """
+        You are DiamondGenius, an expert AI advisor specializing in diamonds. Provide accurate, helpful information about:
+        - Diamond quality factors (4Cs: Cut, Color, Clarity, Carat)
+        - Pricing considerations and market trends
+        - Diamond investment advice
+        - Ethical considerations and lab-grown diamonds
+        - Diamond maintenance and care
+        - Diamond price estimation
+        - Diamond shopping tips
+
+        Keep responses concise (under 250 words) yet informative. Use formal but accessible language.
+        Always provide balanced information, considering both traditional and modern perspectives on diamonds.
+        """
+
+# Safety context for the model
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    }
+]
+
+GENERATION_CONFIG = {"temperature": 0.2, "max_output_tokens": 500}
+
+FALLBACK_MESSAGE = "I apologize, but I'm having trouble connecting to my knowledge base at the moment. Please try again in a few moments. (Error: {error})"
+
+# Combine the system prompt, any reference material, conversation context and the user's query
+def build_prompt(prompt, context='', reference=''):
+    parts = [SYSTEM_PROMPT, reference, context, f"User question: {prompt}"]
+    return '\n\n'.join(part for part in parts if part)
+
+# Answers are cached per conversation context and reference material; a first
+# question has no context and shares the cache with every other session
+def _cache_context(context, reference=''):
+    return SYSTEM_PROMPT + reference + context
+
+# Route a question through the knowledge index. Returns the route and the
+# reference text for the prompt; with local_answers off, a question the index
+# covers is grounded instead of answered locally.
+def _retrieve(knowledge, prompt, local_answers=True):
+    if knowledge is None:
+        return None, ''
+    route = knowledge.route(prompt) if local_answers else knowledge.route(prompt, local_coverage=float('inf'))
+    routes[route['mode']].inc()
+    return route, grounding_text(route['passages']) if route['mode'] == 'grounded' else ''
+
+# Answer a question with the given model, consulting the response cache first.
+# context is earlier conversation (see chat_history). Fallback apologies are
+# returned but never cached.
+def ask_expert(model, prompt, cache=None, context='', knowledge=None, local_answers=True):
+    route, reference = _retrieve(knowledge, prompt, local_answers)
+    if route is not None and route['mode'] == 'local':
+        return route['answer']
+    model_name = getattr(model, 'model_name', '')
+    if cache is not None:
+        cached = cache.get(prompt, _cache_context(context, reference), model_name, GENERATION_CONFIG)
+        if cached is not None:
+            return cached
+
+    try:
+        response = model.generate_content(build_prompt(prompt, context, reference),
+                                          generation_config=GENERATION_CONFIG)
+        text = response.text
+    except Exception as e:
+        # Fallback response in case of API errors
+        fallbacks['ask'].inc()
+        return FALLBACK_MESSAGE.format(error=str(e))
+
+    if cache is not None:
+        cache.put(prompt, text, _cache_context(context, reference), model_name, GENERATION_CONFIG)
+    return text
+
+# Text of a streamed chunk; chunks without text parts (e.g. the final one) yield ''
+def _chunk_text(chunk):
+    try:
+        return chunk.text
+    except ValueError:
+        return ''
+
+# Stream an answer chunk by chunk. timings, if given, receives 'first_token'
+# and 'total' (seconds since the call) so time-to-first-token can be reported,
+# and 'route' when a knowledge index is given. Local answers and cache hits
+# arrive as a single chunk; complete answers are written back to the cache.
+def stream_expert(model, prompt, cache=None, timings=None, context='', knowledge=None, local_answers=True):
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    route, reference = _retrieve(knowledge, prompt, local_answers)
+    if route is not None:
+        timings['route'] = route['mode']
+        if route['mode'] == 'local':
+            timings['first_token'] = timings['total'] = time.perf_counter() - start
+            yield route['answer']
+            return
+    model_name = getattr(model, 'model_name', '')
+    if cache is not None:
+        cached = cache.get(prompt, _cache_context(context, reference), model_name, GENERATION_CONFIG)
+        if cached is not None:
+            timings['first_token'] = timings['total'] = time.perf_counter() - start
+            yield cached
+            return
+
+    chunks = []
+    try:
+        stream = model.generate_content(build_prompt(prompt, context, reference),
+                                        generation_config=GENERATION_CONFIG, stream=True)
+        for chunk in stream:
+            text = _chunk_text(chunk)
+            if not text:
+                continue
+            if not chunks:
+                timings['first_token'] = time.perf_counter() - start
+            chunks.append(text)
+            yield text
+    except Exception as e:
+        fallbacks['stream'].inc()
+        timings.setdefault('first_token', time.perf_counter() - start)
+        timings['total'] = time.perf_counter() - start
+        yield ("\n\n" if chunks else "") + FALLBACK_MESSAGE.format(error=str(e))
+        return
+
+    timings['total'] = time.perf_counter() - start
+    timings.setdefault('first_token', timings['total'])
+    if cache is not None and chunks:
+        cache.put(prompt, ''.join(chunks), _cache_context(context, reference), model_name, GENERATION_CONFIG)
@@ -0,0 +1,88 @@
+import asyncio
+import random
+import time
+
+# A local stand-in for genai.GenerativeModel.
+#
+# It implements the part of the interface the app uses (model_name,
+# generate_content and generate_content_async, with generation_config and
+# stream) so the expert-advice paths can be exercised offline, without an API
+# key, and with a predictable latency. latency is paid before the first chunk,
+# chunk_latency before each following one. latency_jitter adds an exponential
+# tail on top of latency and failure_rate makes that share of calls raise.
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeUpstreamError(RuntimeError):
+    pass
+
+class FakeGenerativeModel:
+    def __init__(self, model_name='fake-gemini', latency=0.0, answer=None, chunk_words=8, chunk_latency=0.0,
+                 latency_jitter=0.0, failure_rate=0.0, seed=None):
+        self.model_name = model_name
+        self.latency = latency
+        self.answer = answer
+        self.chunk_words = chunk_words
+        self.chunk_latency = chunk_latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+
+    def generate_content(self, contents, generation_config=None, safety_settings=None, stream=False):
+        self.calls += 1
+        if stream:
+            return self._stream(self._answer_for(contents))
+        time.sleep(self._first_chunk_delay())
+        self._maybe_fail()
+        return FakeResponse(self._answer_for(contents))
+
+    async def generate_content_async(self, contents, generation_config=None, safety_settings=None, stream=False):
+        self.calls += 1
+        if stream:
+            return self._astream(self._answer_for(contents))
+        await asyncio.sleep(self._first_chunk_delay())
+        self._maybe_fail()
+        return FakeResponse(self._answer_for(contents))
+
+    def _stream(self, text):
+        time.sleep(self._first_chunk_delay())
+        self._maybe_fail()
+        for i, chunk in enumerate(self._chunks(text)):
+            if i and self.chunk_latency:
+                time.sleep(self.chunk_latency)
+            yield FakeResponse(chunk)
+
+    async def _astream(self, text):
+        await asyncio.sleep(self._first_chunk_delay())
+        self._maybe_fail()
+        for i, chunk in enumerate(self._chunks(text)):
+            if i and self.chunk_latency:
+                await asyncio.sleep(self.chunk_latency)
+            yield FakeResponse(chunk)
+
+    def _chunks(self, text):
+        words = text.split(' ')
+        for i in range(0, len(words), self.chunk_words):
+            chunk = ' '.join(words[i:i + self.chunk_words])
+            yield chunk if i + self.chunk_words >= len(words) else chunk + ' '
+
+    def _first_chunk_delay(self):
+        delay = self.latency
+        if self.latency_jitter:
+            delay += self._random.expovariate(1 / self.latency_jitter)
+        return delay
+
+    def _maybe_fail(self):
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            self.failures += 1
+            raise FakeUpstreamError("injected upstream failure")
+
+    def _answer_for(self, contents):
+        if self.answer is not None:
+            return self.answer(contents) if callable(self.answer) else self.answer
+        question = contents.rsplit('User question:', 1)[-1].strip()
+        return f"DiamondGenius (offline) on: {question}"
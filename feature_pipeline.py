@@ -0,0 +1,171 @@
+import math
+
+# Feature pipeline shared by training and every serving path.
+#
+# This module is the one definition of the model's input schema: the feature
+# columns in order, the ordinal codes of the 4Cs and the valid range of each
+# measurement. Batches are encoded a column at a time. A grade column is
+# factorized once (a hash pass in C) and only its handful of distinct values
+# are looked up, through a small code array indexed by the factorized codes;
+# measurements are range-checked as whole arrays. A million rows cost no more
+# Python work than one. Single diamonds take a scalar path of plain dict
+# lookups, so the interactive tab never touches numpy for encoding.
+#
+# FEATURE_SCHEMA_VERSION is written into every trained model (the booster
+# attribute 'feature_schema') and checked whenever a model is loaded; bump it
+# when the encoding changes. Models saved before the attribute existed were
+# trained on version 1. numpy and pandas are imported by the batch functions
+# only, keeping this module cheap to import at app startup.
+
+FEATURE_SCHEMA_VERSION = 1
+SCHEMA_ATTRIBUTE = 'feature_schema'
+
+FEATURE_COLUMNS = ['carat', 'cut', 'color', 'clarity', 'depth', 'table', 'x', 'y', 'z']
+
+# Ordinal encodings for the categorical 4Cs, lowest grade first
+CUT_MAPPING = {'Fair': 0, 'Good': 1, 'Very Good': 2, 'Premium': 3, 'Ideal': 4}
+COLOR_MAPPING = {'J': 0, 'I': 1, 'H': 2, 'G': 3, 'F': 4, 'E': 5, 'D': 6}
+CLARITY_MAPPING = {'I1': 0, 'SI2': 1, 'SI1': 2, 'VS2': 3, 'VS1': 4, 'VVS2': 5, 'VVS1': 6, 'IF': 7}
+
+CATEGORY_MAPPINGS = {
+    'cut': CUT_MAPPING,
+    'color': COLOR_MAPPING,
+    'clarity': CLARITY_MAPPING
+}
+
+# Valid measurements as (exclusive lower, inclusive upper) bounds. A zero
+# dimension is a recording error, which training drops; depth and table are
+# percentages.
+NUMERIC_RANGES = {
+    'carat': (0.0, math.inf),
+    'depth': (0.0, 100.0),
+    'table': (0.0, 100.0),
+    'x': (0.0, math.inf),
+    'y': (0.0, math.inf),
+    'z': (0.0, math.inf)
+}
+
+def _range_text(column):
+    low, high = NUMERIC_RANGES[column]
+    return f"{column} must be above {low:g}" + (f" and at most {high:g}" if high != math.inf else '')
+
+def _check_value(column, value):
+    value = float(value)
+    low, high = NUMERIC_RANGES[column]
+    # NaN fails both comparisons
+    if not low < value <= high:
+        raise ValueError(f"{_range_text(column)} (got {value:g})")
+    return value
+
+# Encode a single diamond into a feature row without numpy or pandas
+def encode_row(carat, cut, color, clarity, depth, table, x, y, z):
+    grades = {'cut': cut, 'color': color, 'clarity': clarity}
+    encoded = {}
+    for column, mapping in CATEGORY_MAPPINGS.items():
+        try:
+            encoded[column] = mapping[grades[column]]
+        except (KeyError, TypeError):
+            raise ValueError(f"Unknown {column} grade: {grades[column]}") from None
+    return [_check_value('carat', carat), encoded['cut'], encoded['color'], encoded['clarity'],
+            _check_value('depth', depth), _check_value('table', table),
+            _check_value('x', x), _check_value('y', y), _check_value('z', z)]
+
+# Ordinal codes (int8) of a whole column of grades; unknown or missing grades raise
+def encode_grades(column, values):
+    import numpy as np
+    import pandas as pd
+
+    mapping = CATEGORY_MAPPINGS[column]
+    if not hasattr(values, 'dtype'):
+        values = np.asarray(values, dtype=object)
+    codes, grades = pd.factorize(values)
+    # One slot per distinct grade, plus a last one that missing values (code -1) land on
+    lookup = np.array([mapping.get(grade, -1) for grade in grades] + [-1], dtype=np.int8)
+    encoded = lookup[codes]
+    if (encoded < 0).any():
+        unknown = [str(grade) for grade, code in zip(grades, lookup) if code < 0]
+        if (codes < 0).any():
+            unknown.append('(missing)')
+        raise ValueError(f"Unknown {column} grades: {', '.join(unknown)}")
+    return encoded
+
+# Rows of a column mapping whose measurements all lie in NUMERIC_RANGES
+def valid_measurements(columns):
+    import numpy as np
+
+    valid = None
+    for column, (low, high) in NUMERIC_RANGES.items():
+        values = np.asarray(columns[column], dtype=np.float64)
+        in_range = (values > low) & (values <= high)
+        valid = in_range if valid is None else valid & in_range
+    return valid
+
+# Encode columns (a dataframe or a dict of array-likes) into a float32 feature
+# matrix in FEATURE_COLUMNS order, plus a mask of the rows whose measurements
+# are valid. Missing columns and unknown grades raise ValueError.
+def encode_columns(columns):
+    import numpy as np
+
+    missing = [column for column in FEATURE_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    X = np.empty((len(columns[FEATURE_COLUMNS[0]]), len(FEATURE_COLUMNS)), dtype=np.float32)
+    for i, column in enumerate(FEATURE_COLUMNS):
+        if column in CATEGORY_MAPPINGS:
+            X[:, i] = encode_grades(column, columns[column])
+        else:
+            try:
+                X[:, i] = np.asarray(columns[column], dtype=np.float64)
+            except (TypeError, ValueError):
+                raise ValueError(f"Non-numeric values in column {column}") from None
+    return X, valid_measurements({column: X[:, FEATURE_COLUMNS.index(column)] for column in NUMERIC_RANGES})
+
+# Why the first invalid row of an encoded batch was rejected; labels name the rows
+def describe_invalid(X, valid, labels=None):
+    import numpy as np
+
+    bad = np.flatnonzero(~valid)
+    first = int(bad[0])
+    label = labels[first] if labels is not None else first
+    reasons = [f"{_range_text(column)} (got {X[first, FEATURE_COLUMNS.index(column)]:g})"
+               for column, (low, high) in NUMERIC_RANGES.items()
+               if not low < X[first, FEATURE_COLUMNS.index(column)] <= high]
+    return f"{len(bad):,} row(s) with invalid measurements, first at row {label}: {'; '.join(reasons)}"
+
+# Encode a dataframe in the diamonds.csv schema into the model's feature frame.
+# errors='raise' rejects a frame with any invalid row; errors='mask' returns
+# (features, valid) instead, for callers that price only the valid rows.
+def encode_features(df, errors='raise'):
+    import pandas as pd
+
+    X, valid = encode_columns(df)
+    features = pd.DataFrame(X, columns=FEATURE_COLUMNS, index=df.index, copy=False)
+    if errors == 'mask':
+        return features, valid
+    if not valid.all():
+        raise ValueError(describe_invalid(X, valid, df.index))
+    return features
+
+# Encode a list of row dicts (e.g. a JSON request) into a feature matrix; any invalid row raises
+def encode_records(rows):
+    try:
+        columns = {column: [row[column] for row in rows] for column in FEATURE_COLUMNS}
+    except KeyError as e:
+        raise ValueError(f"Missing columns: {e.args[0]}") from None
+    X, valid = encode_columns(columns)
+    if not valid.all():
+        raise ValueError(describe_invalid(X, valid))
+    return X
+
+# Raise unless a model's recorded schema (None for models predating the
+# attribute) matches the encoding this module produces
+def check_schema(recorded, source='Model'):
+    version = 1 if recorded is None else int(recorded)
+    if version != FEATURE_SCHEMA_VERSION:
+        raise ValueError(f"{source} was trained on feature schema {version}, "
+                         f"but this code encodes schema {FEATURE_SCHEMA_VERSION}")
+
+# Record the schema on a trained xgboost Booster; it is saved with the model
+def stamp_schema(booster):
+    booster.set_attr(**{SCHEMA_ATTRIBUTE: str(FEATURE_SCHEMA_VERSION)})
@@ -0,0 +1,95 @@
+# Static content of the Diamond Knowledge Center tab.
+#
+# Kept out of app.py so the page script only references it, and so other
+# features (such as the expert chat) can draw on the same reference text.
+
+FOUR_CS = """
+Diamonds are evaluated based on four main characteristics, known as the 4 Cs:
+
+### 1. Carat
+Carat refers to the weight of a diamond, not its size. One carat equals 200 milligrams.
+- **Significance**: Larger diamonds are rarer and thus typically more valuable per carat.
+- **Common Sizes**: Engagement rings often feature diamonds between 0.5 and 2.0 carats.
+
+### 2. Cut
+Cut refers to how well a diamond has been shaped and faceted, affecting its brilliance and sparkle.
+- **Fair**: Minimal light reflection, less sparkle
+- **Good**: Decent light reflection at a lower price point
+- **Very Good**: Excellent sparkle, nearly comparable to Ideal
+- **Premium**: Exceptional sparkle, sometimes with deeper proportions
+- **Ideal**: Maximum brilliance and fire, perfect proportions
+
+### 3. Color
+Diamond color grading assesses the absence of color, with colorless diamonds being the most valuable.
+- **D-F**: Colorless (most valuable)
+- **G-J**: Near colorless
+- **K-M**: Faint yellow
+- **N-Z**: Very light to light yellow
+
+### 4. Clarity
+Clarity measures the presence of inclusions and blemishes.
+- **FL/IF**: Flawless/Internally Flawless
+- **VVS1/VVS2**: Very, Very Slightly Included
+- **VS1/VS2**: Very Slightly Included
+- **SI1/SI2**: Slightly Included
+- **I1/I2/I3**: Included
+"""
+
+NATURAL_AND_LAB_GROWN = """
+### Natural Diamonds
+Formed over billions of years deep within the Earth under extreme pressure and heat.
+
+**Uses**:
+- Fine jewelry and engagement rings
+- Status symbols and investments
+- Industrial cutting and grinding
+
+### Lab-Grown Diamonds
+Chemically identical to natural diamonds but created in controlled laboratory environments.
+
+**Uses**:
+- Affordable alternative for jewelry
+- Ethical and environmentally conscious choice
+- Scientific and technological applications
+"""
+
+FANCY_AND_INDUSTRIAL = """
+### Fancy Color Diamonds
+Natural diamonds with distinct colors like blue, pink, or yellow.
+
+**Uses**:
+- Collector's items and luxury jewelry
+- Ultra-high-end investments
+- Museum pieces
+
+### Industrial Diamonds
+Lower quality diamonds used for their physical properties rather than appearance.
+
+**Uses**:
+- Cutting, grinding, and polishing tools
+- Thermal conductors in electronics
+- Medical equipment and scientific instruments
+"""
+
+CARE_AND_MAINTENANCE = """
+### Proper Cleaning
+- Soak diamonds in a solution of mild dish soap and warm water
+- Gently scrub with a soft toothbrush
+- Rinse thoroughly and pat dry with a lint-free cloth
+
+### Storage
+- Store separately from other jewelry to prevent scratches
+- Keep in a fabric-lined jewelry box or individual pouches
+- Avoid exposure to household chemicals that can damage settings
+
+### Professional Maintenance
+- Have professional cleaning every six months
+- Check prongs and settings annually for security
+- Insure valuable diamond pieces
+"""
+
+SECTIONS = {
+    "The 4 Cs of Diamonds": FOUR_CS,
+    "Types of Diamonds and Their Uses": NATURAL_AND_LAB_GROWN + "\n" + FANCY_AND_INDUSTRIAL,
+    "Diamond Care and Maintenance": CARE_AND_MAINTENANCE
+}
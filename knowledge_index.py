@@ -0,0 +1,216 @@
+import argparse
+import math
+import re
+import time
+from collections import Counter
+
+from diamond_insights import CLARITY_INSIGHTS, COLOR_INSIGHTS, CUT_INSIGHTS
+import knowledge_content
+
+# Retrieval over the reference text the app ships, for the expert chat.
+#
+# The passages are:
+# - each titled part of the Knowledge Center tab (knowledge_content.SECTIONS);
+# - the one-line meaning of every cut, color and clarity grade
+#   (diamond_insights).
+#
+# They are indexed with BM25. route() decides how a question is handled by
+# how much of it the best passage covers. Coverage is the idf-weighted share
+# of the question's content words found in the passage; a word the index has
+# never seen counts as much as its rarest one.
+# - 'local': covered well enough to answer from the passages alone;
+# - 'grounded': some overlap, so the top passages go to the model as
+#   reference material;
+# - 'model': the model answers unaided.
+# Pure Python; the index builds in a few milliseconds.
+
+LOCAL_COVERAGE = 0.8
+GROUNDING_COVERAGE = 0.4
+# Other passages shown in a local answer must score this close to the best one
+ANSWER_SCORE_RATIO = 0.9
+MAX_ANSWER_PASSAGES = 3
+
+STOPWORDS = frozenset("""
+a about above after all also am an and any are as at be been before being between both but by can could
+did do does doing each for from had has have having he her here hers him his how i if in into is it its
+just me more most my no nor not of on once only or other our out over own same she should so some such
+than that the their them then there these they this those through to too under until up very was we
+were what when where which while who whom why will with would you your tell explain mean means meaning
+please know want diamond
+""".split())
+
+# Crude suffix folding, so 'cleaned' finds 'Cleaning' and 'inclusions' finds 'inclusion'
+def stem(word):
+    for suffix in ('ing', 'ly', 'ed'):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+def tokenize(text):
+    words = re.findall(r"[a-z0-9]+", text.lower().replace("'", ''))
+    return [stem(word) for word in words if word not in STOPWORDS]
+
+class Passage:
+    def __init__(self, title, text, source):
+        self.title = title
+        self.text = text
+        self.source = source
+        self.terms = Counter(tokenize(title + ' ' + text))
+        self.length = sum(self.terms.values())
+
+    # Markdown for a chat answer
+    def markdown(self):
+        return f"**{self.title}**\n\n{self.text}"
+
+# Split a Knowledge Center section on its ### headings; text before the first
+# heading becomes a passage titled after the section
+def section_passages(section, text):
+    passages = []
+    for part in re.split(r'^### ', text.strip(), flags=re.M):
+        part = part.strip()
+        if not part:
+            continue
+        if text.strip().startswith('### ') or passages:
+            title, _, body = part.partition('\n')
+            title = re.sub(r'^\d+\.\s*', '', title).strip()
+        else:
+            title, body = section, part
+        passages.append(Passage(title, body.strip(), section))
+    return passages
+
+def grade_passages():
+    passages = [Passage(f"{grade} cut", text, 'Cut grades') for grade, text in CUT_INSIGHTS.items()]
+    passages += [Passage(f"{grade} color", text, 'Color grades') for grade, text in COLOR_INSIGHTS.items()]
+    passages += [Passage(f"{grade} clarity", text, 'Clarity grades') for grade, text in CLARITY_INSIGHTS.items()]
+    return passages
+
+class KnowledgeIndex:
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.average_length = sum(p.length for p in passages) / len(passages)
+        self.postings = {}
+        for i, passage in enumerate(passages):
+            for term, count in passage.terms.items():
+                self.postings.setdefault(term, []).append((i, count))
+        n = len(passages)
+        self.idf = {term: math.log((n - len(docs) + 0.5) / (len(docs) + 0.5) + 1)
+                    for term, docs in self.postings.items()}
+        self.unseen_idf = math.log((n + 0.5) / 0.5 + 1)
+
+    # The k best passages as (passage, score, coverage), best first
+    def search(self, query, k=3):
+        # A stray letter the index has never seen says nothing about the topic
+        terms = {term for term in tokenize(query) if len(term) > 1 or term in self.idf}
+        if not terms:
+            return []
+        scores = Counter()
+        matched = {}
+        for term in terms:
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, count in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.passages[i].length / self.average_length)
+                scores[i] += idf * count * (self.k1 + 1) / (count + norm)
+                matched[i] = matched.get(i, 0.0) + idf
+        total = sum(self.idf.get(term, self.unseen_idf) for term in terms)
+        return [(self.passages[i], score, matched[i] / total) for i, score in scores.most_common(k)]
+
+    # How to handle a question: {'mode': 'local' | 'grounded' | 'model',
+    # 'answer': markdown for a local answer, 'passages': the passages used,
+    # 'seconds': time taken}
+    def route(self, query, local_coverage=LOCAL_COVERAGE, grounding_coverage=GROUNDING_COVERAGE, k=3):
+        start = time.perf_counter()
+        hits = self.search(query, k=max(k, MAX_ANSWER_PASSAGES))
+        route = {'mode': 'model', 'answer': None, 'passages': []}
+        if hits and hits[0][2] >= local_coverage:
+            best = hits[0][1]
+            passages = [passage for passage, score, _ in hits[:MAX_ANSWER_PASSAGES]
+                        if score >= best * ANSWER_SCORE_RATIO]
+            route = {'mode': 'local', 'passages': passages,
+                     'answer': '\n\n'.join(passage.markdown() for passage in passages)}
+        elif hits and hits[0][2] >= grounding_coverage:
+            route = {'mode': 'grounded', 'answer': None,
+                     'passages': [passage for passage, _, coverage in hits[:k] if coverage >= grounding_coverage]}
+        route['seconds'] = time.perf_counter() - start
+        return route
+
+# Reference material for the model's prompt
+def grounding_text(passages):
+    parts = [f"[{passage.source}: {passage.title}]\n{passage.text}" for passage in passages]
+    return "Reference material from the DiamondGenius knowledge base (use it where relevant):\n\n" + \
+        '\n\n'.join(parts)
+
+# Everything the app ships: the Knowledge Center tab and the grade descriptions
+def build_knowledge_index():
+    passages = []
+    for section, text in knowledge_content.SECTIONS.items():
+        passages += section_passages(section, text)
+    return KnowledgeIndex(passages + grade_passages())
+
+# A mix of chat questions, some answered by the bundled content and some not
+SAMPLE_QUESTIONS = [
+    "What does VS2 clarity mean?",
+    "What is the difference between VVS1 and VVS2?",
+    "How should I clean my diamond ring?",
+    "How do I store diamond jewelry?",
+    "What is an Ideal cut?",
+    "Is G color near colorless?",
+    "What is a carat?",
+    "What are lab-grown diamonds?",
+    "What are fancy color diamonds?",
+    "What are industrial diamonds used for?",
+    "How often should I get my ring professionally cleaned?",
+    "Is SI1 clarity visible to the naked eye?",
+    "Should I buy a 1.5 carat G VS2 or a 1.2 carat F VS1 for my budget?",
+    "Are diamond prices going up this year?",
+    "Is a diamond a good investment compared to gold?",
+    "How do I negotiate with a jeweler?",
+    "What is the resale value of a diamond engagement ring?",
+    "Which ring setting protects the stone best?",
+    "How does fluorescence affect price?",
+    "What certificate should a diamond come with?"
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="Report how chat questions would be routed by the knowledge index.")
+    parser.add_argument('--questions', help="text file with one question per line (default: built-in sample)")
+    parser.add_argument('--llm-seconds', type=float, default=2.0,
+                        help="typical time for a model answer, to estimate the time local answers save")
+    parser.add_argument('--local-coverage', type=float, default=LOCAL_COVERAGE)
+    parser.add_argument('--verbose', action='store_true', help="show the route of every question")
+    args = parser.parse_args()
+
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        questions = SAMPLE_QUESTIONS
+
+    start = time.perf_counter()
+    index = build_knowledge_index()
+    build_seconds = time.perf_counter() - start
+    routes = [index.route(question, local_coverage=args.local_coverage) for question in questions]
+    if args.verbose:
+        for question, route in zip(questions, routes):
+            titles = ', '.join(passage.title for passage in route['passages'])
+            print(f"{route['mode']:<9}{question}  ->  {titles}")
+        print()
+
+    counts = Counter(route['mode'] for route in routes)
+    local = counts['local']
+    seconds = sorted(route['seconds'] for route in routes)
+    print(f"Index:     {len(index.passages)} passages, {len(index.postings)} terms, built in "
+          f"{build_seconds * 1000:.1f} ms")
+    print(f"Questions: {len(questions)}: {local} answered locally ({local / len(questions):.0%}), "
+          f"{counts['grounded']} grounded, {counts['model']} to the model unaided")
+    print(f"Routing:   p50 {seconds[len(seconds) // 2] * 1000:.2f} ms, max {seconds[-1] * 1000:.2f} ms per question")
+    print(f"Saved:     about {local * args.llm_seconds:.0f} s of model time at {args.llm_seconds:.1f} s per answer "
+          f"({local * args.llm_seconds / len(questions):.2f} s per question on average)")
+
+if __name__ == '__main__':
+    main()
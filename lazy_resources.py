@@ -0,0 +1,49 @@
+import threading
+import time
+
+# Deferred, thread-safe construction of expensive resources.
+#
+# A LazyResource builds its value the first time get() is called, from
+# whichever thread gets there first; concurrent callers wait for that single
+# build. start_warmup() builds a set of resources on a background thread so the
+# first user action usually finds them ready without having delayed first paint.
+
+class LazyResource:
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.load_seconds = None
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                start = time.perf_counter()
+                self._value = self.factory()
+                self.load_seconds = time.perf_counter() - start
+                self._loaded = True
+        return self._value
+
+# Build the given resources in order on a daemon thread; failures are left for
+# the first real get() to raise in the request that needs the resource
+def start_warmup(resources, delay=0.0):
+    def warm():
+        if delay:
+            time.sleep(delay)
+        for resource in resources:
+            try:
+                resource.get()
+            except Exception:
+                pass
+
+    thread = threading.Thread(target=warm, name='resource-warmup', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+# Asyncio client layer around the Gemini model.
+#
+# Every call gets a deadline, waits for one of max_concurrency slots and (when
+# rate_limit is set) a token from a token bucket, and is retried with
+# full-jitter exponential backoff while the deadline allows. With hedge_after
+# set, a second identical request is fired if the first has not answered in
+# that many seconds and whichever finishes first wins. Time spent waiting for a
+# slot or token (queue) is measured separately from time spent upstream.
+#
+# All calls run on one background event loop, so the synchronous
+# generate_content() facade can be used from Streamlit script threads as a
+# drop-in for genai.GenerativeModel while sharing the same limits.
+
+_END = object()
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+# Counters and rolling timing windows, readable from any thread
+class ClientMetrics:
+    COUNTERS = ('requests', 'successes', 'failures', 'timeouts', 'retries', 'hedges', 'hedge_wins')
+    TIMINGS = ('queue', 'upstream', 'total')
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.timings = {name: deque(maxlen=window) for name in self.TIMINGS}
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self.timings[name].append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = dict(self.counters)
+            for name, values in self.timings.items():
+                snapshot[f'{name}_p50_ms'] = _percentile(values, 50) * 1000
+                snapshot[f'{name}_p99_ms'] = _percentile(values, 99) * 1000
+        return snapshot
+
+class AsyncLLMClient:
+    def __init__(self, model, max_concurrency=8, rate_limit=None, burst=None, timeout=30.0, retries=2,
+                 backoff=0.5, max_backoff=8.0, hedge_after=None):
+        self.model = model
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.metrics = ClientMetrics()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._bucket = TokenBucket(rate_limit, burst) if rate_limit else None
+        self._loop = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def model_name(self):
+        return getattr(self.model, 'model_name', '')
+
+    # Generate a complete response within timeout seconds (default self.timeout)
+    async def generate(self, contents, timeout=None, **kwargs):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + (timeout or self.timeout)
+        self.metrics.count('requests')
+        try:
+            response = await self._with_retries(lambda: self._hedged(contents, deadline, kwargs), deadline)
+        except TimeoutError:
+            self.metrics.count('timeouts')
+            raise
+        except Exception:
+            self.metrics.count('failures')
+            raise
+        self.metrics.count('successes')
+        self.metrics.observe('total', loop.time() - start)
+        return response
+
+    # Async generator over response chunks; retries only happen before the first chunk
+    async def stream(self, contents, timeout=None, **kwargs):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + (timeout or self.timeout)
+        chunks = asyncio.Queue()
+        emitted = False
+
+        async def consume(response):
+            nonlocal emitted
+            async for chunk in _aiter_chunks(response):
+                emitted = True
+                await chunks.put(chunk)
+
+        async def attempt():
+            return await self._call(contents, deadline, dict(kwargs, stream=True), consume)
+
+        async def run():
+            try:
+                await self._with_retries(attempt, deadline, retryable=lambda: not emitted)
+                await chunks.put(_END)
+            except Exception as e:
+                await chunks.put(e)
+
+        self.metrics.count('requests')
+        producer = asyncio.create_task(run())
+        try:
+            while True:
+                item = await chunks.get()
+                if item is _END:
+                    break
+                if isinstance(item, BaseException):
+                    self.metrics.count('timeouts' if isinstance(item, TimeoutError) else 'failures')
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
+        self.metrics.count('successes')
+        self.metrics.observe('total', loop.time() - start)
+
+    async def _with_retries(self, attempt_fn, deadline, retryable=None):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            try:
+                return await attempt_fn()
+            except TimeoutError:
+                raise
+            except Exception:
+                if attempt == self.retries or (retryable is not None and not retryable()):
+                    raise
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                if loop.time() + delay >= deadline:
+                    raise
+                self.metrics.count('retries')
+                await asyncio.sleep(delay)
+
+    async def _hedged(self, contents, deadline, kwargs):
+        if not self.hedge_after:
+            return await self._call(contents, deadline, kwargs)
+
+        # The hedge timer starts once the primary is upstream, not while it queues
+        started = asyncio.Event()
+        primary = asyncio.create_task(self._call(contents, deadline, kwargs, started=started))
+        waiter = asyncio.create_task(started.wait())
+        await asyncio.wait({primary, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        self.metrics.count('hedges')
+        hedge = asyncio.create_task(self._call(contents, deadline, kwargs))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.metrics.count('hedge_wins')
+                        return task.result()
+            # Both failed; surface the primary's error
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    # One upstream attempt: wait for a slot and a token, then call the model.
+    # consume, if given, processes the response while the slot is still held.
+    async def _call(self, contents, deadline, kwargs, consume=None, started=None):
+        loop = asyncio.get_running_loop()
+        queued = loop.time()
+        await _wait_until(self._semaphore.acquire(), deadline)
+        try:
+            if self._bucket is not None:
+                await _wait_until(self._bucket.acquire(), deadline)
+            upstream = loop.time()
+            self.metrics.observe('queue', upstream - queued)
+            if started is not None:
+                started.set()
+            try:
+                response = await _wait_until(self._invoke(contents, kwargs), deadline)
+                if consume is not None:
+                    await _wait_until(consume(response), deadline)
+                return response
+            finally:
+                self.metrics.observe('upstream', loop.time() - upstream)
+        finally:
+            self._semaphore.release()
+
+    async def _invoke(self, contents, kwargs):
+        if hasattr(self.model, 'generate_content_async'):
+            return await self.model.generate_content_async(contents, **kwargs)
+        return await asyncio.to_thread(self.model.generate_content, contents, **kwargs)
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='llm-client', daemon=True).start()
+        return self._loop
+
+    # Synchronous drop-in for genai.GenerativeModel.generate_content, safe from any thread
+    def generate_content(self, contents, stream=False, **kwargs):
+        if stream:
+            return self._stream_sync(contents, kwargs)
+        future = asyncio.run_coroutine_threadsafe(self.generate(contents, **kwargs), self._ensure_loop())
+        return future.result()
+
+    def _stream_sync(self, contents, kwargs):
+        chunks = queue.Queue()
+
+        async def pump():
+            try:
+                async for chunk in self.stream(contents, **kwargs):
+                    chunks.put(chunk)
+                chunks.put(_END)
+            except Exception as e:
+                chunks.put(e)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._ensure_loop())
+        try:
+            while True:
+                item = chunks.get()
+                if item is _END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def stats(self):
+        return self.metrics.snapshot()
+
+async def _wait_until(awaitable, deadline):
+    remaining = deadline - asyncio.get_running_loop().time()
+    if remaining <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise TimeoutError("LLM request deadline exceeded")
+    try:
+        return await asyncio.wait_for(awaitable, remaining)
+    except asyncio.TimeoutError:
+        raise TimeoutError("LLM request deadline exceeded") from None
+
+# Iterate a streamed response whether the model returned an async or a sync iterable
+async def _aiter_chunks(response):
+    if hasattr(response, '__aiter__'):
+        async for chunk in response:
+            yield chunk
+        return
+    iterator = iter(response)
+    while True:
+        chunk = await asyncio.to_thread(next, iterator, _END)
+        if chunk is _END:
+            return
+        yield chunk
+
+# Drive the client against the local fake model with injected latency and failures
+async def _exercise(client, requests):
+    async def one(i):
+        try:
+            await client.generate(f"User question: test {i}")
+            return True
+        except Exception:
+            return False
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(requests)))
+    return sum(results), time.perf_counter() - start
+
+def main():
+    from fake_gemini import FakeGenerativeModel
+
+    parser = argparse.ArgumentParser(description="Exercise the LLM client against a fake upstream.")
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rate-limit', type=float, default=None, help="requests per second")
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--retries', type=int, default=2)
+    parser.add_argument('--hedge-after', type=float, default=None, help="seconds before hedging")
+    parser.add_argument('--latency', type=float, default=0.2, help="fake upstream base latency")
+    parser.add_argument('--jitter', type=float, default=0.1, help="mean of the fake's exponential latency tail")
+    parser.add_argument('--failure-rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    model = FakeGenerativeModel(latency=args.latency, latency_jitter=args.jitter,
+                                failure_rate=args.failure_rate, seed=args.seed)
+    client = AsyncLLMClient(model, max_concurrency=args.concurrency, rate_limit=args.rate_limit,
+                            timeout=args.timeout, retries=args.retries, hedge_after=args.hedge_after)
+    ok, elapsed = asyncio.run(_exercise(client, args.requests))
+
+    print(f"{ok}/{args.requests} succeeded in {elapsed:.2f}s ({model.calls} upstream calls, {model.failures} injected failures)")
+    for name, value in client.stats().items():
+        print(f"  {name:>16}: {value:.1f}" if isinstance(value, float) else f"  {name:>16}: {value}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from bisect import bisect_right
+
+import numpy as np
+
+from dataset_cache import DATASET_PATH, current_generation, load_dataset, publish_generation
+from feature_pipeline import CLARITY_MAPPING, COLOR_MAPPING, CUT_MAPPING
+
+# Market statistics of the reference data by cut × color × clarity × carat bucket.
+#
+#   python market_cube.py            # build or update the cube and time lookups
+#
+# Every stone falls into one cell of the cube. The cube keeps each cell's
+# prices and prices per carat, sorted, as contiguous runs of two flat arrays
+# (an offsets array marks where each cell starts). From them it precomputes
+# every cell's percentiles 0-100 of both. Looking up a stone's cell is index
+# arithmetic, and ranking a price searches that cell's 101 percentiles, so a
+# lookup costs the same however much data the cube holds.
+#
+# The cube is stored as .npy files next to the dataset cache and memory-mapped
+# on load. It records how many rows of the dataset it covers and a hash of
+# them. When the dataset grows by appended rows, only the cells those rows
+# fall into are merged and recomputed. Any other change rebuilds the cube.
+# Like the dataset cache, every build or update is written as a new
+# generation and published by atomically replacing a CURRENT pointer, so
+# readers and concurrent builders never see a partial cube.
+
+CUBE_DIR = '.market_cube'
+CUBE_FORMAT = 1
+# Bucket i holds carats in [CARAT_EDGES[i - 1], CARAT_EDGES[i]); the first and last are open-ended
+CARAT_EDGES = (0.3, 0.4, 0.5, 0.7, 0.9, 1.0, 1.5, 2.0, 3.0)
+PERCENTILES = np.linspace(0, 100, 101)
+# Cells with fewer stones are reported but not used to rank a price
+MIN_STONES = 5
+
+SHAPE = (len(CUT_MAPPING), len(COLOR_MAPPING), len(CLARITY_MAPPING), len(CARAT_EDGES) + 1)
+CELLS = int(np.prod(SHAPE))
+FINGERPRINT_COLUMNS = ('cut', 'color', 'clarity', 'carat', 'price')
+
+def carat_bucket_label(bucket):
+    if bucket == 0:
+        return f"under {CARAT_EDGES[0]:g} ct"
+    if bucket == len(CARAT_EDGES):
+        return f"{CARAT_EDGES[-1]:g} ct and over"
+    return f"{CARAT_EDGES[bucket - 1]:g}–{CARAT_EDGES[bucket]:g} ct"
+
+# Flat cell index of every row of the dataset (from row `start` on)
+def cell_codes(dataset, start=0):
+    cut, color, clarity = (np.asarray(dataset[column][start:], dtype=np.int64)
+                           for column in ('cut', 'color', 'clarity'))
+    bucket = np.searchsorted(CARAT_EDGES, np.asarray(dataset['carat'][start:], dtype='float64'), side='right')
+    return ((cut * SHAPE[1] + color) * SHAPE[2] + clarity) * SHAPE[3] + bucket
+
+def fingerprint(dataset, rows):
+    digest = hashlib.sha256()
+    for column in FINGERPRINT_COLUMNS:
+        digest.update(np.ascontiguousarray(dataset[column][:rows]).tobytes())
+    return digest.hexdigest()
+
+# Sort values by cell, then value; returns (offsets, sorted values)
+def _group(cells, values):
+    order = np.lexsort((values, cells))
+    counts = np.bincount(cells, minlength=CELLS)
+    return np.concatenate(([0], np.cumsum(counts))).astype(np.int64), values[order]
+
+# Insert new (cell, value) pairs into sorted runs without re-sorting the old ones
+def _merge(offsets, values, cells, new_values):
+    order = np.lexsort((new_values, cells))
+    cells, new_values = cells[order], new_values[order]
+    positions = np.empty(len(cells), dtype=np.int64)
+    touched, first = np.unique(cells, return_index=True)
+    bounds = list(first) + [len(cells)]
+    for cell, lo, hi in zip(touched, bounds[:-1], bounds[1:]):
+        start, end = offsets[cell], offsets[cell + 1]
+        positions[lo:hi] = start + np.searchsorted(values[start:end], new_values[lo:hi], side='right')
+    counts = np.diff(offsets) + np.bincount(cells, minlength=CELLS)
+    return np.concatenate(([0], np.cumsum(counts))).astype(np.int64), np.insert(values, positions, new_values)
+
+# Percentiles 0-100 of the given cells' sorted runs (linear interpolation, as
+# np.percentile); empty cells get NaN
+def _percentiles(offsets, values, cells):
+    starts = offsets[cells]
+    counts = offsets[cells + 1] - starts
+    positions = starts[:, None] + PERCENTILES[None, :] / 100 * np.maximum(counts - 1, 0)[:, None]
+    lo = np.floor(positions).astype(np.int64)
+    hi = np.minimum(lo + 1, np.maximum(starts + counts - 1, 0)[:, None])
+    if not len(values):
+        return np.full((len(cells), len(PERCENTILES)), np.nan, dtype='float32')
+    low_values = values[np.minimum(lo, len(values) - 1)].astype('float64')
+    high_values = values[np.minimum(hi, len(values) - 1)].astype('float64')
+    grid = low_values + (high_values - low_values) * (positions - lo)
+    grid[counts == 0] = np.nan
+    return grid.astype('float32')
+
+class MarketCube:
+    def __init__(self, arrays, meta):
+        self.offsets = arrays['offsets']
+        self.prices = arrays['prices']
+        self.per_carat = arrays['per_carat']
+        self.price_percentiles = arrays['price_percentiles']
+        self.per_carat_percentiles = arrays['per_carat_percentiles']
+        self.meta = meta
+
+    def cell(self, cut, color, clarity, carat):
+        bucket = bisect_right(CARAT_EDGES, carat)
+        return ((CUT_MAPPING[cut] * SHAPE[1] + COLOR_MAPPING[color]) * SHAPE[2] + CLARITY_MAPPING[clarity]) \
+            * SHAPE[3] + bucket
+
+    def _cell_stats(self, cell):
+        count = int(self.offsets[cell + 1] - self.offsets[cell])
+        bucket = cell % SHAPE[3]
+        stats = {'carat_range': carat_bucket_label(bucket), 'stones': count}
+        if count:
+            prices, per_carat = self.price_percentiles[cell], self.per_carat_percentiles[cell]
+            stats.update({'median_price': float(prices[50]), 'price_p25': float(prices[25]),
+                          'price_p75': float(prices[75]), 'median_price_per_carat': float(per_carat[50])})
+        return stats
+
+    # Stones, median and quartile prices and median price per carat of a stone's cell
+    def stats(self, cut, color, clarity, carat):
+        return self._cell_stats(self.cell(cut, color, clarity, carat))
+
+    # The same cut, color and clarity in every carat bucket, smallest first
+    def carat_profile(self, cut, color, clarity):
+        first = self.cell(cut, color, clarity, 0.0)
+        return [self._cell_stats(first + bucket) for bucket in range(SHAPE[3])]
+
+    # Where a price falls among the cell's stones, as percentiles (0-100) of price
+    # and of price per carat; None when the cell has fewer than MIN_STONES stones
+    def rank(self, price, cut, color, clarity, carat):
+        cell = self.cell(cut, color, clarity, carat)
+        if self.offsets[cell + 1] - self.offsets[cell] < MIN_STONES:
+            return None
+        return {'price_percentile': _grid_rank(self.price_percentiles[cell], price),
+                'per_carat_percentile': _grid_rank(self.per_carat_percentiles[cell], price / carat)}
+
+    def memory_bytes(self):
+        return sum(array.nbytes for array in (self.offsets, self.prices, self.per_carat,
+                                              self.price_percentiles, self.per_carat_percentiles))
+
+# Percentile of value on a 0-100 percentile grid, interpolating between grid points
+def _grid_rank(grid, value):
+    if value <= grid[0]:
+        return 0.0
+    if value >= grid[-1]:
+        return 100.0
+    i = int(np.searchsorted(grid, value, side='right')) - 1
+    low, high = float(grid[i]), float(grid[i + 1])
+    return float(PERCENTILES[i] + (value - low) / (high - low) * (PERCENTILES[i + 1] - PERCENTILES[i]))
+
+def _columns(dataset, start=0):
+    price = np.asarray(dataset['price'][start:], dtype='int32')
+    per_carat = (price / np.asarray(dataset['carat'][start:], dtype='float64')).astype('float32')
+    return cell_codes(dataset, start), price, per_carat
+
+# Write the cube as a new generation of cube_dir (see dataset_cache.publish_generation)
+def _write_cube(cube_dir, arrays, meta):
+    def write(directory):
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f'{name}.npy'), array)
+        with open(os.path.join(directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+    publish_generation(cube_dir, write)
+
+def _cube_meta(dataset, rows, build):
+    return {'format': CUBE_FORMAT, 'rows': rows, 'fingerprint': fingerprint(dataset, rows),
+            'carat_edges': list(CARAT_EDGES), 'shape': list(SHAPE), 'build': build}
+
+# Aggregate the whole dataset into a new cube
+def build_market_cube(dataset, cube_dir=CUBE_DIR):
+    cells, price, per_carat = _columns(dataset)
+    offsets, prices = _group(cells, price)
+    _, per_carat = _group(cells, per_carat)
+    everything = np.arange(CELLS)
+    arrays = {'offsets': offsets, 'prices': prices, 'per_carat': per_carat,
+              'price_percentiles': _percentiles(offsets, prices, everything),
+              'per_carat_percentiles': _percentiles(offsets, per_carat, everything)}
+    meta = _cube_meta(dataset, len(dataset), 'full')
+    _write_cube(cube_dir, arrays, meta)
+    return MarketCube(arrays, meta)
+
+# Fold rows appended to the dataset since the cube was built into it; only
+# the cells they land in are recomputed
+def update_market_cube(cube, dataset, cube_dir=CUBE_DIR):
+    start = cube.meta['rows']
+    cells, price, per_carat = _columns(dataset, start)
+    offsets, prices = _merge(cube.offsets, cube.prices, cells, price)
+    _, per_carat = _merge(cube.offsets, cube.per_carat, cells, per_carat)
+    touched = np.unique(cells)
+    price_percentiles = np.array(cube.price_percentiles)
+    per_carat_percentiles = np.array(cube.per_carat_percentiles)
+    price_percentiles[touched] = _percentiles(offsets, prices, touched)
+    per_carat_percentiles[touched] = _percentiles(offsets, per_carat, touched)
+    arrays = {'offsets': offsets, 'prices': prices, 'per_carat': per_carat,
+              'price_percentiles': price_percentiles, 'per_carat_percentiles': per_carat_percentiles}
+    meta = _cube_meta(dataset, len(dataset), f'appended {len(dataset) - start} rows in {len(touched)} cells')
+    _write_cube(cube_dir, arrays, meta)
+    return MarketCube(arrays, meta)
+
+def _read_cube(cube_dir):
+    generation = current_generation(cube_dir)
+    if generation is None:
+        return None
+    try:
+        with open(os.path.join(generation, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('format') != CUBE_FORMAT or meta.get('carat_edges') != list(CARAT_EDGES) \
+                or meta.get('shape') != list(SHAPE):
+            return None
+        # Plain ndarray views of the mappings: indexing np.memmap itself is several times slower
+        arrays = {name: np.asarray(np.load(os.path.join(generation, f'{name}.npy'), mmap_mode='r'))
+                  for name in ('offsets', 'prices', 'per_carat', 'price_percentiles', 'per_carat_percentiles')}
+    except (OSError, ValueError):
+        # Superseded and deleted after we read the pointer; rebuild rather than fail
+        return None
+    return MarketCube(arrays, meta)
+
+# The cube for the dataset: memory-mapped if current, updated if rows were
+# appended since it was built, rebuilt otherwise
+def load_market_cube(path=DATASET_PATH, cube_dir=CUBE_DIR):
+    dataset = load_dataset(path)
+    cube = _read_cube(cube_dir)
+    if cube is not None and cube.meta['rows'] <= len(dataset) \
+            and cube.meta['fingerprint'] == fingerprint(dataset, cube.meta['rows']):
+        if cube.meta['rows'] == len(dataset):
+            return cube
+        return update_market_cube(cube, dataset, cube_dir)
+    return build_market_cube(dataset, cube_dir)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the market-analytics cube and time lookups.")
+    parser.add_argument('--data', default=DATASET_PATH)
+    parser.add_argument('--cube-dir', default=CUBE_DIR)
+    parser.add_argument('--rebuild', action='store_true', help="rebuild even if the cube is current")
+    parser.add_argument('--lookups', type=int, default=10000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.rebuild:
+        cube = build_market_cube(load_dataset(args.data), args.cube_dir)
+    else:
+        cube = load_market_cube(args.data, args.cube_dir)
+    seconds = time.perf_counter() - start
+    counts = np.diff(cube.offsets)
+    print(f"{cube.meta['rows']:,} stones in {int((counts > 0).sum()):,} of {CELLS:,} cells, "
+          f"{int((counts >= MIN_STONES).sum()):,} with at least {MIN_STONES} stones; "
+          f"{cube.memory_bytes() / 2 ** 20:.1f} MiB")
+    print(f"Loaded in {seconds * 1000:.0f} ms (last build: {cube.meta['build']})")
+
+    rng = np.random.default_rng(0)
+    cuts, colors, clarities = list(CUT_MAPPING), list(COLOR_MAPPING), list(CLARITY_MAPPING)
+    stones = [(float(rng.integers(300, 20000)), cuts[rng.integers(len(cuts))], colors[rng.integers(len(colors))],
+               clarities[rng.integers(len(clarities))], round(float(rng.uniform(0.2, 3.5)), 2))
+              for _ in range(args.lookups)]
+    start = time.perf_counter()
+    for stone in stones:
+        cube.stats(*stone[1:])
+        cube.rank(*stone)
+    seconds = time.perf_counter() - start
+    print(f"Stats and rank of one stone: {seconds / len(stones) * 1e6:.1f} us")
+
+if __name__ == '__main__':
+    main()
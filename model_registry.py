@@ -0,0 +1,227 @@
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+
+from pricing import MODEL_PATH
+
+# Versioned model artifacts with an atomic "current" pointer, and a holder
+# that swaps the live model without restarting the process.
+#
+#   python model_registry.py publish path/to/xgb_model.json --activate
+#   python model_registry.py list
+#   python model_registry.py activate <version>
+#
+# Artifacts live in the registry directory as xgb_model-<version>.json, the
+# version being the first 12 hex digits of the file's sha256 (the same version
+# tree_engine reports). The CURRENT file names the active version and is only
+# ever replaced with os.replace, so readers see the old or the new pointer,
+# never a torn one. Without a CURRENT file the registry falls back to the
+# legacy xgb_model.json; its version is hashed again only when the file's
+# size or modification time changes, not on every poll.
+#
+# HotSwapModel holds the loaded model for the active version. A watcher thread
+# polls the pointer; when it moves, the new version is loaded and warmed on the
+# watcher thread and then swapped in with a single assignment. Callers take
+# `current` once per request, so a prediction that started on the old version
+# finishes on it. A version that fails to load or warm is not retried on every
+# poll: it is skipped, and its error kept, until the pointer moves or its
+# artifact file changes.
+
+POINTER_FILE = 'CURRENT'
+ARTIFACT_PATTERN = re.compile(r'^xgb_model-([0-9a-f]{12})\.json$')
+
+def artifact_version(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class ModelRegistry:
+    def __init__(self, root='models', fallback=MODEL_PATH):
+        self.root = root
+        self.fallback = fallback
+        # ((st_mtime_ns, st_size), version) of the fallback file last hashed
+        self._fallback_version = None
+
+    def artifact_path(self, version):
+        return os.path.join(self.root, f'xgb_model-{version}.json')
+
+    # Published versions, oldest first
+    def versions(self):
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        found = [(os.path.getmtime(os.path.join(self.root, name)), match.group(1))
+                 for name in names for match in [ARTIFACT_PATTERN.match(name)] if match]
+        return [version for _, version in sorted(found)]
+
+    # (st_mtime_ns, st_size) of a version's artifact, None while it is missing
+    def artifact_stat(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def current_version(self):
+        try:
+            with open(os.path.join(self.root, POINTER_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    # (version, path) of the model to serve
+    def resolve(self):
+        version = self.current_version()
+        if version is not None:
+            return version, self.artifact_path(version)
+        try:
+            stat = os.stat(self.fallback) if self.fallback else None
+        except FileNotFoundError:
+            stat = None
+        if stat is None:
+            raise FileNotFoundError(f"No active model in {self.root} and no {self.fallback}")
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._fallback_version
+        if cached is None or cached[0] != key:
+            cached = self._fallback_version = (key, artifact_version(self.fallback))
+        return cached[1], self.fallback
+
+    # Copy an artifact into the registry under its content version
+    def publish(self, path, activate=False):
+        version = artifact_version(path)
+        os.makedirs(self.root, exist_ok=True)
+        target = self.artifact_path(version)
+        if not os.path.exists(target):
+            tmp_path = f'{target}.tmp{os.getpid()}'
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, target)
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version):
+        if not os.path.exists(self.artifact_path(version)):
+            raise ValueError(f"Unknown model version: {version}")
+        _write_atomic(os.path.join(self.root, POINTER_FILE), version + '\n')
+
+class HotSwapModel:
+    # loader(path) builds whatever the app serves from one artifact (a dict);
+    # warm(bundle), if given, finishes preparing it off the request path
+    def __init__(self, registry, loader, warm=None, poll_interval=5.0):
+        self.registry = registry
+        self.loader = loader
+        self.warm = warm
+        self.poll_interval = poll_interval
+        self.swaps = 0
+        self.last_error = None
+        # (version, artifact stat) of the last version that failed to load
+        self._failed = None
+        self._lock = threading.Lock()
+        self._watcher = None
+        self.current = self._load(*registry.resolve())
+
+    @property
+    def version(self):
+        return self.current['version']
+
+    def _load(self, version, path):
+        bundle = self.loader(path)
+        bundle['version'] = version
+        bundle['loaded_at'] = time.time()
+        return bundle
+
+    # Load, warm and swap in the active version if the pointer moved; True on a
+    # swap. A version that failed before is skipped until its artifact changes.
+    def refresh(self):
+        with self._lock:
+            version, path = self.registry.resolve()
+            if version == self.current['version']:
+                self._failed = None
+                return False
+            attempt = (version, self.registry.artifact_stat(path))
+            if attempt == self._failed:
+                return False
+            try:
+                bundle = self._load(version, path)
+                if self.warm is not None:
+                    self.warm(bundle)
+            except Exception:
+                self._failed = attempt
+                raise
+            self._failed = None
+            self.current = bundle
+            self.swaps += 1
+            return True
+
+    def start_watcher(self):
+        if self._watcher is not None:
+            return self._watcher
+
+        def watch():
+            while True:
+                time.sleep(self.poll_interval)
+                self._guarded(self.refresh)
+
+        self._watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+        return self._watcher
+
+    # A broken artifact leaves the current model serving; the error is kept for
+    # display while the broken version stays active
+    def _guarded(self, fn):
+        try:
+            fn()
+        except Exception as e:
+            self.last_error = f'{type(e).__name__}: {e}'
+        else:
+            if self._failed is None:
+                self.last_error = None
+
+    def stats(self):
+        return {'version': self.version, 'swaps': self.swaps, 'loaded_at': self.current['loaded_at'],
+                'last_error': self.last_error}
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the versioned model registry.")
+    parser.add_argument('--root', default='models', help="registry directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="list published versions")
+    publish = commands.add_parser('publish', help="copy a model artifact into the registry")
+    publish.add_argument('path')
+    publish.add_argument('--activate', action='store_true', help="also make it the current version")
+    activate = commands.add_parser('activate', help="point CURRENT at a published version")
+    activate.add_argument('version')
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root)
+    if args.command == 'list':
+        current = registry.current_version()
+        for version in registry.versions():
+            print(f"{'*' if version == current else ' '} {version}")
+    elif args.command == 'publish':
+        version = registry.publish(args.path, activate=args.activate)
+        print(f"Published {version}" + (" (active)" if args.activate else ""))
+    else:
+        try:
+            registry.activate(args.version)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Activated {args.version}")
+
+if __name__ == '__main__':
+    main()
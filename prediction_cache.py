@@ -0,0 +1,135 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from feature_pipeline import FEATURE_COLUMNS, encode_features, encode_row
+from metrics import span
+
+# Memoized predictions for the Quality Analysis tab.
+#
+# The sliders move in steps of 0.1 and the 4Cs come from selectboxes, so the
+# inputs live on a finite lattice. Numeric inputs are quantized onto that
+# lattice and the resulting tuple, tagged with the model version, keys an LRU.
+# An entry holds the price and, once asked for, its per-feature contributions.
+# An explain() that finds the price but not the contributions is counted as a
+# partial hit: only the attribution is computed.
+
+NUMERIC_STEP = 0.1
+NUMERIC_COLUMNS = ['carat', 'depth', 'table', 'x', 'y', 'z']
+
+# Snap a numeric input to the slider lattice as an integer number of steps
+def quantize(value):
+    return int(round(float(value) / NUMERIC_STEP))
+
+class PredictionCache:
+    def __init__(self, engine, maxsize=10000):
+        self.engine = engine
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, carat, cut, color, clarity, depth, table, x, y, z):
+        return (self.engine.version, quantize(carat), cut, color, clarity,
+                quantize(depth), quantize(table), quantize(x), quantize(y), quantize(z))
+
+    # Price one diamond, answering from the cache when the lattice point was seen before
+    def predict(self, carat, cut, color, clarity, depth, table, x, y, z):
+        key = self.make_key(carat, cut, color, clarity, depth, table, x, y, z)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        with span('encode'):
+            features = self._features(key)
+        with span('model'):
+            price = self.engine.predict_row(features)
+        self._store(key, price)
+        return price
+
+    # Price and per-feature contributions (tree_engine.explain layout), cached together
+    def explain(self, carat, cut, color, clarity, depth, table, x, y, z):
+        key = self.make_key(carat, cut, color, clarity, depth, table, x, y, z)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self.partial_hits += 1
+            else:
+                self.misses += 1
+
+        with span('encode'):
+            features = self._features(key)
+        with span('model'):
+            price = entry[0] if entry is not None else self.engine.predict_row(features)
+            contributions = self.engine.explain_row(features)
+        self._store(key, price, contributions)
+        return price, contributions
+
+    # The feature row of a key's lattice point
+    def _features(self, key):
+        _, carat, cut, color, clarity, depth, table, x, y, z = key
+        return encode_row(carat * NUMERIC_STEP, cut, color, clarity, depth * NUMERIC_STEP,
+                          table * NUMERIC_STEP, x * NUMERIC_STEP, y * NUMERIC_STEP, z * NUMERIC_STEP)
+
+    def _store(self, key, price, contributions=None):
+        with self._lock:
+            self._entries[key] = (price, contributions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Pre-price a dataframe of configurations (most popular first) in one batched call
+    def warm(self, configurations):
+        features, valid = encode_features(configurations, errors='mask')
+        configurations = configurations[valid].head(self.maxsize)
+        if configurations.empty:
+            return 0
+        features = features[valid].head(self.maxsize).to_numpy()
+        prices = self.engine.predict(features)
+        # Insert least popular first so the most popular are the last to be evicted
+        rows = list(configurations[FEATURE_COLUMNS].itertuples(index=False))
+        for row, price in zip(reversed(rows), prices[::-1]):
+            self._store(self.make_key(*row), float(price))
+        return len(configurations)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.partial_hits + self.misses
+            return {
+                'hits': self.hits,
+                'partial_hits': self.partial_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                # Lookups that found at least the price
+                'price_hit_rate': (self.hits + self.partial_hits) / lookups if lookups else 0.0
+            }
+
+# The most frequent lattice points in the reference data, most popular first
+def popular_configurations(path='diamonds.csv', top=1000):
+    from dataset_cache import load_dataset
+
+    df = load_dataset(path).to_frame(decode=True)[FEATURE_COLUMNS]
+    # The cache stores float32; recover the CSV's two-decimal values before snapping to the lattice
+    df[NUMERIC_COLUMNS] = df[NUMERIC_COLUMNS].astype('float64').round(2).round(1)
+    counts = df.groupby(FEATURE_COLUMNS, observed=True).size()
+    return counts.nlargest(top).index.to_frame(index=False)
@@ -0,0 +1,75 @@
+import os
+
+from feature_pipeline import FEATURE_COLUMNS, SCHEMA_ATTRIBUTE, check_schema, encode_features
+
+# Shared pricing helpers used by the Streamlit app and the headless tools.
+# Nothing in here touches Streamlit, so it is safe to import from scripts.
+# Features are encoded by feature_pipeline.py, shared with training.
+# pandas and xgboost are imported inside the functions that need them so that
+# importing this module (e.g. for convert_currencies) stays cheap at startup.
+
+MODEL_PATH = 'xgb_model.json'
+DATASET_PATH = 'diamonds.csv'
+
+# Exchange rates (as of March 2025 - for simulation purposes)
+EXCHANGE_RATES = {
+    'INR': 83.5,  # 1 USD = 83.5 INR
+    'JPY': 149.8, # 1 USD = 149.8 JPY
+    'AED': 3.67   # 1 USD = 3.67 AED
+}
+
+# Load the regression model from disk
+def load_xgb_model(path=MODEL_PATH):
+    import xgboost as xgb
+
+    model = xgb.XGBRegressor()
+    model.load_model(path)
+    check_schema(model.get_booster().attr(SCHEMA_ATTRIBUTE), f"Model {path}")
+    return model
+
+# Function to convert USD to other currencies (works for scalars and arrays)
+def convert_currencies(usd_price):
+    currencies = {'USD': usd_price}
+    for code, rate in EXCHANGE_RATES.items():
+        currencies[code] = usd_price * rate
+    return currencies
+
+# Price every row of a dataframe and append one column per currency. With an
+# explainer (the tree engine), also append each feature's contribution to the
+# USD price and the expected price they start from. Rows with invalid
+# measurements (e.g. a zero dimension) are left unpriced, as NaN.
+def price_frame(model, df, explainer=None):
+    features, valid = encode_features(df, errors='mask')
+    prices = model.predict(features)
+    prices[~valid] = float('nan')
+    priced = df.copy()
+    for code, values in convert_currencies(prices).items():
+        priced[f'predicted_{code.lower()}'] = values
+    if explainer is not None:
+        contributions = explainer.explain(features.to_numpy())
+        contributions[~valid] = float('nan')
+        for i, column in enumerate(FEATURE_COLUMNS):
+            priced[f'contribution_{column}'] = contributions[:, i]
+        priced['contribution_base'] = contributions[:, -1]
+    return priced
+
+# Stream a CSV through the model in chunks and write the priced rows to dst.
+# src and dst may be paths or file-like objects; returns the number of rows priced.
+def price_csv(model, src, dst, chunksize=50000, explainer=None):
+    import pandas as pd
+
+    if isinstance(dst, (str, os.PathLike)):
+        with open(dst, 'w', newline='') as out:
+            return price_csv(model, src, out, chunksize, explainer)
+
+    rows = 0
+    for chunk in pd.read_csv(src, chunksize=chunksize):
+        # diamonds.csv carries an unnamed row-number column; keep it as the index
+        has_index = chunk.columns[0].startswith('Unnamed: 0')
+        if has_index:
+            chunk = chunk.set_index(chunk.columns[0])
+            chunk.index.name = None
+        priced = price_frame(model, chunk, explainer)
+        priced.to_csv(dst, header=(rows == 0), index=has_index)
+        rows += len(chunk)
+    return rows
@@ -0,0 +1,334 @@
+import argparse
+import gc
+import json
+import mmap
+import os
+import queue
+import signal
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from feature_pipeline import encode_records
+from pricing import MODEL_PATH, convert_currencies, load_xgb_model
+from tree_engine import is_compact, load_tree_ensemble
+
+# Headless HTTP/JSON pricing service.
+#
+#   python pricing_service.py --port 8000 --max-batch 256 --max-wait-ms 2
+#
+#   POST /predict   one diamond object, or a list of them, in the diamonds.csv schema
+#   GET  /metrics   throughput, latency percentiles and batching statistics
+#   GET  /health    liveness probe
+#
+# Concurrent requests are coalesced by a MicroBatcher so the model sees one
+# predict call per time window instead of one per request. Small batches are
+# priced by the native tree engine, larger ones by xgboost itself.
+#
+# --workers N pre-forks: the parent loads the model and the native engine
+# once, binds the socket and forks N workers that accept on it, each with its
+# own batcher. Workers share the parent's model memory copy-on-write. Nothing
+# writes to the engine's arrays or the booster after loading, and gc.freeze()
+# stops the collector touching (and so copying) the parent's objects. The
+# parent never predicts, so no OpenMP thread pool exists at fork time. Each
+# worker mirrors its counters into a shared-memory table, so /metrics from
+# any worker reports totals for the whole service. serving_profile.py compares
+# this mode against N independent replicas.
+
+# Below this many rows the native engine beats building a DataFrame for xgboost
+NATIVE_BATCH_ROWS = 16
+
+# Rolling request statistics shared between the handler threads. In pre-fork
+# mode `shared` is the (workers x 4) counter table and `worker` this process's row.
+class ServiceStats:
+    def __init__(self, window=10000, shared=None, worker=None):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._shared = shared
+        self._worker = worker
+        self.started = time.monotonic()
+        # A restarted worker carries on from its predecessor's counts
+        counts = shared[worker].tolist() if shared is not None else [0, 0, 0, 0]
+        self.requests, self.errors, self.batches, self.batched_rows = counts
+
+    def record_request(self, latency, ok=True):
+        with self._lock:
+            self.requests += 1
+            if not ok:
+                self.errors += 1
+            self._latencies.append(latency)
+            if self._shared is not None:
+                self._shared[self._worker, :2] = (self.requests, self.errors)
+
+    def record_batch(self, rows):
+        with self._lock:
+            self.batches += 1
+            self.batched_rows += rows
+            if self._shared is not None:
+                self._shared[self._worker, 2:] = (self.batches, self.batched_rows)
+
+    def snapshot(self):
+        with self._lock:
+            latencies = np.array(self._latencies, dtype=float)
+            elapsed = time.monotonic() - self.started
+            if self._shared is not None:
+                requests, errors, batches, batched_rows = self._shared.sum(axis=0).tolist()
+            else:
+                requests, errors, batches, batched_rows = self.requests, self.errors, self.batches, self.batched_rows
+            snapshot = {
+                'uptime_s': elapsed,
+                'requests': requests,
+                'errors': errors,
+                'throughput_rps': requests / elapsed if elapsed > 0 else 0.0,
+                'batches': batches,
+                'mean_batch_rows': batched_rows / batches if batches else 0.0
+            }
+            if self._shared is not None:
+                # Latency percentiles below are this worker's own
+                snapshot['workers'] = len(self._shared)
+                snapshot['worker'] = self._worker
+                snapshot['worker_requests'] = self.requests
+        if len(latencies):
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            snapshot['p50_ms'] = p50
+            snapshot['p99_ms'] = p99
+        return snapshot
+
+# Collects rows from concurrent callers and prices them in one model call per window
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch=256, max_wait=0.002, stats=None):
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = stats
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    # Queue a list of row dicts; the future resolves to an array of USD prices.
+    # predict_fn receives the combined list of row dicts for a whole batch.
+    def submit(self, rows):
+        future = Future()
+        self._queue.put((rows, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch, size
+
+    def _run(self):
+        while True:
+            batch, size = self._collect()
+            try:
+                prices = self.predict_fn([row for rows, _ in batch for row in rows])
+            except Exception:
+                # One malformed request must not fail its neighbours; isolate it
+                self._run_individually(batch)
+                continue
+            if self.stats is not None:
+                self.stats.record_batch(size)
+            offset = 0
+            for rows, future in batch:
+                future.set_result(prices[offset:offset + len(rows)])
+                offset += len(rows)
+
+    def _run_individually(self, batch):
+        for rows, future in batch:
+            try:
+                future.set_result(self.predict_fn(rows))
+            except Exception as e:
+                future.set_exception(e)
+            if self.stats is not None:
+                self.stats.record_batch(len(rows))
+
+# The default listen backlog of 5 drops connections under a burst of clients
+class PricingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+class PricingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/metrics':
+            self._send_json(200, self.server.stats.snapshot())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length))
+            rows = payload if isinstance(payload, list) else [payload]
+            if not rows or not all(isinstance(row, dict) for row in rows):
+                raise ValueError("Expected a diamond object or a list of diamond objects")
+            prices = self.server.batcher.submit(rows).result(timeout=self.server.timeout_s)
+        except (ValueError, KeyError) as e:
+            self.server.stats.record_request(time.perf_counter() - start, ok=False)
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self.server.stats.record_request(time.perf_counter() - start, ok=False)
+            self._send_json(500, {'error': str(e)})
+            return
+
+        results = [
+            {code: float(value) for code, value in convert_currencies(price).items()}
+            for price in prices
+        ]
+        self.server.stats.record_request(time.perf_counter() - start)
+        self._send_json(200, results if isinstance(payload, list) else results[0])
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Per-request access logging would dominate the cost of a prediction
+    def log_message(self, format, *args):
+        pass
+
+# Price a list of row dicts with whichever engine is cheaper for the batch size
+# (always the native one when serving a compact export without an XGBoost model)
+def predict_records(model, ensemble, rows):
+    X = encode_records(rows)
+    if ensemble is not None and (model is None or len(rows) <= NATIVE_BATCH_ROWS):
+        return ensemble.predict(X)
+    return model.predict(X)
+
+# Give a bound server its statistics and batcher (whose thread starts here)
+def attach_batcher(server, model, ensemble, max_batch=256, max_wait=0.002, timeout_s=5.0, stats=None):
+    server.stats = stats or ServiceStats()
+    server.batcher = MicroBatcher(lambda rows: predict_records(model, ensemble, rows),
+                                  max_batch=max_batch, max_wait=max_wait, stats=server.stats)
+    server.timeout_s = timeout_s
+    return server
+
+# Build a server around a loaded model; call serve_forever() on the result
+def create_server(model, ensemble=None, host='127.0.0.1', port=8000, max_batch=256, max_wait=0.002,
+                  timeout_s=5.0):
+    server = PricingServer((host, port), PricingHandler)
+    return attach_batcher(server, model, ensemble, max_batch, max_wait, timeout_s)
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+# Fork one worker serving on the parent's bound socket; returns its pid
+def _spawn_worker(server, model, ensemble, shared, worker, threads, max_batch, max_wait, timeout_s):
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 0
+    try:
+        # The parent handles Ctrl-C and stops the workers with SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        if model is not None:
+            model.get_booster().set_param({'nthread': threads})
+        attach_batcher(server, model, ensemble, max_batch, max_wait, timeout_s,
+                       ServiceStats(shared=shared, worker=worker))
+        server.serve_forever()
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+# Pre-fork serving: bind once, fork `workers` processes sharing the loaded
+# model, restart any that die, and stop them all on Ctrl-C or SIGTERM
+def serve_prefork(model, ensemble, workers, host='127.0.0.1', port=8000, max_batch=256, max_wait=0.002,
+                  timeout_s=5.0, ready=None):
+    server = PricingServer((host, port), PricingHandler)
+    # Every worker polls the socket; the ones that lose a race for a connection must not block in accept()
+    server.socket.setblocking(False)
+    shared = np.frombuffer(mmap.mmap(-1, workers * 4 * 8), dtype=np.int64).reshape(workers, 4)
+    # Split the cores between workers rather than giving each xgboost all of them
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    spawn = lambda worker: _spawn_worker(server, model, ensemble, shared, worker, threads,
+                                         max_batch, max_wait, timeout_s)
+
+    gc.freeze()
+    signal.signal(signal.SIGTERM, _stop)
+    children = {}
+    try:
+        for worker in range(workers):
+            children[spawn(worker)] = worker
+        if ready is not None:
+            ready(list(children))
+        while True:
+            pid, status = os.wait()
+            worker = children.pop(pid, None)
+            if worker is not None:
+                print(f"Worker {worker} (pid {pid}) exited with status {status}; restarting", flush=True)
+                time.sleep(1.0)
+                children[spawn(worker)] = worker
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        for pid in children:
+            os.waitpid(pid, 0)
+        server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve diamond price predictions over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--model', default=MODEL_PATH,
+                        help="path to the XGBoost model, or a compact export served natively")
+    parser.add_argument('--max-batch', type=int, default=256, help="maximum rows per model call")
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help="how long to wait for a batch to fill")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes sharing one loaded model (pre-fork); 1 serves in-process")
+    args = parser.parse_args()
+
+    model = None if is_compact(args.model) else load_xgb_model(args.model)
+    ensemble = load_tree_ensemble(args.model)
+    if args.workers > 1:
+        serve_prefork(model, ensemble, args.workers, args.host, args.port, max_batch=args.max_batch,
+                      max_wait=args.max_wait_ms / 1000,
+                      ready=lambda pids: print(f"Serving predictions on http://{args.host}:{args.port}/predict "
+                                               f"with {len(pids)} workers (pids {', '.join(map(str, pids))})",
+                                               flush=True))
+        return
+
+    server = create_server(model, ensemble, args.host, args.port,
+                           max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000)
+    print(f"Serving predictions on http://{args.host}:{args.port}/predict", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from streamlit_driver import StreamlitSession
+
+# Per-interaction cost of the Streamlit app, measured against a real server.
+#
+#   python rerun_profile.py --moves 20
+#
+# Starts `streamlit run app.py` headless, connects over the websocket the way a
+# browser would and replays predictor interactions: slider moves and Predict
+# clicks. For each kind of interaction it reports the wall time until the run
+# finished, the server CPU time it cost (from /proc, so Linux only) and the
+# websocket payload the server sent back. Comparing the numbers across revisions
+# shows what scoping reruns to fragments saves.
+
+CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def process_cpu_seconds(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLK_TCK
+
+# `streamlit run` the app headless; env adds environment variables for the server.
+# The audit log is off unless env turns it on (AUDIT_LOG='1' with a scratch
+# AUDIT_LOG_DIR), so harness clicks never reach the real audit_logs/
+def start_server(app, port, secrets_path, env=None):
+    env = dict(os.environ, WARMUP_AFTER_FIRST_PAINT='0', AUDIT_LOG='0') | (env or {})
+    command = [sys.executable, '-m', 'streamlit', 'run', app, '--server.headless', 'true',
+               '--server.port', str(port), '--browser.gatherUsageStats', 'false',
+               '--secrets.files', secrets_path]
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              cwd=os.path.dirname(os.path.abspath(app)))
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("streamlit server did not become healthy")
+
+# Run one interaction and measure it
+def measure(server, action):
+    cpu_before = process_cpu_seconds(server.pid)
+    result = action()
+    if result.status != 'FINISHED_SUCCESSFULLY' and result.status != 'FINISHED_FRAGMENT_RUN_SUCCESSFULLY':
+        raise RuntimeError(f"run ended with {result.status}")
+    return {'wall_s': result.seconds, 'cpu_s': process_cpu_seconds(server.pid) - cpu_before,
+            'bytes': result.payload_bytes}
+
+def summarize(samples):
+    n = len(samples)
+    return {key: sum(sample[key] for sample in samples) / n for key in ('wall_s', 'cpu_s', 'bytes')}
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure server CPU and websocket payload per app interaction.")
+    parser.add_argument('--app', default='app.py')
+    parser.add_argument('--moves', type=int, default=20, help="slider moves (and Predict clicks) to replay")
+    parser.add_argument('--json', action='store_true', help="print the summary as JSON")
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.NamedTemporaryFile('w', suffix='.toml', delete=False) as secrets:
+        secrets.write('GEMINI_API_KEY = "rerun-profile"\n')
+    # Clicks pay for the audit log as in production, into a scratch directory
+    audit_dir = tempfile.mkdtemp(prefix='rerun-profile-audit-')
+    server = start_server(args.app, port, secrets.name, {'AUDIT_LOG': '1', 'AUDIT_LOG_DIR': audit_dir})
+    try:
+        with StreamlitSession(f'ws://127.0.0.1:{port}/_stcore/stream') as session:
+            initial = measure(server, session.rerun)
+            # Warm the model, engine and prediction cache before timing anything
+            session.click('Predict Diamond Price')
+
+            carats = [round(0.5 + 0.1 * (i % 20), 1) for i in range(args.moves)]
+            slider = [measure(server, lambda c=c: session.set_slider('Carat Weight', c)) for c in carats]
+            predict = [measure(server, lambda: session.click('Predict Diamond Price'))
+                       for _ in range(args.moves)]
+    finally:
+        server.terminate()
+        server.wait()
+        os.unlink(secrets.name)
+        shutil.rmtree(audit_dir, ignore_errors=True)
+
+    summary = {'initial_render': initial, 'slider_move': summarize(slider), 'predict_click': summarize(predict)}
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"{'interaction':<16}{'wall ms':>10}{'server cpu ms':>16}{'payload bytes':>16}")
+    for name, stats in summary.items():
+        print(f"{name:<16}{stats['wall_s'] * 1000:>10.1f}{stats['cpu_s'] * 1000:>16.1f}{stats['bytes']:>16.0f}")
+
+if __name__ == '__main__':
+    main()
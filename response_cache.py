@@ -0,0 +1,126 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+# Disk-backed cache for expert answers.
+#
+# Answers are keyed on the normalized question together with everything else
+# that shapes the reply: the system prompt, the model name and the generation
+# config. Entries expire after ttl seconds and the least recently used ones are
+# dropped once the table holds more than max_entries rows. With a
+# near_duplicate threshold set, a miss falls back to the most similar cached
+# question (token Jaccard similarity) under the same context.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    context TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_context ON responses (context);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+# Lowercase, drop punctuation and collapse whitespace so trivial variants share a key
+def normalize_prompt(prompt):
+    return ' '.join(re.sub(r"[^\w\s]", ' ', prompt.lower()).split())
+
+def _hash(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _similarity(a, b):
+    a, b = set(a.split()), set(b.split())
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class ResponseCache:
+    def __init__(self, path='expert_cache.sqlite3', ttl=7 * 24 * 3600, max_entries=5000,
+                 near_duplicate=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.near_duplicate = near_duplicate
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def context_key(self, system_prompt, model_name, generation_config):
+        return _hash(' '.join(system_prompt.split()), model_name, generation_config or {})
+
+    def get(self, prompt, system_prompt, model_name, generation_config=None):
+        context = self.context_key(system_prompt, model_name, generation_config)
+        normalized = normalize_prompt(prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT key, response FROM responses WHERE key = ? AND created > ?',
+                (_hash(context, normalized), now - self.ttl)
+            ).fetchone()
+            if row is None and self.near_duplicate:
+                row = self._nearest(context, normalized, now)
+                if row is not None:
+                    self.near_hits += 1
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET accessed = ?, hits = hits + 1 WHERE key = ?',
+                               (now, row[0]))
+            self._conn.commit()
+            self.hits += 1
+            return row[1]
+
+    def _nearest(self, context, normalized, now):
+        best, best_score = None, self.near_duplicate
+        rows = self._conn.execute(
+            'SELECT key, prompt, response FROM responses WHERE context = ? AND created > ?',
+            (context, now - self.ttl)
+        )
+        for key, prompt, response in rows:
+            score = _similarity(normalized, prompt)
+            if score >= best_score:
+                best, best_score = (key, response), score
+        return best
+
+    def put(self, prompt, response, system_prompt, model_name, generation_config=None):
+        context = self.context_key(system_prompt, model_name, generation_config)
+        normalized = normalize_prompt(prompt)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, context, prompt, response, created, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (_hash(context, normalized), context, normalized, response, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute('DELETE FROM responses WHERE created <= ?', (now - self.ttl,))
+        (count,) = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                'DELETE FROM responses WHERE key IN '
+                '(SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)',
+                (count - self.max_entries,)
+            )
+
+    def stats(self):
+        with self._lock:
+            (size,) = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()
+        return {'hits': self.hits, 'near_hits': self.near_hits, 'misses': self.misses, 'size': size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from prediction_cache import quantize
+from feature_pipeline import CATEGORY_MAPPINGS, FEATURE_COLUMNS, encode_row
+
+# Price-sensitivity sweeps around one diamond for the predictor tab.
+#
+# A sweep varies a single input with the others held at the current values:
+# each numeric input over its slider's range, each of cut, color and clarity
+# over every grade. The variants for all nine inputs are stacked into one
+# feature matrix and priced with a single batched engine call, and the result
+# is cached per input on the slider lattice, so returning to a stone or
+# charting another input is a dictionary lookup.
+
+# Same ranges as the predictor's sliders
+SWEEP_RANGES = {
+    'carat': (0.1, 10.0),
+    'depth': (45.0, 75.0),
+    'table': (45.0, 75.0),
+    'x': (0.1, 30.0),
+    'y': (0.1, 30.0),
+    'z': (0.1, 30.0)
+}
+SWEEP_POINTS = 60
+
+# Evenly spaced points of a numeric input's range, on the 0.1 slider lattice
+def sweep_values(column, points=SWEEP_POINTS):
+    low, high = SWEEP_RANGES[column]
+    return np.unique(np.round(np.linspace(low, high, points), 1))
+
+# Feature matrix of every single-input variant of one diamond, and for each
+# input the values it takes and the rows holding them
+def build_sweep_grid(carat, cut, color, clarity, depth, table, x, y, z, points=SWEEP_POINTS):
+    base = np.array(encode_row(carat, cut, color, clarity, depth, table, x, y, z), dtype=np.float32)
+    blocks, layout, start = [], {}, 0
+    for position, column in enumerate(FEATURE_COLUMNS):
+        if column in CATEGORY_MAPPINGS:
+            # Grades in the mappings' order, lowest to highest
+            labels = list(CATEGORY_MAPPINGS[column])
+            codes = np.array([CATEGORY_MAPPINGS[column][grade] for grade in labels], dtype=np.float32)
+        else:
+            codes = sweep_values(column, points)
+            labels = codes.tolist()
+        block = np.repeat(base[None, :], len(codes), axis=0)
+        block[:, position] = codes
+        blocks.append(block)
+        layout[column] = (labels, slice(start, start + len(codes)))
+        start += len(codes)
+    return np.concatenate(blocks), layout
+
+# Price every sweep in one engine call; {input: {'values': [...], 'prices': [...]}}
+def price_sweeps(engine, carat, cut, color, clarity, depth, table, x, y, z, points=SWEEP_POINTS):
+    X, layout = build_sweep_grid(carat, cut, color, clarity, depth, table, x, y, z, points)
+    prices = engine.predict(X).astype(np.float64)
+    return {column: {'values': labels, 'prices': prices[rows].tolist()}
+            for column, (labels, rows) in layout.items()}
+
+# Vega-Lite spec charting one sweep, with the current value marked. Passing a
+# spec straight to st.vega_lite_chart skips the Altair round trip behind
+# st.line_chart, which costs more than pricing the sweep.
+def sweep_chart_spec(column, sweep, current, title):
+    values = [{'value': value, 'price': price} for value, price in zip(sweep['values'], sweep['prices'])]
+    y = {'field': 'price', 'type': 'quantitative', 'title': 'Price (USD)'}
+    if column in CATEGORY_MAPPINGS:
+        x = {'field': 'value', 'type': 'ordinal', 'title': title, 'sort': list(sweep['values'])}
+        return {
+            'data': {'values': values},
+            'mark': 'bar',
+            'encoding': {'x': x, 'y': y, 'color': {
+                'condition': {'test': f"datum.value === {current!r}", 'value': '#1e3a8a'}, 'value': '#93c5fd'}}
+        }
+    x = {'field': 'value', 'type': 'quantitative', 'title': title}
+    return {
+        'data': {'values': values},
+        'layer': [
+            {'mark': {'type': 'line', 'color': '#3b82f6'}, 'encoding': {'x': x, 'y': y}},
+            {'mark': {'type': 'rule', 'color': '#1e3a8a', 'strokeDash': [4, 4]},
+             'data': {'values': [{'value': float(current)}]}, 'encoding': {'x': x}}
+        ]
+    }
+
+# LRU of sweeps per lattice point, tagged with the model version like PredictionCache
+class SweepCache:
+    def __init__(self, engine, maxsize=256, points=SWEEP_POINTS):
+        self.engine = engine
+        self.maxsize = maxsize
+        self.points = points
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, carat, cut, color, clarity, depth, table, x, y, z):
+        key = (self.engine.version, quantize(carat), cut, color, clarity,
+               quantize(depth), quantize(table), quantize(x), quantize(y), quantize(z))
+        with self._lock:
+            sweeps = self._entries.get(key)
+            if sweeps is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return sweeps
+            self.misses += 1
+
+        sweeps = price_sweeps(self.engine, carat, cut, color, clarity, depth, table, x, y, z, self.points)
+        with self._lock:
+            self._entries[key] = sweeps
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return sweeps
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize}
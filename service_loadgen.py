@@ -0,0 +1,91 @@
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+from feature_pipeline import FEATURE_COLUMNS, valid_measurements
+
+# Local load generator for pricing_service.py.
+#
+#   python pricing_service.py &
+#   python service_loadgen.py --concurrency 64 --requests 20000
+#
+# Each worker keeps one keep-alive connection and posts single diamonds sampled
+# from diamonds.csv, which is the traffic shape the POS backends produce. With
+# several --url values the connections are spread over them round-robin (used
+# by serving_profile.py to drive independent replicas).
+
+def run_worker(url, bodies, latencies, errors):
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+    headers = {'Content-Type': 'application/json'}
+    for body in bodies:
+        start = time.perf_counter()
+        try:
+            connection.request('POST', parts.path or '/predict', body, headers)
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        if not ok:
+            errors.append(1)
+    connection.close()
+
+# JSON request bodies for `requests` diamonds sampled from the CSV
+def sample_bodies(data_path, requests, seed=0):
+    sample = pd.read_csv(data_path, index_col=0)[FEATURE_COLUMNS]
+    # Rows the service would reject (zero dimensions) are not replayed
+    sample = sample[valid_measurements(sample)]
+    sample = sample.sample(n=requests, replace=True, random_state=seed)
+    return [json.dumps(row) for row in sample.to_dict(orient='records')]
+
+# Post every body from `concurrency` connections; returns throughput and latency figures
+def generate_load(urls, bodies, concurrency):
+    latencies = []
+    errors = []
+    threads = [
+        threading.Thread(target=run_worker, args=(urls[i % len(urls)], bodies[i::concurrency], latencies, errors))
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(np.array(latencies), [50, 95, 99]) * 1000
+    return {'requests': len(latencies), 'errors': len(errors), 'seconds': elapsed,
+            'throughput_rps': len(latencies) / elapsed, 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99}
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate load against the pricing service.")
+    parser.add_argument('--url', nargs='+', default=['http://127.0.0.1:8000/predict'])
+    parser.add_argument('--data', default='diamonds.csv', help="CSV to sample request bodies from")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    load = generate_load(args.url, sample_bodies(args.data, args.requests, args.seed), args.concurrency)
+    print(f"Requests:    {load['requests']:,} ({load['errors']:,} errors) with concurrency {args.concurrency}")
+    print(f"Throughput:  {load['throughput_rps']:,.0f} req/s")
+    print(f"Latency:     p50 {load['p50_ms']:.2f} ms, p95 {load['p95_ms']:.2f} ms, p99 {load['p99_ms']:.2f} ms")
+
+    parts = urlsplit(args.url[0])
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+    connection.request('GET', '/metrics')
+    metrics = json.loads(connection.getresponse().read())
+    print(f"Server:      {metrics['batches']:,} model calls, {metrics['mean_batch_rows']:.1f} rows per batch")
+
+if __name__ == '__main__':
+    main()
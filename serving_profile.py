@@ -0,0 +1,134 @@
+import argparse
+import glob
+import http.client
+import os
+import subprocess
+import sys
+import time
+
+from pricing import MODEL_PATH
+from service_loadgen import generate_load, sample_bodies
+
+# Pre-fork workers against independent replicas of pricing_service.py.
+#
+#   python serving_profile.py --workers 4 --requests 20000 --concurrency 64
+#
+# Starts the service twice: as `--workers N` (one model load, N forked workers
+# on one port) and as N single-process replicas on consecutive ports, each
+# loading its own model. Both get the same traffic, spread round-robin over
+# the replicas' ports. Reports the time until the service answers on every
+# port, memory per process and in total, and aggregate throughput and
+# latency. Memory comes from /proc/<pid>/smaps_rollup. RSS counts a shared
+# page in every process mapping it; PSS splits it between them, so PSS sums to
+# the real footprint; USS is what a process holds alone.
+
+SERVICE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pricing_service.py')
+
+# RSS, PSS and USS of one process in KiB
+def process_memory(pid):
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {'rss': fields['Rss'], 'pss': fields['Pss'],
+            'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)}
+
+def child_pids(pid):
+    pids = []
+    for path in glob.glob(f'/proc/{pid}/task/*/children'):
+        with open(path) as f:
+            pids.extend(int(child) for child in f.read().split())
+    return pids
+
+def wait_ready(ports, deadline):
+    for port in ports:
+        while True:
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+                connection.request('GET', '/health')
+                if connection.getresponse().status == 200:
+                    connection.close()
+                    break
+            except OSError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Service on port {port} did not start")
+            time.sleep(0.05)
+
+# Launch one setup; returns (processes, pids to measure, urls, seconds until ready)
+def start_setup(mode, workers, base_port, model_path, timeout):
+    command = [sys.executable, SERVICE, '--model', model_path]
+    ports = [base_port] if mode == 'prefork' else [base_port + 1 + i for i in range(workers)]
+    start = time.monotonic()
+    if mode == 'prefork':
+        processes = [subprocess.Popen(command + ['--port', str(ports[0]), '--workers', str(workers)],
+                                      stdout=subprocess.DEVNULL)]
+    else:
+        processes = [subprocess.Popen(command + ['--port', str(port)], stdout=subprocess.DEVNULL) for port in ports]
+    wait_ready(ports, start + timeout)
+    ready = time.monotonic() - start
+
+    pids = [process.pid for process in processes]
+    if mode == 'prefork':
+        # The parent only supervises; workers may still be forking when the first answers
+        while len(child_pids(pids[0])) < workers and time.monotonic() < start + timeout:
+            time.sleep(0.05)
+        pids += child_pids(pids[0])
+    return processes, pids, [f'http://127.0.0.1:{port}/predict' for port in ports], ready
+
+def stop_setup(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+def total_memory(pids):
+    memory = [process_memory(pid) for pid in pids]
+    return {key: sum(m[key] for m in memory) for key in ('rss', 'pss', 'uss')}, memory
+
+def profile(mode, args, bodies, warmup):
+    processes, pids, urls, ready = start_setup(mode, args.workers, args.port, args.model, args.timeout)
+    try:
+        idle, _ = total_memory(pids)
+        generate_load(urls, warmup, args.concurrency)
+        load = generate_load(urls, bodies, args.concurrency)
+        loaded, per_process = total_memory(pids)
+    finally:
+        stop_setup(processes)
+    return {'ready_s': ready, 'processes': len(pids), 'idle': idle, 'loaded': loaded,
+            'per_process': per_process, 'load': load}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pre-fork workers against independent replicas.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--data', default='diamonds.csv', help="CSV to sample request bodies from")
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--port', type=int, default=8100, help="pre-fork port; replicas use the next N ports")
+    parser.add_argument('--timeout', type=float, default=120.0, help="seconds to wait for a setup to start")
+    args = parser.parse_args()
+
+    bodies = sample_bodies(args.data, args.requests)
+    warmup = sample_bodies(args.data, min(args.requests, 50 * args.concurrency), seed=1)
+    results = {mode: profile(mode, args, bodies, warmup) for mode in ('prefork', 'replicas')}
+
+    print(f"{args.workers} workers, {args.requests:,} requests at concurrency {args.concurrency} "
+          f"({os.cpu_count()} CPUs)")
+    print(f"{'setup':<10}{'procs':>6}{'ready s':>9}{'PSS MiB':>9}{'+load':>8}{'USS/worker':>12}"
+          f"{'req/s':>9}{'p50 ms':>8}{'p99 ms':>8}{'errors':>8}")
+    for mode, result in results.items():
+        workers = result['per_process'][1:] if mode == 'prefork' else result['per_process']
+        uss = sum(m['uss'] for m in workers) / len(workers)
+        load = result['load']
+        print(f"{mode:<10}{result['processes']:>6}{result['ready_s']:>9.2f}{result['idle']['pss'] / 1024:>9.0f}"
+              f"{(result['loaded']['pss'] - result['idle']['pss']) / 1024:>+8.0f}{uss / 1024:>12.1f}"
+              f"{load['throughput_rps']:>9,.0f}{load['p50_ms']:>8.2f}{load['p99_ms']:>8.2f}{load['errors']:>8,}")
+    saved = results['replicas']['loaded']['pss'] - results['prefork']['loaded']['pss']
+    print(f"Pre-fork saves {saved / 1024:.0f} MiB of PSS under load "
+          f"({saved / results['replicas']['loaded']['pss']:.0%} of the replicas' total).")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from rerun_profile import free_port, process_cpu_seconds, start_server
+from streamlit_driver import StreamlitSession
+
+# How many concurrent users one Streamlit instance of the app can serve.
+#
+#   python session_loadtest.py --sessions 1 2 4 8 16 --duration 20
+#
+# Starts `streamlit run app.py` headless with the Gemini model replaced by the
+# local stub (fake_gemini.py, latency set by --llm-latency). Then it steps
+# through the --sessions levels. At each level that many simulated users run
+# concurrently for --duration seconds. Each user connects over the websocket
+# like a browser and works through one session:
+# - the first render;
+# - --moves slider moves on the predictor, then a Predict Diamond Price click;
+# - --chats messages to the expert chat;
+# with --think seconds of think time (exponential) between interactions, and
+# then starts a new one. Every question is unique, so each chat message
+# reaches the stub rather than the expert answer cache.
+#
+# Per level it reports completed sessions per second, latency percentiles per
+# interaction, the server CPU time per session and the server memory held per
+# concurrent session. The saturation point is the first level where the p95
+# slider latency exceeds --slo-ms, or sessions/sec grow less than 10% over the
+# previous level. The load generator runs on the same machine; its own CPU
+# share is printed so a saturated client can be told apart from a saturated
+# server.
+
+SLIDERS = {
+    'Carat Weight': (0.3, 3.0),
+    'Diamond Depth Percentage': (58.0, 65.0),
+    'Diamond Table Percentage': (53.0, 62.0),
+    'Diamond Length (X) in mm': (4.0, 9.0),
+    'Diamond Width (Y) in mm': (4.0, 9.0),
+    'Diamond Height (Z) in mm': (2.5, 5.5)
+}
+QUESTIONS = [
+    "Is a VS2 clarity diamond eye-clean?",
+    "How much does cut grade change the sparkle?",
+    "Are lab-grown diamonds a good investment?",
+    "What carat weight gives the best value for money?",
+    "How should I clean an engagement ring?"
+]
+INTERACTIONS = ('first_render', 'slider_move', 'predict_click', 'chat_message')
+CHAT_PLACEHOLDER = "Ask about diamonds..."
+SUCCESS = ('FINISHED_SUCCESSFULLY', 'FINISHED_FRAGMENT_RUN_SUCCESSFULLY')
+
+def resident_kib(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+# One simulated user's session; appends (interaction, seconds) to samples
+def run_session(url, args, rng, user, samples, errors):
+    def timed(name, action):
+        result = action()
+        if result.status not in SUCCESS:
+            raise RuntimeError(f"{name} ended with {result.status}")
+        samples.append((name, result.seconds))
+
+    def think():
+        if args.think:
+            time.sleep(rng.expovariate(1 / args.think))
+
+    try:
+        with StreamlitSession(url, timeout=args.timeout) as session:
+            timed('first_render', session.rerun)
+            for _ in range(args.moves):
+                think()
+                label = rng.choice(list(SLIDERS))
+                low, high = SLIDERS[label]
+                value = round(rng.uniform(low, high), 1)
+                timed('slider_move', lambda: session.set_slider(label, value))
+            think()
+            timed('predict_click', lambda: session.click('Predict Diamond Price'))
+            for i in range(args.chats):
+                think()
+                question = f"{rng.choice(QUESTIONS)} (user {user}, message {i + 1}, {rng.getrandbits(32):x})"
+                timed('chat_message', lambda: session.chat(question, CHAT_PLACEHOLDER))
+        return True
+    except Exception:
+        errors.append(1)
+        return False
+
+# Run `sessions` concurrent users for `duration` seconds against the server
+def run_level(server, url, sessions, args):
+    samples, errors, completed = [], [], []
+    deadline = time.monotonic() + args.duration
+    peak = [resident_kib(server.pid)]
+
+    def user(index):
+        rng = random.Random(args.seed * 1000 + sessions * 100 + index)
+        while time.monotonic() < deadline:
+            if run_session(url, args, rng, index, samples, errors):
+                completed.append(1)
+
+    def watch_memory():
+        while time.monotonic() < deadline:
+            peak[0] = max(peak[0], resident_kib(server.pid))
+            time.sleep(0.2)
+
+    idle_kib = resident_kib(server.pid)
+    cpu_before = process_cpu_seconds(server.pid)
+    client_cpu_before = time.process_time()
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(sessions)]
+    threads.append(threading.Thread(target=watch_memory))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server_cpu = process_cpu_seconds(server.pid) - cpu_before
+
+    latency = {}
+    for name in INTERACTIONS:
+        values = np.array([seconds for kind, seconds in samples if kind == name])
+        if len(values):
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+            latency[name] = {'count': len(values), 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99}
+    return {
+        'sessions': sessions,
+        'seconds': elapsed,
+        'completed': len(completed),
+        'errors': len(errors),
+        'sessions_per_s': len(completed) / elapsed,
+        'server_cpu_share': server_cpu / elapsed,
+        'client_cpu_share': (time.process_time() - client_cpu_before) / elapsed,
+        'cpu_ms_per_session': server_cpu * 1000 / len(completed) if completed else None,
+        'memory_kib_per_session': (peak[0] - idle_kib) / sessions,
+        'latency': latency
+    }
+
+# First level where slider latency breaks the SLO or throughput stops scaling
+def saturation_point(levels, slo_ms):
+    previous = None
+    for level in levels:
+        slider = level['latency'].get('slider_move')
+        if slider and slider['p95_ms'] > slo_ms:
+            return level['sessions'], f"slider p95 {slider['p95_ms']:.0f} ms > {slo_ms:.0f} ms"
+        if previous and level['sessions_per_s'] < previous['sessions_per_s'] * 1.1:
+            return level['sessions'], (f"{level['sessions_per_s']:.2f} sessions/s, "
+                                       f"under 10% above {previous['sessions']} sessions")
+        previous = level
+    return None, "not reached"
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Streamlit app with concurrent simulated sessions.")
+    parser.add_argument('--app', default='app.py')
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help="concurrent sessions at each step")
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds per step")
+    parser.add_argument('--moves', type=int, default=5, help="slider moves per session")
+    parser.add_argument('--chats', type=int, default=1, help="chat messages per session")
+    parser.add_argument('--think', type=float, default=0.5, help="mean think time between interactions (s)")
+    parser.add_argument('--llm-latency', type=float, default=0.8, help="stub seconds before the first chunk")
+    parser.add_argument('--llm-chunk-latency', type=float, default=0.05, help="stub seconds between chunks")
+    parser.add_argument('--slo-ms', type=float, default=250.0, help="p95 slider latency that counts as saturated")
+    parser.add_argument('--keep-delays', action='store_true', help="keep the app's artificial spinner delays")
+    parser.add_argument('--timeout', type=float, default=60.0, help="seconds to wait for one interaction")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    port = free_port()
+    workdir = tempfile.mkdtemp()
+    secrets_path = os.path.join(workdir, 'secrets.toml')
+    with open(secrets_path, 'w') as f:
+        f.write('GEMINI_API_KEY = "session-loadtest"\n')
+    env = {
+        'FAKE_GEMINI_LATENCY': str(args.llm_latency),
+        'FAKE_GEMINI_CHUNK_LATENCY': str(args.llm_chunk_latency),
+        'EXPERT_CACHE_PATH': os.path.join(workdir, 'expert_cache.sqlite3'),
+        'AUDIT_LOG': '1',
+        'AUDIT_LOG_DIR': os.path.join(workdir, 'audit_logs'),
+        'METRICS_PORT': '0'
+    }
+    if not args.keep_delays:
+        env['ARTIFICIAL_DELAYS'] = '0'
+    server = start_server(args.app, port, secrets_path, env)
+    url = f'ws://127.0.0.1:{port}/_stcore/stream'
+    try:
+        # Load the model, engine and comparables before the first step is timed
+        run_session(url, argparse.Namespace(**dict(vars(args), think=0.0)), random.Random(args.seed), 0, [], [])
+        baseline_kib = resident_kib(server.pid)
+        levels = [run_level(server, url, sessions, args) for sessions in args.sessions]
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    saturated_at, reason = saturation_point(levels, args.slo_ms)
+    if args.json:
+        print(json.dumps({'baseline_rss_kib': baseline_kib, 'levels': levels,
+                          'saturation': {'sessions': saturated_at, 'reason': reason}}, indent=2))
+        return
+
+    print(f"Server RSS after warm-up: {baseline_kib / 1024:.0f} MiB ({os.cpu_count()} CPUs)")
+    print(f"{'sessions':>8}{'done':>7}{'err':>5}{'sess/s':>8}{'cpu ms/sess':>12}{'KiB/sess':>10}{'srv cpu':>9}"
+          f"{'gen cpu':>9}  p50/p95 ms: slider   predict      chat")
+    for level in levels:
+        cpu = level['cpu_ms_per_session']
+        cells = []
+        for name in ('slider_move', 'predict_click', 'chat_message'):
+            stats = level['latency'].get(name)
+            cells.append(f"{stats['p50_ms']:>5.0f}/{stats['p95_ms']:<5.0f}" if stats else f"{'-':>11}")
+        print(f"{level['sessions']:>8}{level['completed']:>7}{level['errors']:>5}{level['sessions_per_s']:>8.2f}"
+              f"{cpu if cpu is not None else float('nan'):>12.0f}{level['memory_kib_per_session']:>10.0f}"
+              f"{level['server_cpu_share']:>9.0%}{level['client_cpu_share']:>9.0%}  {'  '.join(cells)}")
+    print(f"Saturation: {f'{saturated_at} sessions' if saturated_at else 'none'} ({reason})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+# Startup profile for the Streamlit app.
+#
+#   python startup_profile.py --label v1.3 --history startup_history.jsonl
+#
+# Reports, each measured in a fresh interpreter so nothing is already cached:
+#   - cold import time of every heavy dependency
+#   - time for the first script run to render (via streamlit's AppTest), both
+#     on its own and including the interpreter and streamlit startup
+#   - which heavy modules the first render pulled in (ideally none)
+# Appending each profile to a history file lets startup be tracked across releases.
+
+HEAVY_MODULES = ['streamlit', 'numpy', 'pandas', 'xgboost', 'google.generativeai', 'sklearn']
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+RENDER_SNIPPET = """
+import json, sys, time
+process_start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({app!r}, default_timeout=120)
+app.secrets["GEMINI_API_KEY"] = "startup-profile"
+render_start = time.perf_counter()
+app.run()
+done = time.perf_counter()
+print(json.dumps({{
+    'first_render_s': done - render_start,
+    'process_to_first_render_s': done - process_start,
+    'exceptions': [str(e.value) for e in app.exception],
+    'heavy_modules_loaded': [m for m in {heavy!r} if m in sys.modules and m != 'streamlit']
+}}))
+"""
+
+def run_python(code, env=None):
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'failed')
+    return result.stdout.strip().splitlines()[-1]
+
+def profile_imports():
+    timings = {}
+    for module in HEAVY_MODULES:
+        try:
+            timings[module] = float(run_python(IMPORT_SNIPPET.format(module=module)))
+        except RuntimeError as e:
+            timings[module] = f'unavailable: {e}'
+    return timings
+
+def profile_first_render(app_path, runs):
+    env = dict(os.environ, WARMUP_AFTER_FIRST_PAINT='0')
+    code = RENDER_SNIPPET.format(app=app_path, heavy=HEAVY_MODULES)
+    samples = [json.loads(run_python(code, env=env)) for _ in range(runs)]
+    best = min(samples, key=lambda sample: sample['process_to_first_render_s'])
+    best['runs'] = runs
+    return best
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile app startup: imports and time to first render.")
+    parser.add_argument('--app', default='app.py')
+    parser.add_argument('--runs', type=int, default=3, help="first-render samples; the fastest is kept")
+    parser.add_argument('--label', default=None, help="release label stored with the profile")
+    parser.add_argument('--history', default=None, help="JSON-lines file the profile is appended to")
+    args = parser.parse_args()
+
+    profile = {
+        'label': args.label,
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'imports_s': profile_imports(),
+        'first_render': profile_first_render(os.path.abspath(args.app), args.runs)
+    }
+
+    print("Cold import time:")
+    for module, seconds in profile['imports_s'].items():
+        print(f"  {module:<22} {seconds:.3f}s" if isinstance(seconds, float) else f"  {module:<22} {seconds}")
+    render = profile['first_render']
+    print(f"First render:            {render['first_render_s']:.3f}s")
+    print(f"Process to first render: {render['process_to_first_render_s']:.3f}s")
+    print(f"Heavy modules loaded:    {', '.join(render['heavy_modules_loaded']) or 'none'}")
+    if render['exceptions']:
+        print(f"Exceptions:              {render['exceptions']}")
+
+    if args.history:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(profile) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import time
+
+from websockets.sync.client import connect
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+# Headless client for a running `streamlit run` server.
+#
+# Speaks the same websocket protocol as the browser: it sends rerun requests
+# with widget states and reads ForwardMsgs until the script (or fragment) run
+# finishes. Widgets are discovered from the deltas and addressed by label
+# (chat inputs by placeholder). A widget inside an st.fragment is rerun the way
+# the frontend does it, by sending that fragment's id with the request.
+
+WIDGET_TYPES = ('slider', 'selectbox', 'button', 'chat_input', 'file_uploader', 'checkbox',
+                'radio', 'number_input', 'text_input', 'select_slider', 'button_group')
+
+class RunResult:
+    def __init__(self, seconds, payload_bytes, messages, status):
+        self.seconds = seconds
+        self.payload_bytes = payload_bytes
+        self.messages = messages
+        self.status = status
+
+    # Text of every markdown element delivered during the run
+    def markdown(self):
+        return [msg.delta.new_element.markdown.body for msg in self.messages
+                if msg.WhichOneof('type') == 'delta'
+                and msg.delta.WhichOneof('type') == 'new_element'
+                and msg.delta.new_element.WhichOneof('type') == 'markdown']
+
+class StreamlitSession:
+    def __init__(self, url='ws://127.0.0.1:8501/_stcore/stream', timeout=60.0):
+        self.timeout = timeout
+        self.widgets = {}
+        self._states = {}
+        self._ws = connect(url, subprotocols=['streamlit'], max_size=None, open_timeout=timeout)
+
+    def close(self):
+        self._ws.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Request a rerun of the whole script, or of one fragment, and wait for it to finish
+    def rerun(self, fragment_id='', extra_states=()):
+        msg = BackMsg()
+        msg.rerun_script.widget_states.widgets.extend(list(self._states.values()) + list(extra_states))
+        if fragment_id:
+            msg.rerun_script.fragment_id = fragment_id
+
+        start = time.perf_counter()
+        self._ws.send(msg.SerializeToString())
+        payload_bytes = 0
+        messages = []
+        while True:
+            data = self._ws.recv(timeout=self.timeout)
+            payload_bytes += len(data)
+            forward = ForwardMsg()
+            forward.ParseFromString(data)
+            messages.append(forward)
+            kind = forward.WhichOneof('type')
+            if kind == 'delta':
+                self._register_widget(forward)
+            elif kind == 'script_finished':
+                status = ForwardMsg.ScriptFinishedStatus.Name(forward.script_finished)
+                if status != 'FINISHED_EARLY_FOR_RERUN':
+                    return RunResult(time.perf_counter() - start, payload_bytes, messages, status)
+
+    def _register_widget(self, forward):
+        delta = forward.delta
+        if delta.WhichOneof('type') != 'new_element':
+            return
+        kind = delta.new_element.WhichOneof('type')
+        if kind not in WIDGET_TYPES:
+            return
+        element = getattr(delta.new_element, kind)
+        name = element.placeholder if kind == 'chat_input' else element.label
+        self.widgets[name] = {'id': element.id, 'type': kind, 'fragment_id': delta.fragment_id}
+
+    def _widget(self, name):
+        try:
+            return self.widgets[name]
+        except KeyError:
+            raise KeyError(f"No widget labelled {name!r}; known: {sorted(self.widgets)}") from None
+
+    def set_slider(self, label, value):
+        widget = self._widget(label)
+        state = WidgetState(id=widget['id'])
+        state.double_array_value.data[:] = [value]
+        self._states[widget['id']] = state
+        return self.rerun(widget['fragment_id'])
+
+    def set_selectbox(self, label, value):
+        widget = self._widget(label)
+        self._states[widget['id']] = WidgetState(id=widget['id'], string_value=value)
+        return self.rerun(widget['fragment_id'])
+
+    # Triggers (buttons, chat submissions) are only true for the run they start
+    def click(self, label):
+        widget = self._widget(label)
+        return self.rerun(widget['fragment_id'], [WidgetState(id=widget['id'], trigger_value=True)])
+
+    def chat(self, text, placeholder):
+        widget = self._widget(placeholder)
+        state = WidgetState(id=widget['id'])
+        state.chat_input_value.data = text
+        return self.rerun(widget['fragment_id'], [state])
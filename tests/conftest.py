@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_pipeline import FEATURE_COLUMNS, encode_features, stamp_schema
+
+# Shared fixtures: a small model trained on a sample of diamonds.csv with some
+# measurements knocked out, so every tree learns a default direction for
+# missing values, and a fixed batch of rows to score, missing values included.
+
+SAMPLE_ROWS = 4000
+MISSING_SHARE = 0.05
+
+@pytest.fixture(scope='session')
+def diamonds():
+    df = pd.read_csv('diamonds.csv', index_col=0).sample(SAMPLE_ROWS, random_state=0)
+    X = encode_features(df).to_numpy().copy()
+    rng = np.random.default_rng(0)
+    measurements = [FEATURE_COLUMNS.index(column) for column in ('carat', 'depth', 'table', 'x', 'y', 'z')]
+    for column in measurements:
+        X[rng.random(len(X)) < MISSING_SHARE, column] = np.nan
+    return X, df['price'].to_numpy(dtype='float32')
+
+# Rows to compare engines on: held-out-like rows, rows with one missing
+# measurement each, and a row missing every measurement
+@pytest.fixture(scope='session')
+def sample_rows(diamonds):
+    X = diamonds[0][:200].copy()
+    X[np.isnan(X)] = 1.0
+    for i, column in enumerate((0, 4, 5, 6, 7, 8)):
+        X[10 * i:10 * i + 10, column] = np.nan
+    X[-1, [0, 4, 5, 6, 7, 8]] = np.nan
+    return X
+
+# xgb_model.json-style model files; base_score None lets xgboost estimate it
+@pytest.fixture(scope='session', params=[None, 1500.0], ids=['estimated_base', 'fixed_base'])
+def model_path(request, diamonds, tmp_path_factory):
+    from xgboost import XGBRegressor
+
+    X, y = diamonds
+    model = XGBRegressor(n_estimators=40, max_depth=5, learning_rate=0.3, tree_method='hist', random_state=0,
+                         n_jobs=1, base_score=request.param)
+    model.fit(pd.DataFrame(X, columns=FEATURE_COLUMNS), y)
+    stamp_schema(model.get_booster())
+    path = tmp_path_factory.mktemp('model') / 'xgb_model.json'
+    model.save_model(path)
+    return str(path)
+
+@pytest.fixture(scope='session')
+def booster(model_path):
+    import xgboost as xgb
+
+    return xgb.Booster(model_file=model_path)
@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+import audit_log
+from audit_log import AuditLog, DIAMONDS_COLUMNS, replay_rows, write_diamonds_csv
+
+# Replayed valuations are estimates, so they go to a separate file and never
+# into the training dataset
+
+INPUTS = {'carat': 1.01, 'cut': 'Ideal', 'color': 'G', 'clarity': 'VS2', 'depth': 61.5, 'table': 56.0,
+          'x': 6.4, 'y': 6.45, 'z': 3.95}
+
+@pytest.fixture
+def audit_dir(tmp_path):
+    directory = tmp_path / 'audit_logs'
+    audit = AuditLog(str(directory))
+    audit.record(INPUTS, 'abc123', 5120.4, {'USD': 5120.4}, 0.002)
+    audit.record(dict(INPUTS, carat=0.5), 'abc123', 1500.6, {'USD': 1500.6}, 0.002)
+    audit.close()
+    return str(directory)
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / 'diamonds.csv'
+    path.write_text('"","carat"\n1,0.23\n')
+    return path
+
+def test_replay_writes_a_separate_file(audit_dir, dataset, tmp_path):
+    out = tmp_path / 'audited.csv'
+    write_diamonds_csv(replay_rows(audit_dir), out, dataset)
+    written = pd.read_csv(out, index_col=0)
+    assert list(written.columns) == DIAMONDS_COLUMNS
+    assert sorted(written['price']) == [1501, 5120]
+    assert dataset.read_text() == '"","carat"\n1,0.23\n'
+
+def test_replay_refuses_the_dataset(audit_dir, dataset, tmp_path):
+    link = tmp_path / 'link.csv'
+    os.symlink(dataset, link)
+    for path in (dataset, link, tmp_path / '.' / 'diamonds.csv'):
+        with pytest.raises(ValueError, match='training dataset'):
+            write_diamonds_csv(replay_rows(audit_dir), path, dataset)
+    assert dataset.read_text() == '"","carat"\n1,0.23\n'
+
+def test_replay_command_refuses_the_dataset(audit_dir, dataset, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['audit_log.py', '--dir', audit_dir, 'replay', '--out', str(dataset),
+                                      '--data', str(dataset)])
+    with pytest.raises(SystemExit) as exit_info:
+        audit_log.main()
+    assert exit_info.value.code == 2
+    assert dataset.read_text() == '"","carat"\n1,0.23\n'
+
+def test_replay_has_no_append(audit_dir, dataset, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['audit_log.py', '--dir', audit_dir, 'replay', '--append', str(dataset)])
+    with pytest.raises(SystemExit):
+        audit_log.main()
+    assert dataset.read_text() == '"","carat"\n1,0.23\n'
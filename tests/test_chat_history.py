@@ -0,0 +1,109 @@
+import pytest
+
+import chat_history
+from chat_history import CHARS_PER_TOKEN, ChatHistory, estimate_tokens
+
+# Token budgeting, the incremental summary, the message bound and paging
+
+# A message of exactly `tokens` estimated tokens, opening with a sentence naming it
+def message(name, tokens):
+    text = f"{name}. "
+    return text + 'x' * (tokens * CHARS_PER_TOKEN - len(text))
+
+@pytest.fixture
+def summarized(monkeypatch):
+    calls = []
+    real = chat_history.summarize_message
+
+    def counting(message):
+        calls.append(message['content'].split('.')[0])
+        return real(message)
+
+    monkeypatch.setattr(chat_history, 'summarize_message', counting)
+    return calls
+
+def test_message_sizes():
+    assert estimate_tokens(message('m0', 10)) == 10
+    assert estimate_tokens('') == 1
+
+def test_messages_that_exactly_fill_the_budget_stay_verbatim():
+    history = ChatHistory(token_budget=100, summary_budget=20)
+    for i in range(10):
+        history.append('user' if i % 2 == 0 else 'assistant', message(f'm{i}', 10))
+    summary, recent = history.context()
+    assert summary == ''
+    assert len(recent) == 10
+
+def test_one_token_over_the_budget_starts_the_summary():
+    history = ChatHistory(token_budget=100, summary_budget=20)
+    for i in range(9):
+        history.append('user', message(f'm{i}', 10))
+    history.append('user', message('m9', 11))
+    summary, recent = history.context()
+    # summary_budget is reserved once anything is summarized: 80 tokens verbatim
+    assert [m['content'].split('.')[0] for m in recent] == ['m3', 'm4', 'm5', 'm6', 'm7', 'm8', 'm9']
+    assert summary.splitlines() == ['User asked: m0.', 'User asked: m1.', 'User asked: m2.']
+
+def test_each_message_is_summarized_exactly_once(summarized):
+    history = ChatHistory(token_budget=60, summary_budget=1000)
+    for i in range(30):
+        history.append('user' if i % 2 == 0 else 'assistant', message(f'm{i}', 10))
+        history.context()
+        history.context()
+    assert len(summarized) == len(set(summarized))
+    summary, recent = history.context()
+    assert summarized == [f'm{i}' for i in range(30 - len(recent))]
+    assert len(summary.splitlines()) == len(summarized)
+
+def test_summarized_messages_are_never_repeated_verbatim():
+    history = ChatHistory(token_budget=60, summary_budget=20)
+    for i in range(6):
+        history.append('user', message(f'm{i}', 10))
+    history.append('user', message('long', 35))
+    _, recent = history.context()
+    assert [m['content'].split('.')[0] for m in recent] == ['long']
+    # A later, larger budget must not pull summarized messages back in
+    history.token_budget = 10000
+    _, recent = history.context()
+    assert [m['content'].split('.')[0] for m in recent] == ['long']
+
+def test_summary_stays_within_its_budget():
+    history = ChatHistory(token_budget=40, summary_budget=30)
+    for i in range(50):
+        history.append('user', message(f'm{i}', 10))
+        summary, recent = history.context()
+    assert history._summary_tokens <= 30
+    assert sum(estimate_tokens(line) for line in summary.splitlines()) == history._summary_tokens
+    # The oldest lines were dropped; the newest runs up to the first verbatim message
+    first_recent = int(recent[0]['content'].split('.')[0][1:])
+    assert summary.splitlines()[-1] == f'User asked: m{first_recent - 1}.'
+    assert not summary.startswith('User asked: m0.')
+
+def test_max_messages_bounds_the_history_and_summarizes_evictions(summarized):
+    history = ChatHistory(token_budget=10000, summary_budget=1000, max_messages=5)
+    for i in range(12):
+        history.append('user', message(f'm{i}', 10))
+    assert len(history) == 5
+    assert history.total == 12 and history.first_index == 7
+    assert summarized == [f'm{i}' for i in range(7)]
+    summary, recent = history.context()
+    assert len(summary.splitlines()) == 7
+    assert [m['content'].split('.')[0] for m in recent] == [f'm{i}' for i in range(7, 12)]
+    assert len(summarized) == 7
+
+def test_pages_count_back_from_the_newest():
+    history = ChatHistory(max_messages=10)
+    for i in range(13):
+        history.append('user', f'm{i}')
+    assert history.pages(4) == 3
+    newest, first = history.page(0, 4)
+    assert [m['content'] for m in newest] == ['m9', 'm10', 'm11', 'm12'] and first == 9
+    oldest, first = history.page(2, 4)
+    assert [m['content'] for m in oldest] == ['m3', 'm4'] and first == 3
+    assert history.page(3, 4) == ([], 3)
+
+def test_empty_history_has_one_empty_page():
+    history = ChatHistory()
+    assert history.pages(20) == 1
+    assert history.page(0, 20) == ([], 0)
+    assert history.context_text() == ''
@@ -0,0 +1,62 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from tree_engine import COMPACT_MAGIC, TreeEnsemble, load_tree_ensemble
+
+# The compact binary form must load back to the model it was saved from, and
+# reject files it cannot read with a clear error rather than garbage arrays
+
+@pytest.fixture
+def compact_path(model_path, tmp_path):
+    path = tmp_path / 'model.trees'
+    TreeEnsemble.from_json(model_path).save_compact(path)
+    return path
+
+def test_round_trip_predicts_identically(model_path, compact_path, sample_rows):
+    original = load_tree_ensemble(model_path)
+    compact = load_tree_ensemble(compact_path)
+    assert compact.n_trees == original.n_trees
+    np.testing.assert_array_equal(compact.predict(sample_rows), original.predict(sample_rows))
+    np.testing.assert_array_equal([compact.predict_row(row) for row in sample_rows[:20]],
+                                  [original.predict_row(row) for row in sample_rows[:20]])
+
+def test_round_trip_explains_identically(model_path, compact_path, sample_rows):
+    original = load_tree_ensemble(model_path)
+    compact = load_tree_ensemble(compact_path)
+    np.testing.assert_allclose(compact.explain(sample_rows), original.explain(sample_rows), rtol=1e-6, atol=1e-6)
+
+def test_float16_leaves_stay_close(model_path, tmp_path, sample_rows):
+    original = load_tree_ensemble(model_path)
+    path = tmp_path / 'model.trees'
+    original.save_compact(path, leaves='float16')
+    np.testing.assert_allclose(load_tree_ensemble(path).predict(sample_rows), original.predict(sample_rows),
+                               rtol=1e-2)
+
+@pytest.mark.parametrize('keep', [10, 60, 200, 1000])
+def test_truncated_file_raises(compact_path, tmp_path, keep):
+    raw = compact_path.read_bytes()
+    truncated = tmp_path / 'truncated.trees'
+    truncated.write_bytes(raw[:keep])
+    with pytest.raises(ValueError, match='truncated'):
+        TreeEnsemble.from_compact(truncated)
+
+def test_wrong_format_version_raises(compact_path, tmp_path):
+    raw = compact_path.read_bytes()
+    offset = len(COMPACT_MAGIC)
+    length = struct.unpack_from('<I', raw, offset)[0]
+    header = json.loads(raw[offset + 4:offset + 4 + length])
+    header['format'] = 2
+    # Same length, so the array offsets still line up
+    header_bytes = json.dumps(header).encode()
+    assert len(header_bytes) == length
+    newer = tmp_path / 'newer.trees'
+    newer.write_bytes(raw[:offset + 4] + header_bytes + raw[offset + 4 + length:])
+    with pytest.raises(ValueError, match='format 2'):
+        TreeEnsemble.from_compact(newer)
+
+def test_json_model_is_not_compact(model_path):
+    with pytest.raises(ValueError, match='not a compact'):
+        TreeEnsemble.from_compact(model_path)
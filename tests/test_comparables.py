@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from comparables import ComparablesIndex
+from dataset_cache import load_dataset
+
+QUERIES = [
+    (1.0, 'Ideal', 'G', 'VS2', 61.5, 57.0, 6.4, 6.4, 3.9),
+    (0.3, 'Premium', 'E', 'SI1', 60.0, 59.0, 4.3, 4.3, 2.6),
+    # Slider combinations no real stone has
+    (9.5, 'Fair', 'D', 'IF', 45.0, 75.0, 0.1, 30.0, 0.1),
+    (0.1, 'Very Good', 'J', 'I1', 75.0, 45.0, 30.0, 0.1, 30.0)
+]
+
+@pytest.fixture(scope='module')
+def dataset():
+    return load_dataset()
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_scanned_partitions_match_the_kd_tree(dataset, query):
+    scanned = ComparablesIndex(dataset).query(*query, k=8)
+    searched = ComparablesIndex(dataset, scan_rows=0).query(*query, k=8)
+    assert len(scanned) == len(searched) > 0
+    for a, b in zip(scanned, searched):
+        assert a['distance'] == pytest.approx(b['distance'])
+    # Stones at equal distances may come in either order, or be cut at k
+    last = scanned[-1]['distance'] - 1e-9
+    assert sorted(m['price'] for m in scanned if m['distance'] < last) == \
+        sorted(m['price'] for m in searched if m['distance'] < last)
+
+def test_matches_share_the_grades_and_are_nearest_first(dataset):
+    matches = ComparablesIndex(dataset).query(*QUERIES[0], k=5)
+    assert len(matches) == 5
+    assert {(m['cut'], m['color'], m['clarity']) for m in matches} == {('Ideal', 'G', 'VS2')}
+    distances = [m['distance'] for m in matches]
+    assert distances == sorted(distances)
+
+def test_small_partitions_return_what_they_have(dataset):
+    index = ComparablesIndex(dataset)
+    smallest = min(index._partitions.values(), key=lambda partition: partition[1] - partition[0])
+    size = smallest[1] - smallest[0]
+    frame = dataset.to_frame(decode=True).iloc[index._rows[smallest[0]:smallest[1]]]
+    stone = frame.iloc[0]
+    matches = index.query(*(stone[column] for column in ('carat', 'cut', 'color', 'clarity', 'depth', 'table',
+                                                         'x', 'y', 'z')), k=size + 10)
+    assert len(matches) == size
+    assert matches[0]['distance'] == pytest.approx(0.0, abs=1e-6)
+    with pytest.raises(ValueError):
+        index.query(1.0, 'Superb', 'G', 'VS2', 61.5, 57.0, 6.4, 6.4, 3.9)
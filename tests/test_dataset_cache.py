@@ -0,0 +1,91 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset_cache
+from dataset_cache import POINTER_FILE, build_dataset_cache, current_generation, load_dataset
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'diamonds.csv'
+    pd.read_csv('diamonds.csv', index_col=0, nrows=2000).to_csv(path)
+    return str(path)
+
+def test_cache_matches_the_csv(csv_path, tmp_path):
+    dataset = load_dataset(csv_path, str(tmp_path / 'cache'))
+    df = pd.read_csv(csv_path, index_col=0)
+    assert len(dataset) == len(df)
+    np.testing.assert_array_equal(dataset['price'], df['price'])
+    np.testing.assert_allclose(dataset['carat'], df['carat'], rtol=1e-6)
+    assert (dataset.to_frame(decode=True)['cut'].to_numpy() == df['cut'].to_numpy()).all()
+
+def test_changed_csv_publishes_a_new_generation(csv_path, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    first = load_dataset(csv_path, cache_dir)
+    generation = current_generation(cache_dir)
+    assert load_dataset(csv_path, cache_dir).meta == first.meta
+    assert current_generation(cache_dir) == generation
+
+    pd.read_csv(csv_path, index_col=0).head(1500).to_csv(csv_path)
+    second = load_dataset(csv_path, cache_dir)
+    assert len(second) == 1500
+    assert current_generation(cache_dir) != generation
+    # The superseded generation is kept for readers that still hold it
+    assert os.path.isdir(generation)
+    assert len(first['price']) == 2000
+
+def test_stale_generations_are_removed_but_mapped_columns_stay_readable(csv_path, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    monkeypatch.setattr(dataset_cache, 'STALE_SECONDS', -1)
+    old = load_dataset(csv_path, cache_dir)
+    old_generation = current_generation(cache_dir)
+    build_dataset_cache(csv_path, cache_dir)
+    assert not os.path.exists(old_generation)
+    assert [name for name in os.listdir(cache_dir) if name.startswith('gen-')] == \
+        [os.path.basename(current_generation(cache_dir))]
+    assert int(old['price'].sum()) == int(pd.read_csv(csv_path)['price'].sum())
+
+def test_concurrent_builders_and_readers(csv_path, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    monkeypatch.setattr(dataset_cache, 'STALE_SECONDS', 0.05)
+    expected = int(pd.read_csv(csv_path)['price'].sum())
+    load_dataset(csv_path, cache_dir)
+    errors = []
+    stop = threading.Event()
+
+    def builder():
+        try:
+            for _ in range(5):
+                build_dataset_cache(csv_path, cache_dir)
+        except Exception as e:
+            errors.append(e)
+
+    def reader():
+        try:
+            while not stop.is_set():
+                assert int(load_dataset(csv_path, cache_dir)['price'].sum()) == expected
+        except Exception as e:
+            errors.append(e)
+
+    builders = [threading.Thread(target=builder) for _ in range(3)]
+    readers = [threading.Thread(target=reader) for _ in range(3)]
+    for thread in builders + readers:
+        thread.start()
+    for thread in builders:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    assert errors == []
+    assert not [name for name in os.listdir(cache_dir) if name.startswith(POINTER_FILE + '.')]
+
+def test_files_of_the_flat_layout_are_cleaned_up(csv_path, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir()
+    (cache_dir / 'meta.json').write_text('{"format": 1}')
+    np.save(cache_dir / 'price.npy', np.zeros(3))
+    assert len(load_dataset(csv_path, str(cache_dir))) == 2000
+    assert sorted(name for name in os.listdir(cache_dir) if not name.startswith('gen-')) == [POINTER_FILE]
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+import expert_advisor
+from expert_advisor import FALLBACK_MESSAGE, stream_expert
+from fake_gemini import FakeGenerativeModel, FakeUpstreamError
+from knowledge_index import build_knowledge_index
+from llm_client import AsyncLLMClient
+from response_cache import ResponseCache
+
+ANSWER = "Cut grade drives sparkle more than any other factor in the 4Cs."
+
+# A fake whose stream breaks after `good_chunks` chunks
+class BrokenStreamModel(FakeGenerativeModel):
+    def __init__(self, good_chunks, **kwargs):
+        super().__init__(**kwargs)
+        self.good_chunks = good_chunks
+
+    def _chunks(self, text):
+        for i, chunk in enumerate(super()._chunks(text)):
+            if i == self.good_chunks:
+                raise FakeUpstreamError("connection reset mid-stream")
+            yield chunk
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'expert_cache.sqlite3'))
+    yield cache
+    cache.close()
+
+# Chunks with the time each arrived, in seconds since the call
+def collect(chunks):
+    start = time.perf_counter()
+    return [(chunk, time.perf_counter() - start) for chunk in chunks]
+
+def test_chunks_arrive_in_order_as_they_stream(cache):
+    model = FakeGenerativeModel(answer=ANSWER, chunk_words=2, latency=0.1, chunk_latency=0.05)
+    client = AsyncLLMClient(model)
+    timings = {}
+    received = collect(stream_expert(client, "Why does cut matter?", cache=cache, timings=timings))
+    texts = [text for text, _ in received]
+    assert ''.join(texts) == ANSWER
+    assert texts == list(model._chunks(ANSWER))
+    # The first chunk is shown at the model's first-token latency, not after the whole answer
+    first_arrival, last_arrival = received[0][1], received[-1][1]
+    assert 0.1 <= first_arrival < last_arrival - 0.2
+    assert 0.1 <= timings['first_token'] < timings['total'] - 0.2
+    assert timings['total'] >= last_arrival - 0.01
+
+def test_complete_answer_is_cached_and_replayed_as_one_chunk(cache):
+    model = FakeGenerativeModel(answer=ANSWER, chunk_words=2)
+    assert ''.join(stream_expert(model, "Why does cut matter?", cache=cache)) == ANSWER
+    timings = {}
+    assert list(stream_expert(model, "why does cut matter", cache=cache, timings=timings)) == [ANSWER]
+    assert model.calls == 1
+    assert timings['first_token'] == timings['total']
+
+def test_error_mid_stream_keeps_the_partial_answer(cache):
+    model = BrokenStreamModel(good_chunks=2, answer=ANSWER, chunk_words=2)
+    fallbacks = expert_advisor.fallbacks['stream'].value
+    timings = {}
+    texts = list(stream_expert(AsyncLLMClient(model, retries=2), "Why does cut matter?", cache=cache,
+                               timings=timings))
+    assert texts[:2] == list(FakeGenerativeModel(chunk_words=2)._chunks(ANSWER))[:2]
+    assert texts[2] == "\n\n" + FALLBACK_MESSAGE.format(error="connection reset mid-stream")
+    assert len(texts) == 3
+    # No retry once text has been shown, and a broken answer is never cached
+    assert model.calls == 1
+    assert expert_advisor.fallbacks['stream'].value == fallbacks + 1
+    assert timings['first_token'] <= timings['total']
+    assert cache.stats()['size'] == 0
+
+def test_error_before_the_first_chunk_is_retried_then_reported(cache):
+    model = FakeGenerativeModel(answer=ANSWER, failure_rate=1.0)
+    texts = list(stream_expert(AsyncLLMClient(model, retries=1, backoff=0.001), "Why does cut matter?",
+                               cache=cache))
+    assert texts == [FALLBACK_MESSAGE.format(error="injected upstream failure")]
+    assert model.calls == 2
+    assert cache.stats()['size'] == 0
+
+def test_local_answers_skip_the_model():
+    model = FakeGenerativeModel(answer=ANSWER)
+    timings = {}
+    texts = list(stream_expert(model, "What does VS2 clarity mean?", timings=timings,
+                               knowledge=build_knowledge_index()))
+    assert len(texts) == 1 and 'VS2' in texts[0]
+    assert timings['route'] == 'local'
+    assert model.calls == 0
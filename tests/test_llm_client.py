@@ -0,0 +1,163 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+import llm_client
+from fake_gemini import FakeGenerativeModel, FakeUpstreamError
+from llm_client import AsyncLLMClient
+
+# The client's limits, driven against the offline stand-in for Gemini
+
+# A fake that records how many calls are upstream at once and which were
+# cancelled; delays, if given, set the latency of each call in turn
+class InstrumentedModel(FakeGenerativeModel):
+    def __init__(self, delays=None, **kwargs):
+        super().__init__(**kwargs)
+        self.delays = delays
+        self.in_flight = 0
+        self.peak = 0
+        self.cancelled = 0
+
+    async def generate_content_async(self, contents, **kwargs):
+        if self.delays is not None:
+            self.latency = self.delays[self.calls]
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            return await super().generate_content_async(contents, **kwargs)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+# Backoff draws always take the upper bound, and every bound is recorded
+@pytest.fixture
+def backoff_bounds(monkeypatch):
+    bounds = []
+
+    def uniform(low, high):
+        bounds.append((low, high))
+        return high
+
+    monkeypatch.setattr(llm_client, 'random', types.SimpleNamespace(uniform=uniform))
+    return bounds
+
+def test_deadline_raises_timeout():
+    client = AsyncLLMClient(FakeGenerativeModel(latency=2.0), timeout=0.1)
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        asyncio.run(client.generate("User question: slow"))
+    assert time.perf_counter() - start < 1.0
+    assert client.stats()['timeouts'] == 1
+
+def test_deadline_covers_time_queued_for_a_slot():
+    client = AsyncLLMClient(FakeGenerativeModel(latency=0.3), max_concurrency=1, timeout=0.2)
+
+    async def run():
+        return await asyncio.gather(*(client.generate(f"User question: {i}") for i in range(2)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, TimeoutError) for result in results)
+    assert client.stats()['timeouts'] == 2
+
+def test_retries_stop_at_the_limit(backoff_bounds):
+    model = FakeGenerativeModel(failure_rate=1.0)
+    client = AsyncLLMClient(model, retries=2, backoff=0.01, max_backoff=0.015)
+    with pytest.raises(FakeUpstreamError):
+        asyncio.run(client.generate("User question: flaky"))
+    assert model.calls == 3
+    stats = client.stats()
+    assert (stats['retries'], stats['failures'], stats['successes']) == (2, 1, 0)
+    # Full jitter: each delay is drawn from zero up to the exponential backoff, capped
+    assert backoff_bounds == [(0, 0.01), (0, 0.015)]
+
+def test_retries_stop_at_the_deadline(backoff_bounds):
+    model = FakeGenerativeModel(failure_rate=1.0)
+    client = AsyncLLMClient(model, retries=5, backoff=1.0, timeout=0.5)
+    start = time.perf_counter()
+    with pytest.raises(FakeUpstreamError):
+        asyncio.run(client.generate("User question: flaky"))
+    # A backoff that would overrun the deadline is not waited out
+    assert model.calls == 1
+    assert time.perf_counter() - start < 0.4
+
+def test_retry_recovers_from_a_transient_failure(backoff_bounds):
+    model = FakeGenerativeModel(failure_rate=0.5, seed=1)
+    client = AsyncLLMClient(model, retries=10, backoff=0.001)
+    response = asyncio.run(client.generate("User question: eventually"))
+    assert response.text == "DiamondGenius (offline) on: eventually"
+    assert client.stats()['retries'] == model.failures > 0
+
+def test_hedge_wins_and_cancels_the_primary():
+    model = InstrumentedModel(delays=[2.0, 0.05])
+    client = AsyncLLMClient(model, hedge_after=0.1)
+
+    async def run():
+        start = time.perf_counter()
+        response = await client.generate("User question: hedged")
+        elapsed = time.perf_counter() - start
+        await asyncio.sleep(0.05)
+        return response, elapsed
+
+    response, elapsed = asyncio.run(run())
+    assert response.text.endswith("hedged")
+    assert elapsed < 1.0
+    assert (model.calls, model.cancelled, model.in_flight) == (2, 1, 0)
+    stats = client.stats()
+    assert (stats['hedges'], stats['hedge_wins']) == (1, 1)
+
+def test_primary_wins_and_cancels_the_hedge():
+    model = InstrumentedModel(delays=[0.2, 2.0])
+    client = AsyncLLMClient(model, hedge_after=0.1)
+
+    async def run():
+        response = await client.generate("User question: hedged")
+        await asyncio.sleep(0.05)
+        return response
+
+    asyncio.run(run())
+    assert (model.calls, model.cancelled, model.in_flight) == (2, 1, 0)
+    stats = client.stats()
+    assert (stats['hedges'], stats['hedge_wins']) == (1, 0)
+
+def test_no_hedge_when_the_primary_is_fast():
+    model = InstrumentedModel(latency=0.01)
+    client = AsyncLLMClient(model, hedge_after=0.5)
+    asyncio.run(client.generate("User question: quick"))
+    assert model.calls == 1
+    assert client.stats()['hedges'] == 0
+
+def test_concurrency_never_exceeds_the_semaphore():
+    model = InstrumentedModel(latency=0.05)
+    client = AsyncLLMClient(model, max_concurrency=3, hedge_after=0.01)
+
+    async def run():
+        return await asyncio.gather(*(client.generate(f"User question: {i}") for i in range(12)))
+
+    responses = asyncio.run(run())
+    assert len(responses) == 12
+    # Hedges take slots too, so they cannot push past the limit
+    assert model.peak == 3
+    assert client.stats()['queue_p99_ms'] > 0
+
+def test_token_bucket_limits_the_request_rate():
+    client = AsyncLLMClient(FakeGenerativeModel(), rate_limit=20, burst=1)
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*(client.generate(f"User question: {i}") for i in range(6)))
+        return time.perf_counter() - start
+
+    # One token up front, then one every 50 ms
+    assert asyncio.run(run()) >= 0.24
+
+def test_sync_facade_streams_from_threads():
+    model = FakeGenerativeModel(chunk_words=2, answer="one two three four five")
+    client = AsyncLLMClient(model)
+    chunks = [chunk.text for chunk in client.generate_content("User question: stream", stream=True)]
+    assert chunks == ["one two ", "three four ", "five"]
+    assert client.generate_content("User question: whole").text == "one two three four five"
@@ -0,0 +1,74 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset_cache
+from market_cube import build_market_cube, load_market_cube
+
+ARRAYS = ('offsets', 'prices', 'per_carat', 'price_percentiles', 'per_carat_percentiles')
+
+# A 3000-row copy of diamonds.csv in a scratch directory, which also holds the dataset cache
+@pytest.fixture
+def csv_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'diamonds.csv')
+    pd.read_csv(os.path.abspath('diamonds.csv'), index_col=0, nrows=3000).to_csv(path)
+    monkeypatch.chdir(tmp_path)
+    return path
+
+# Stones must match exactly; interpolated percentiles to float32 rounding
+def assert_same_cube(a, b):
+    for name in ARRAYS[:3]:
+        np.testing.assert_array_equal(getattr(a, name), getattr(b, name), err_msg=name)
+    for name in ARRAYS[3:]:
+        np.testing.assert_allclose(getattr(a, name), getattr(b, name), rtol=1e-6, err_msg=name)
+
+def test_appended_rows_update_the_cube_like_a_rebuild(csv_path, tmp_path):
+    df = pd.read_csv(csv_path, index_col=0)
+    df.head(2000).to_csv(csv_path)
+    load_market_cube(csv_path, str(tmp_path / 'cube'))
+    df.to_csv(csv_path)
+    updated = load_market_cube(csv_path, str(tmp_path / 'cube'))
+    assert updated.meta['build'].startswith('appended 1000 rows')
+    rebuilt = build_market_cube(dataset_cache.load_dataset(csv_path), str(tmp_path / 'rebuilt'))
+    assert_same_cube(updated, rebuilt)
+    # And the update is what the next reader loads
+    assert_same_cube(load_market_cube(csv_path, str(tmp_path / 'cube')), rebuilt)
+
+def test_concurrent_builders_and_readers(csv_path, tmp_path, monkeypatch):
+    cube_dir = str(tmp_path / 'cube')
+    monkeypatch.setattr(dataset_cache, 'STALE_SECONDS', 0.05)
+    expected = load_market_cube(csv_path, cube_dir)
+    dataset = dataset_cache.load_dataset(csv_path)
+    errors = []
+    stop = threading.Event()
+
+    def builder():
+        try:
+            for _ in range(5):
+                build_market_cube(dataset, cube_dir)
+        except Exception as e:
+            errors.append(e)
+
+    def reader():
+        try:
+            while not stop.is_set():
+                cube = load_market_cube(csv_path, cube_dir)
+                assert cube.meta['rows'] == expected.meta['rows']
+                np.testing.assert_array_equal(cube.price_percentiles, expected.price_percentiles)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=builder) for _ in range(3)]
+    readers = [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads + readers:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    assert errors == []
+    assert_same_cube(load_market_cube(csv_path, cube_dir), expected)
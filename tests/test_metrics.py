@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+import metrics
+from metrics import REGISTRY, recent_traces, span
+
+# Spans time every use into the histogram, and build traces only for the
+# roots tracing picks
+
+@pytest.fixture(autouse=True)
+def tracing():
+    previous = metrics.set_tracing(0)
+    REGISTRY.traces.clear()
+    yield metrics.set_tracing
+    metrics.set_tracing(previous)
+
+def test_every_span_reaches_the_histogram():
+    stage = span('test_histogram_stage')
+    before = stage.histogram.count
+    uses = metrics.Span.FOLD_SAMPLES + 10
+    for _ in range(uses):
+        with stage:
+            pass
+    REGISTRY.render()
+    assert stage.histogram.count - before == uses
+
+def test_untraced_roots_build_no_trace():
+    with span('test_root'):
+        with span('test_child'):
+            pass
+    assert recent_traces() == []
+
+def test_traced_root_keeps_its_children(tracing):
+    tracing(1)
+    with span('test_root'):
+        with span('test_child'):
+            with span('test_grandchild'):
+                pass
+        with pytest.raises(KeyError):
+            with span('test_failing'):
+                raise KeyError
+    [trace] = recent_traces()
+    assert trace['name'] == 'test_root' and trace['error'] is None
+    assert [(child['name'], child['depth']) for child in trace['spans']] == [
+        ('test_child', 1), ('test_grandchild', 2), ('test_failing', 1)]
+
+def test_one_root_in_every_n_is_traced(tracing):
+    tracing(4)
+    for _ in range(40):
+        with span('test_sampled_root'):
+            with span('test_child'):
+                pass
+    assert len(recent_traces()) == 10
+    assert all(len(trace['spans']) == 1 for trace in recent_traces())
+
+def test_threads_nest_separately(tracing):
+    tracing(1)
+    barrier = threading.Barrier(2)
+
+    def work(name):
+        with span(name):
+            barrier.wait()
+            with span(f'{name}_child'):
+                barrier.wait()
+
+    threads = [threading.Thread(target=work, args=(f'test_thread_{i}',)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted((trace['name'], [child['name'] for child in trace['spans']]) for trace in recent_traces()) == [
+        ('test_thread_0', ['test_thread_0_child']), ('test_thread_1', ['test_thread_1_child'])]
+
+def test_metrics_server_turns_tracing_on(monkeypatch):
+    monkeypatch.setattr(metrics, '_server', None)
+    server = metrics.start_metrics_server(0)
+    try:
+        assert metrics.set_tracing(0) == metrics.TRACE_EVERY
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from pricing_service import MicroBatcher
+
+# The batcher coalesces concurrent requests into one predict call, bounded by
+# max_batch rows and max_wait seconds, and isolates a request that breaks its
+# batch. A fake predict function prices each row as its 'id' times ten.
+
+class FakePredict:
+    def __init__(self, gate=None):
+        self.calls = []
+        self.gate = gate
+
+    def __call__(self, rows):
+        self.calls.append([row['id'] for row in rows])
+        if self.gate is not None and len(self.calls) == 1:
+            self.gate.wait(5)
+        if any(row.get('bad') for row in rows):
+            raise ValueError("z must be positive")
+        return np.array([row['id'] * 10.0 for row in rows])
+
+class Stats:
+    def __init__(self):
+        self.batches = []
+
+    def record_batch(self, size):
+        self.batches.append(size)
+
+def rows(*ids, bad=False):
+    return [{'id': i, 'bad': bad} for i in ids]
+
+def test_concurrent_requests_share_one_call():
+    predict, stats = FakePredict(), Stats()
+    batcher = MicroBatcher(predict, max_batch=6, max_wait=1.0, stats=stats)
+    start = time.monotonic()
+    futures = [batcher.submit(rows(2 * i, 2 * i + 1)) for i in range(3)]
+    results = [future.result(timeout=5) for future in futures]
+    # Reaching max_batch flushes without waiting out max_wait
+    assert time.monotonic() - start < 0.5
+    assert predict.calls == [[0, 1, 2, 3, 4, 5]]
+    assert [list(result) for result in results] == [[0.0, 10.0], [20.0, 30.0], [40.0, 50.0]]
+    assert stats.batches == [6]
+
+def test_lone_request_waits_at_most_max_wait():
+    predict = FakePredict()
+    batcher = MicroBatcher(predict, max_batch=100, max_wait=0.05)
+    start = time.monotonic()
+    assert list(batcher.submit(rows(7)).result(timeout=5)) == [70.0]
+    elapsed = time.monotonic() - start
+    assert 0.04 <= elapsed < 1.0
+    assert predict.calls == [[7]]
+
+def test_batches_stop_at_max_batch():
+    gate = threading.Event()
+    predict = FakePredict(gate)
+    batcher = MicroBatcher(predict, max_batch=4, max_wait=0.05)
+    first = batcher.submit(rows(100))
+    while not predict.calls:
+        time.sleep(0.001)
+    # Queued while the first batch is being priced
+    futures = [batcher.submit(rows(2 * i, 2 * i + 1)) for i in range(5)]
+    gate.set()
+    assert list(first.result(timeout=5)) == [1000.0]
+    for i, future in enumerate(futures):
+        assert list(future.result(timeout=5)) == [20.0 * i, 20.0 * i + 10]
+    assert predict.calls[1:] == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+def test_request_larger_than_max_batch_is_priced_whole():
+    predict = FakePredict()
+    batcher = MicroBatcher(predict, max_batch=2, max_wait=0.01)
+    assert len(batcher.submit(rows(*range(5))).result(timeout=5)) == 5
+    assert predict.calls == [[0, 1, 2, 3, 4]]
+
+def test_failing_request_is_isolated_from_its_batch():
+    predict, stats = FakePredict(), Stats()
+    batcher = MicroBatcher(predict, max_batch=4, max_wait=1.0, stats=stats)
+    good, bad, other = batcher.submit(rows(1)), batcher.submit(rows(2, 3, bad=True)), batcher.submit(rows(4))
+    assert list(good.result(timeout=5)) == [10.0]
+    assert list(other.result(timeout=5)) == [40.0]
+    with pytest.raises(ValueError, match='z must be positive'):
+        bad.result(timeout=5)
+    # The whole batch once, then each request on its own
+    assert predict.calls == [[1, 2, 3, 4], [1], [2, 3], [4]]
+    assert stats.batches == [1, 2, 1]
+
+def test_batcher_keeps_serving_after_a_failure():
+    predict = FakePredict()
+    batcher = MicroBatcher(predict, max_batch=10, max_wait=0.01)
+    with pytest.raises(ValueError):
+        batcher.submit(rows(1, bad=True)).result(timeout=5)
+    assert list(batcher.submit(rows(5)).result(timeout=5)) == [50.0]
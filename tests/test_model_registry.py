@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+
+import pytest
+
+import model_registry
+from model_registry import POINTER_FILE, HotSwapModel, ModelRegistry
+
+# Registry resolution and hot swaps, with tiny text files standing in for
+# model artifacts and a stub loader standing in for xgboost
+
+def write_model(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+    return str(path)
+
+# Loads an artifact as {'text': ...}; counts loads and fails on 'broken' files
+class StubLoader:
+    def __init__(self):
+        self.loads = []
+
+    def __call__(self, path):
+        with open(path) as f:
+            text = f.read()
+        self.loads.append(text)
+        if text.startswith('broken'):
+            raise ValueError(f"cannot parse {text}")
+        return {'text': text}
+
+@pytest.fixture
+def fallback(tmp_path):
+    return write_model(tmp_path / 'xgb_model.json', 'legacy model')
+
+@pytest.fixture
+def hashes(monkeypatch):
+    calls = []
+    real = model_registry.artifact_version
+
+    def counting(path):
+        calls.append(path)
+        return real(path)
+
+    monkeypatch.setattr(model_registry, 'artifact_version', counting)
+    return calls
+
+def test_fallback_is_served_without_a_pointer(tmp_path, fallback):
+    registry = ModelRegistry(str(tmp_path / 'models'), fallback)
+    assert registry.resolve() == (model_registry.artifact_version(fallback), fallback)
+
+def test_fallback_is_hashed_only_when_it_changes(tmp_path, fallback, hashes):
+    registry = ModelRegistry(str(tmp_path / 'models'), fallback)
+    first = registry.resolve()
+    for _ in range(5):
+        assert registry.resolve() == first
+    assert len(hashes) == 1
+
+    write_model(fallback, 'retrained legacy model')
+    stat = os.stat(fallback)
+    os.utime(fallback, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    second = registry.resolve()
+    assert second[0] != first[0]
+    assert len(hashes) == 2
+
+def test_missing_fallback_raises(tmp_path):
+    registry = ModelRegistry(str(tmp_path / 'models'), str(tmp_path / 'missing.json'))
+    with pytest.raises(FileNotFoundError):
+        registry.resolve()
+
+def test_broken_version_is_not_reloaded_every_poll(tmp_path, fallback):
+    registry = ModelRegistry(str(tmp_path / 'models'), fallback)
+    loader = StubLoader()
+    models = HotSwapModel(registry, loader)
+    registry.publish(write_model(tmp_path / 'broken.json', 'broken model'), activate=True)
+    for _ in range(5):
+        models._guarded(models.refresh)
+    assert loader.loads == ['legacy model', 'broken model']
+    assert models.current['text'] == 'legacy model'
+    assert 'cannot parse' in models.last_error
+
+    registry.publish(write_model(tmp_path / 'fixed.json', 'fixed model'), activate=True)
+    models._guarded(models.refresh)
+    assert models.current['text'] == 'fixed model'
+    assert models.last_error is None
+
+def test_missing_artifact_is_retried_once_it_appears(tmp_path, fallback):
+    registry = ModelRegistry(str(tmp_path / 'models'), fallback)
+    loader = StubLoader()
+    models = HotSwapModel(registry, loader)
+    os.makedirs(registry.root)
+    write_model(os.path.join(registry.root, POINTER_FILE), 'abcdef012345\n')
+    for _ in range(3):
+        models._guarded(models.refresh)
+    assert 'FileNotFoundError' in models.last_error
+    assert models.version == model_registry.artifact_version(fallback)
+
+    write_model(registry.artifact_path('abcdef012345'), 'late model')
+    models._guarded(models.refresh)
+    assert models.version == 'abcdef012345'
+    assert models.current['text'] == 'late model'
+    assert models.last_error is None
+
+def test_publish_is_content_addressed(tmp_path, fallback):
+    registry = ModelRegistry(str(tmp_path / 'models'), fallback)
+    path = write_model(tmp_path / 'candidate.json', 'candidate model')
+    version = registry.publish(path)
+    assert registry.publish(path) == version == model_registry.artifact_version(path)
+    assert registry.versions() == [version]
+    assert registry.current_version() is None
+    with pytest.raises(ValueError):
+        registry.activate('000000000000')
+
+def test_pointer_overrides_fallback(tmp_path, fallback):
+    registry = ModelRegistry(str(tmp_path / 'models'), fallback)
+    version = registry.publish(write_model(tmp_path / 'candidate.json', 'candidate model'), activate=True)
+    assert registry.resolve() == (version, registry.artifact_path(version))
+
+def test_pointer_swap_is_atomic(tmp_path, fallback):
+    registry = ModelRegistry(str(tmp_path / 'models'), fallback)
+    versions = [registry.publish(write_model(tmp_path / f'model{i}.json', f'model {i}')) for i in range(2)]
+    registry.activate(versions[0])
+    stop = threading.Event()
+    seen = []
+
+    def read():
+        while not stop.is_set():
+            seen.append(registry.current_version())
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for i in range(300):
+            registry.activate(versions[i % 2])
+    finally:
+        stop.set()
+        reader.join()
+    assert seen and set(seen) <= set(versions)
+    assert [name for name in os.listdir(registry.root) if '.tmp' in name] == []
+
+def test_new_version_is_warmed_before_it_is_swapped_in(tmp_path, fallback):
+    registry = ModelRegistry(str(tmp_path / 'models'), fallback)
+    served_during_warm = []
+
+    def warm(bundle):
+        served_during_warm.append(models.current['text'])
+        bundle['warm'] = True
+
+    models = HotSwapModel(registry, StubLoader(), warm=warm)
+    registry.publish(write_model(tmp_path / 'candidate.json', 'candidate model'), activate=True)
+    assert models.refresh()
+    assert served_during_warm == ['legacy model']
+    assert models.current['text'] == 'candidate model' and models.current['warm']
+    assert not models.refresh()
+    assert models.swaps == 1
+
+def test_failed_warm_keeps_the_old_model(tmp_path, fallback):
+    registry = ModelRegistry(str(tmp_path / 'models'), fallback)
+
+    def warm(bundle):
+        if bundle['text'] == 'candidate model':
+            raise RuntimeError("warm-up prediction failed")
+
+    models = HotSwapModel(registry, StubLoader(), warm=warm)
+    registry.publish(write_model(tmp_path / 'candidate.json', 'candidate model'), activate=True)
+    models._guarded(models.refresh)
+    assert models.current['text'] == 'legacy model'
+    assert 'warm-up prediction failed' in models.last_error
+
+def test_in_flight_request_finishes_on_the_old_bundle(tmp_path, fallback):
+    registry = ModelRegistry(str(tmp_path / 'models'), fallback)
+    models = HotSwapModel(registry, StubLoader())
+    request_started = threading.Event()
+    swapped = threading.Event()
+    answers = []
+
+    def request():
+        bundle = models.current
+        request_started.set()
+        swapped.wait(5)
+        answers.append((bundle['version'], bundle['text']))
+
+    thread = threading.Thread(target=request)
+    thread.start()
+    request_started.wait(5)
+    version = registry.publish(write_model(tmp_path / 'candidate.json', 'candidate model'), activate=True)
+    assert models.refresh()
+    swapped.set()
+    thread.join()
+    assert answers == [(model_registry.artifact_version(fallback), 'legacy model')]
+    assert (models.version, models.current['text']) == (version, 'candidate model')
+
+def test_watcher_swaps_in_the_background(tmp_path, fallback):
+    registry = ModelRegistry(str(tmp_path / 'models'), fallback)
+    models = HotSwapModel(registry, StubLoader(), poll_interval=0.01)
+    models.start_watcher()
+    version = registry.publish(write_model(tmp_path / 'candidate.json', 'candidate model'), activate=True)
+    deadline = time.monotonic() + 5
+    while models.version != version and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert models.version == version
@@ -0,0 +1,37 @@
+import pytest
+
+from prediction_cache import PredictionCache
+from tree_engine import load_tree_ensemble
+
+STONE = (1.0, 'Ideal', 'E', 'VS2', 61.5, 57.0, 6.4, 6.4, 3.9)
+
+@pytest.fixture
+def cache(model_path):
+    return PredictionCache(load_tree_ensemble(model_path))
+
+def test_lookups_are_counted(cache):
+    price = cache.predict(*STONE)
+    assert cache.predict(*STONE) == price
+    # Slider noise below half a step lands on the same lattice point
+    assert cache.predict(1.04, *STONE[1:]) == price
+    stats = cache.stats()
+    assert (stats['hits'], stats['partial_hits'], stats['misses']) == (2, 0, 1)
+
+def test_explain_after_predict_is_a_partial_hit(cache):
+    price = cache.predict(*STONE)
+    explained_price, contributions = cache.explain(*STONE)
+    assert explained_price == price
+    assert contributions.sum() == pytest.approx(price, rel=1e-4)
+    assert cache.explain(*STONE)[1] is contributions
+    stats = cache.stats()
+    assert (stats['hits'], stats['partial_hits'], stats['misses']) == (1, 1, 1)
+    assert stats['hit_rate'] == pytest.approx(1 / 3)
+    assert stats['price_hit_rate'] == pytest.approx(2 / 3)
+
+def test_least_recently_used_entry_is_evicted(model_path):
+    cache = PredictionCache(load_tree_ensemble(model_path), maxsize=2)
+    for carat in (1.0, 1.1, 1.0, 1.2):
+        cache.predict(carat, *STONE[1:])
+    assert cache.stats()['evictions'] == 1
+    cache.predict(1.0, *STONE[1:])
+    assert cache.stats()['hits'] == 2
@@ -0,0 +1,106 @@
+import sqlite3
+import threading
+import types
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, normalize_prompt
+
+SYSTEM = "You are a diamond expert."
+MODEL = 'gemini-2.0-flash'
+
+# A settable clock in place of time.time inside response_cache
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(response_cache, 'time', types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'expert_cache.sqlite3')
+
+def test_prompts_are_normalized():
+    assert normalize_prompt("  What is  VS2 clarity?? ") == 'what is vs2 clarity'
+    assert normalize_prompt("What's the carat,\tweight!") == normalize_prompt("what s the CARAT weight")
+
+def test_trivial_variants_share_an_entry(db_path):
+    cache = ResponseCache(db_path)
+    cache.put("What is VS2 clarity?", "Very slightly included.", SYSTEM, MODEL)
+    assert cache.get("what is vs2 clarity", SYSTEM, MODEL) == "Very slightly included."
+    assert cache.get("What is VS2   CLARITY !", SYSTEM, MODEL) == "Very slightly included."
+    assert cache.stats() == {'hits': 2, 'near_hits': 0, 'misses': 0, 'size': 1}
+
+def test_context_is_part_of_the_key(db_path):
+    cache = ResponseCache(db_path)
+    cache.put("What is VS2 clarity?", "answer", SYSTEM, MODEL, {'temperature': 0.2})
+    assert cache.get("What is VS2 clarity?", SYSTEM, MODEL, {'temperature': 0.2}) == "answer"
+    # Whitespace in the system prompt does not matter; its words, the model and the config do
+    assert cache.get("What is VS2 clarity?", " You are a  diamond expert. ", MODEL, {'temperature': 0.2}) == "answer"
+    assert cache.get("What is VS2 clarity?", "You are a jeweler.", MODEL, {'temperature': 0.2}) is None
+    assert cache.get("What is VS2 clarity?", SYSTEM, 'gemini-1.5-pro', {'temperature': 0.2}) is None
+    assert cache.get("What is VS2 clarity?", SYSTEM, MODEL, {'temperature': 0.9}) is None
+
+def test_entries_expire_after_ttl(db_path, clock):
+    cache = ResponseCache(db_path, ttl=60)
+    cache.put("What is a carat?", "200 mg.", SYSTEM, MODEL)
+    clock.now += 59
+    assert cache.get("What is a carat?", SYSTEM, MODEL) == "200 mg."
+    clock.now += 2
+    assert cache.get("What is a carat?", SYSTEM, MODEL) is None
+    # The next write purges the expired row
+    cache.put("What is a point?", "0.01 ct.", SYSTEM, MODEL)
+    assert cache.stats()['size'] == 1
+
+def test_least_recently_used_entries_are_evicted_at_capacity(db_path, clock):
+    cache = ResponseCache(db_path, max_entries=3)
+    for i in range(3):
+        clock.now += 1
+        cache.put(f"question {i}", f"answer {i}", SYSTEM, MODEL)
+    clock.now += 1
+    assert cache.get("question 0", SYSTEM, MODEL) == "answer 0"
+    clock.now += 1
+    cache.put("question 3", "answer 3", SYSTEM, MODEL)
+    assert cache.stats()['size'] == 3
+    # question 1 was the least recently used
+    assert cache.get("question 1", SYSTEM, MODEL) is None
+    for i in (0, 2, 3):
+        assert cache.get(f"question {i}", SYSTEM, MODEL) == f"answer {i}"
+
+def test_near_duplicates_fall_back_within_the_same_context(db_path):
+    cache = ResponseCache(db_path, near_duplicate=0.6)
+    cache.put("how should i clean my diamond ring", "Warm soapy water.", SYSTEM, MODEL)
+    assert cache.get("how should i clean my ring", SYSTEM, MODEL) == "Warm soapy water."
+    assert cache.get("how should i clean my ring", "You are a jeweler.", MODEL) is None
+    assert cache.get("what is a carat", SYSTEM, MODEL) is None
+    assert cache.stats()['near_hits'] == 1
+
+def test_concurrent_connections_share_the_wal_database(db_path):
+    caches = [ResponseCache(db_path) for _ in range(4)]
+    assert caches[0]._conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    errors = []
+
+    def worker(index, cache):
+        try:
+            for i in range(50):
+                cache.put(f"question {index}-{i}", f"answer {index}-{i}", SYSTEM, MODEL)
+                # Every connection sees the others' committed writes
+                other = (index + 1) % len(caches)
+                cache.get(f"question {other}-{i}", SYSTEM, MODEL)
+                assert cache.get(f"question {index}-{i}", SYSTEM, MODEL) == f"answer {index}-{i}"
+        except (AssertionError, sqlite3.Error) as e:
+            errors.append(e)
+
+    # Two threads per connection as well, as the app's sessions share one cache
+    threads = [threading.Thread(target=worker, args=(i, caches[i % len(caches)])) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    reader = ResponseCache(db_path)
+    assert reader.stats()['size'] == 8 * 50
+    assert reader.get("question 7-49", SYSTEM, MODEL) == "answer 7-49"
+    for cache in caches + [reader]:
+        cache.close()
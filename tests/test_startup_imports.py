@@ -0,0 +1,31 @@
+import ast
+import json
+import subprocess
+import sys
+
+# The modules app.py imports before its first paint must not pull in the heavy
+# libraries the resource loaders import on first use
+
+HEAVY_MODULES = ['numpy', 'pandas', 'xgboost', 'google.generativeai', 'sklearn', 'scipy']
+
+# Modules app.py imports at the top level, streamlit itself aside
+def app_modules(path='app.py'):
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules.append(node.module)
+    return [module for module in modules if module.split('.')[0] != 'streamlit']
+
+def test_app_imports_leave_heavy_modules_unloaded():
+    modules = app_modules()
+    assert 'audit_log' in modules and 'pricing' in modules
+    code = (f"import importlib, json, sys\n"
+            f"for module in {modules!r}:\n"
+            f"    importlib.import_module(module)\n"
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))\n")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert json.loads(result.stdout) == []
@@ -0,0 +1,77 @@
+import json
+
+import numpy as np
+import pytest
+import xgboost as xgb
+
+from feature_pipeline import CATEGORY_MAPPINGS, FEATURE_COLUMNS
+from tree_engine import SHAP_GATHER_ROWS, load_tree_ensemble
+
+# The native engine must agree with xgboost itself, missing values included
+
+def booster_predict(booster, X, **kwargs):
+    return booster.predict(xgb.DMatrix(X, missing=np.nan, feature_names=FEATURE_COLUMNS), **kwargs)
+
+# Leaf of the first tree a row lands in, walked one node at a time
+def first_tree_leaf(ensemble, row):
+    node = ensemble.roots[0]
+    while ensemble.left[node] != node:
+        value = row[ensemble.feature[node]]
+        go_left = ensemble.default_left[node] if np.isnan(value) else value < ensemble.threshold[node]
+        node = ensemble.left[node] if go_left else ensemble.right[node]
+    return ensemble.value[node]
+
+def test_predict_matches_booster(model_path, booster, sample_rows):
+    ensemble = load_tree_ensemble(model_path)
+    np.testing.assert_allclose(ensemble.predict(sample_rows), booster_predict(booster, sample_rows), rtol=1e-5)
+
+def test_predict_row_matches_booster(model_path, booster, sample_rows):
+    ensemble = load_tree_ensemble(model_path)
+    actual = [ensemble.predict_row(row) for row in sample_rows]
+    np.testing.assert_allclose(actual, booster_predict(booster, sample_rows), rtol=1e-5)
+
+def test_missing_values_take_default_direction(model_path, booster, sample_rows):
+    ensemble = load_tree_ensemble(model_path)
+    missing = sample_rows[np.isnan(sample_rows).any(axis=1)]
+    assert len(missing) >= 60
+    # Filling the gaps must change the prices, or these rows prove nothing
+    filled = np.where(np.isnan(missing), 0.5, missing)
+    assert not np.allclose(ensemble.predict(filled), ensemble.predict(missing))
+    np.testing.assert_allclose(ensemble.predict(missing), booster_predict(booster, missing), rtol=1e-5)
+    np.testing.assert_allclose([ensemble.predict_row(row) for row in missing], booster_predict(booster, missing),
+                               rtol=1e-5)
+
+def test_base_score_matches_booster(model_path, booster, sample_rows):
+    with open(model_path) as f:
+        saved = json.load(f)['learner']['learner_model_param']['base_score']
+    ensemble = load_tree_ensemble(model_path)
+    assert ensemble.base_score == float(saved.strip('[]'))
+    # After the first tree alone, a price is the base score plus one leaf
+    leaves = np.array([first_tree_leaf(ensemble, row) for row in sample_rows], dtype=np.float64)
+    np.testing.assert_allclose(ensemble.base_score + leaves,
+                               booster_predict(booster, sample_rows, iteration_range=(0, 1)), rtol=1e-5)
+
+def test_small_batches_priced_natively(model_path, booster, sample_rows):
+    from pricing_service import NATIVE_BATCH_ROWS, predict_records
+
+    X = sample_rows[100:100 + NATIVE_BATCH_ROWS]
+    grades = {column: {code: grade for grade, code in mapping.items()} for column, mapping in CATEGORY_MAPPINGS.items()}
+    rows = []
+    for values in X.tolist():
+        row = dict(zip(FEATURE_COLUMNS, values))
+        rows.append(dict(row, **{column: grades[column][int(row[column])] for column in grades}))
+    prices = predict_records(None, load_tree_ensemble(model_path), rows)
+    np.testing.assert_allclose(prices, booster_predict(booster, X), rtol=1e-5)
+
+# Exact TreeSHAP, through both the per-row gather (small batches) and the
+# sparse table products (larger ones)
+@pytest.mark.parametrize('rows', [slice(0, 1), slice(0, SHAP_GATHER_ROWS), slice(None)], ids=['row', 'gather', 'sparse'])
+def test_explain_matches_pred_contribs(model_path, booster, sample_rows, rows):
+    ensemble = load_tree_ensemble(model_path)
+    X = sample_rows[rows]
+    np.testing.assert_allclose(ensemble.explain(X), booster_predict(booster, X, pred_contribs=True),
+                               rtol=1e-4, atol=1e-2)
+
+def test_explain_sums_to_prediction(model_path, sample_rows):
+    ensemble = load_tree_ensemble(model_path)
+    np.testing.assert_allclose(ensemble.explain(sample_rows).sum(axis=1), ensemble.predict(sample_rows), rtol=1e-5)
@@ -0,0 +1,517 @@
+import hashlib
+import json
+import math
+import struct
+
+import numpy as np
+
+from feature_pipeline import FEATURE_COLUMNS, SCHEMA_ATTRIBUTE, check_schema
+from pricing import MODEL_PATH
+
+# Native inference for the XGBoost regressor.
+#
+# xgb_model.json is flattened once into NumPy arrays (one slot per node across
+# all trees) and evaluated level by level, so predictions need neither pandas
+# nor a DMatrix. Results match XGBRegressor.predict to float32 tolerance.
+#
+# The same arrays can be saved in a compact binary form (save_compact): a small
+# JSON header followed by the raw, 64-byte aligned arrays in narrow types,
+# optionally with float16 leaves and only the first N trees. from_compact reads
+# them back with np.frombuffer instead of parsing a few MB of JSON.
+#
+# explain() gives per-feature price contributions: exact path-dependent
+# TreeSHAP, the values xgboost's pred_contribs computes. A leaf's share of a
+# row's attribution depends only on which of its path features the row
+# follows, and a leaf has at most `depth` of those, so each leaf's
+# contributions are tabulated once for every subset of them. Explaining a
+# batch is then one pass down the trees to find, for every leaf, the features
+# each row failed, and one table lookup per leaf and row.
+
+SUPPORTED_OBJECTIVES = ('reg:squarederror', 'reg:absoluteerror', 'reg:pseudohubererror')
+
+COMPACT_MAGIC = b'ADTREES1'
+COMPACT_FORMAT = 1
+COMPACT_ALIGN = 64
+COMPACT_LEAVES = ('float32', 'float16')
+
+# Attribution table rows summed per sparse product: about 1 MiB of float32
+# rows, so one group of trees stays in L2 while a chunk of rows walks it
+SHAP_GROUP_ROWS = 1 << 15
+# Up to this many rows a plain gather beats building the sparse products
+SHAP_GATHER_ROWS = 16
+
+class TreeEnsemble:
+    def __init__(self, feature, threshold, left, right, default_left, value, roots, depth,
+                 base_score, feature_names=None, version=None, cover=None, feature_schema=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.base_score = base_score
+        self.feature_names = feature_names
+        self.version = version
+        self.cover = cover
+        self.feature_schema = feature_schema
+        self._shap = None
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @classmethod
+    def from_json(cls, path=MODEL_PATH):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        learner = json.loads(raw)['learner']
+
+        objective = learner['objective']['name']
+        if objective not in SUPPORTED_OBJECTIVES:
+            raise ValueError(f"Unsupported objective for native inference: {objective}")
+
+        booster = learner['gradient_booster']
+        if booster['name'] != 'gbtree':
+            raise ValueError(f"Unsupported booster for native inference: {booster['name']}")
+        trees = booster['model']['trees']
+
+        # Early-stopped models are evaluated up to the best iteration, as predict() does
+        best_iteration = learner.get('attributes', {}).get('best_iteration')
+        if best_iteration is not None:
+            parallel = int(booster['model']['gbtree_model_param']['num_parallel_tree'])
+            trees = trees[:(int(best_iteration) + 1) * parallel]
+
+        features, thresholds, lefts, rights, defaults, values, covers, roots, depths = [], [], [], [], [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            if any(tree['split_type']):
+                raise ValueError("Categorical splits are not supported by native inference")
+            left = np.asarray(tree['left_children'], dtype=np.int32)
+            right = np.asarray(tree['right_children'], dtype=np.int32)
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+            is_leaf = left == -1
+            nodes = np.arange(len(left), dtype=np.int32)
+
+            # Leaves point at themselves so every tree can be walked for a fixed depth
+            lefts.append(np.where(is_leaf, nodes, left) + offset)
+            rights.append(np.where(is_leaf, nodes, right) + offset)
+            features.append(np.where(is_leaf, 0, tree['split_indices']).astype(np.int32))
+            thresholds.append(np.where(is_leaf, 0, conditions).astype(np.float32))
+            defaults.append(np.asarray(tree['default_left'], dtype=bool))
+            values.append(np.where(is_leaf, conditions, 0).astype(np.float32))
+            covers.append(np.asarray(tree['sum_hessian'], dtype=np.float32))
+            roots.append(offset)
+            depths.append(_tree_depth(left, right))
+            offset += len(left)
+
+        base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            default_left=np.concatenate(defaults),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            depth=max(depths, default=0),
+            base_score=base_score,
+            feature_names=learner.get('feature_names') or None,
+            version=hashlib.sha256(raw).hexdigest()[:12],
+            cover=np.concatenate(covers),
+            feature_schema=learner.get('attributes', {}).get(SCHEMA_ATTRIBUTE)
+        )
+
+    # Write the compact binary form. Thresholds are stored losslessly as uint16
+    # indices into a table of the distinct split values (float16 thresholds move
+    # splits across real measurements); leaves as 'float32' or 'float16'. Child
+    # links are stored relative to their tree's root. max_trees keeps only the
+    # first trees, the most significant in boosting order.
+    def save_compact(self, path, leaves='float32', max_trees=None):
+        if leaves not in COMPACT_LEAVES:
+            raise ValueError(f"leaves must be one of {', '.join(COMPACT_LEAVES)}")
+        n_trees = self.n_trees if max_trees is None else max(1, min(max_trees, self.n_trees))
+        roots = self.roots[:n_trees]
+        n_nodes = int(self.roots[n_trees]) if n_trees < self.n_trees else len(self.feature)
+        tree_of_node = np.repeat(np.arange(n_trees), np.diff(np.append(roots, n_nodes)))
+        local_left = self.left[:n_nodes] - roots[tree_of_node]
+        local_right = self.right[:n_nodes] - roots[tree_of_node]
+        child_dtype = np.uint16 if max(local_left.max(initial=0), local_right.max(initial=0)) < 2 ** 16 else np.int32
+
+        arrays = {
+            'feature': self.feature[:n_nodes].astype(np.uint8 if self.feature.max(initial=0) < 256 else np.int32),
+            'left': local_left.astype(child_dtype),
+            'right': local_right.astype(child_dtype),
+            'default_left': self.default_left[:n_nodes].astype(np.uint8),
+            'value': self.value[:n_nodes].astype(leaves),
+            'roots': roots.astype(np.int32)
+        }
+        # Node covers (training rows per node) are only needed for explain()
+        if self.cover is not None:
+            arrays['cover'] = self.cover[:n_nodes].astype(np.float32)
+        table, index = np.unique(self.threshold[:n_nodes], return_inverse=True)
+        if len(table) <= 2 ** 16:
+            arrays['threshold_table'] = table.astype(np.float32)
+            arrays['threshold_index'] = index.astype(np.uint16)
+        else:
+            arrays['threshold'] = self.threshold[:n_nodes].astype(np.float32)
+
+        header = {'format': COMPACT_FORMAT, 'depth': self.depth, 'base_score': self.base_score,
+                  'feature_names': self.feature_names, 'feature_schema': self.feature_schema,
+                  'source_version': self.version,
+                  'n_trees': n_trees, 'source_trees': self.n_trees, 'arrays': {}}
+        offset = 0
+        for name, array in arrays.items():
+            offset = -(-offset // COMPACT_ALIGN) * COMPACT_ALIGN
+            header['arrays'][name] = [array.dtype.str, len(array), offset]
+            offset += array.nbytes
+        header_bytes = json.dumps(header).encode()
+        data_start = -(-(len(COMPACT_MAGIC) + 4 + len(header_bytes)) // COMPACT_ALIGN) * COMPACT_ALIGN
+
+        with open(path, 'wb') as f:
+            f.write(COMPACT_MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+            for name, array in arrays.items():
+                f.seek(data_start + header['arrays'][name][2])
+                f.write(array.tobytes())
+        return n_trees
+
+    @classmethod
+    def from_compact(cls, path):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        if raw[:len(COMPACT_MAGIC)] != COMPACT_MAGIC:
+            raise ValueError(f"{path} is not a compact tree ensemble")
+        header_end = len(COMPACT_MAGIC) + 4
+        if len(raw) >= header_end:
+            header_end += struct.unpack_from('<I', raw, len(COMPACT_MAGIC))[0]
+        try:
+            if len(raw) < header_end:
+                raise ValueError
+            header = json.loads(raw[len(COMPACT_MAGIC) + 4:header_end])
+        except ValueError:
+            raise ValueError(f"{path} is truncated or corrupt: its header is incomplete") from None
+        if header.get('format') != COMPACT_FORMAT:
+            raise ValueError(f"{path} is compact format {header.get('format')!r}; this version reads "
+                             f"format {COMPACT_FORMAT}. Re-save it from the JSON model with save_compact.")
+        data_start = -(-header_end // COMPACT_ALIGN) * COMPACT_ALIGN
+
+        arrays = {}
+        for name, (dtype, length, offset) in header['arrays'].items():
+            end = data_start + offset + np.dtype(dtype).itemsize * length
+            if end > len(raw):
+                raise ValueError(f"{path} is truncated: array {name!r} needs {end:,} bytes, "
+                                 f"the file has {len(raw):,}")
+            arrays[name] = np.frombuffer(raw, dtype=dtype, count=length, offset=data_start + offset)
+
+        # Decode back to the in-memory layout from_json produces
+        roots = arrays['roots'].astype(np.int32)
+        tree_of_node = np.repeat(np.arange(len(roots)), np.diff(np.append(roots, len(arrays['feature']))))
+        if 'threshold_table' in arrays:
+            threshold = arrays['threshold_table'][arrays['threshold_index']]
+        else:
+            threshold = arrays['threshold'].astype(np.float32)
+        return cls(
+            feature=arrays['feature'].astype(np.int32),
+            threshold=threshold,
+            left=arrays['left'].astype(np.int32) + roots[tree_of_node],
+            right=arrays['right'].astype(np.int32) + roots[tree_of_node],
+            default_left=arrays['default_left'].astype(bool),
+            value=arrays['value'].astype(np.float32),
+            roots=roots,
+            depth=header['depth'],
+            base_score=header['base_score'],
+            feature_names=header['feature_names'],
+            version=hashlib.sha256(raw).hexdigest()[:12],
+            cover=arrays['cover'].astype(np.float32) if 'cover' in arrays else None,
+            feature_schema=header.get('feature_schema')
+        )
+
+    # Walk every tree for one row at once; the scalar fast path for the interactive tab
+    def predict_row(self, row):
+        row = np.asarray(row, dtype=np.float32)
+        nodes = self.roots
+        for _ in range(self.depth):
+            values = row[self.feature[nodes]]
+            go_left = values < self.threshold[nodes]
+            missing = np.isnan(values)
+            if missing.any():
+                go_left = np.where(missing, self.default_left[nodes], go_left)
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return float(self.base_score + self.value[nodes].sum(dtype=np.float64))
+
+    # Vectorized path for a 2-D array of encoded features (columns in FEATURE_COLUMNS order)
+    def predict(self, X, chunksize=4096):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2:
+            raise ValueError("Expected a 2-D feature array")
+        out = np.empty(len(X), dtype=np.float32)
+        for start in range(0, len(X), chunksize):
+            out[start:start + chunksize] = self._predict_block(X[start:start + chunksize])
+        return out
+
+    def _predict_block(self, X):
+        # Gather through the flattened block; cheaper than 2-D fancy indexing
+        flat = X.ravel()
+        row_offsets = (np.arange(len(X), dtype=np.intp) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        for _ in range(self.depth):
+            values = flat[row_offsets + self.feature[nodes]]
+            go_left = values < self.threshold[nodes]
+            missing = np.isnan(values)
+            if missing.any():
+                go_left = np.where(missing, self.default_left[nodes], go_left)
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.base_score + self.value[nodes].sum(axis=1, dtype=np.float64)
+
+    # Per-feature contributions for a 2-D array of encoded features: one column
+    # per feature plus a last one holding the expected price over the training
+    # data. Each row sums to predict(X) for that row.
+    def explain(self, X, chunksize=256):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2:
+            raise ValueError("Expected a 2-D feature array")
+        tables = self.prepare_explain()
+        out = np.empty((len(X), tables['n_features'] + 1))
+        out[:, -1] = tables['expected']
+        for start in range(0, len(X), chunksize):
+            out[start:start + chunksize, :-1] = _explain_block(X[start:start + chunksize], tables)
+        return out
+
+    def explain_row(self, row):
+        return self.explain(np.asarray(row, dtype=np.float32)[None, :])[0]
+
+    # Build the attribution tables now rather than on the first explain()
+    def prepare_explain(self):
+        if self._shap is None:
+            self._shap = _shap_tables(self)
+        return self._shap
+
+# Precompute the attribution tables for explain().
+#
+# For a leaf with value v whose path splits on the feature set P (d features),
+# let z_k be the product of cover fractions along the path over the splits on
+# feature k, and F the features whose splits a row follows. Path-dependent
+# TreeSHAP gives feature j the share
+#   v * (1 - z_j) / z_j * A(F - {j})   if j is in F
+#   -v * A(F)                          otherwise
+# where A(T) = sum over S within T of |S|! (d - |S| - 1)! / d! * prod of z_k for
+# k in P - S. The table holds one row of feature contributions per leaf and
+# subset F of its path features. Two sibling leaves share one block, indexed by
+# the subset their parent followed and the direction the row took there, so a
+# row needs one lookup per pair and the last split level is never propagated.
+def _shap_tables(ensemble):
+    if ensemble.cover is None:
+        raise ValueError("This model carries no node covers; re-export it to explain predictions")
+    n_features = len(ensemble.feature_names) if ensemble.feature_names else int(ensemble.feature.max()) + 1
+    if n_features > 16:
+        raise ValueError("Explanations support at most 16 features")
+    n_nodes = len(ensemble.feature)
+    nodes = np.arange(n_nodes)
+    is_leaf = ensemble.left == nodes
+    is_pair = ~is_leaf & is_leaf[ensemble.left] & is_leaf[ensemble.right]
+    cover = ensemble.cover.astype(np.float64)
+
+    # Path feature set and per-feature cover fractions of every node, top down
+    path_mask = np.zeros(n_nodes, dtype=np.int64)
+    z = np.ones((n_nodes, n_features))
+    level = ensemble.roots
+    while len(level):
+        inner = level[~is_leaf[level]]
+        for child in (ensemble.left[inner], ensemble.right[inner]):
+            z[child] = z[inner]
+            z[child, ensemble.feature[inner]] *= cover[child] / cover[inner]
+            path_mask[child] = path_mask[inner] | (1 << ensemble.feature[inner])
+        level = np.concatenate([ensemble.left[inner], ensemble.right[inner]])
+
+    leaves = nodes[is_leaf]
+    root_of_leaf = ensemble.roots[np.searchsorted(ensemble.roots, leaves, side='right') - 1]
+    expected = ensemble.base_score + float(np.sum(ensemble.value[leaves].astype(np.float64) *
+                                                  cover[leaves] / cover[root_of_leaf]))
+    leaf_table, leaf_offset = _leaf_tables(ensemble, leaves, path_mask, z, n_features)
+
+    # Units are sibling pairs (keyed by their parent) and leaves without a leaf sibling, in tree order
+    lone = is_leaf.copy()
+    lone[ensemble.left[is_pair]] = False
+    lone[ensemble.right[is_pair]] = False
+    units = nodes[is_pair | lone]
+    unit_pair = is_pair[units]
+    unit_set = np.where(unit_pair, path_mask[ensemble.left[units]], path_mask[units])
+    unit_size = (1 << _popcount(unit_set)) << unit_pair
+    offsets = np.concatenate([[0], np.cumsum(unit_size)])
+    table = np.empty((offsets[-1], n_features), dtype=np.float32)
+    # A lone leaf's block is its own table
+    singles = np.flatnonzero(~unit_pair)
+    single_row = leaf_offset[np.searchsorted(leaves, units[singles])]
+    for size in np.unique(unit_size[singles]):
+        group = unit_size[singles] == size
+        table[offsets[singles[group], None] + np.arange(size)] = leaf_table[single_row[group, None] + np.arange(size)]
+    pairs = np.flatnonzero(unit_pair)
+    left_row = leaf_offset[np.searchsorted(leaves, ensemble.left[units[pairs]])]
+    right_row = leaf_offset[np.searchsorted(leaves, ensemble.right[units[pairs]])]
+    # Local bit of the parent's split feature within the pair's path set
+    split_feature = ensemble.feature[units[pairs]]
+    split_bit = 1 << _popcount(unit_set[pairs] & ((1 << split_feature) - 1))
+    for size in np.unique(unit_size[pairs]):
+        group = unit_size[pairs] == size
+        followed = np.arange(size // 2)
+        bit = split_bit[group, None]
+        # Block row 2 * followed + went_left: the sibling not taken also fails on the split feature
+        table[offsets[pairs[group], None] + 2 * followed] = \
+            leaf_table[left_row[group, None] + (followed & ~bit)] + leaf_table[right_row[group, None] + followed]
+        table[offsets[pairs[group], None] + 2 * followed + 1] = \
+            leaf_table[left_row[group, None] + followed] + leaf_table[right_row[group, None] + (followed & ~bit)]
+
+    # Subset numbering: compress the followed features of a path set to the
+    # bits of that set, for every possible mask of failed features
+    path_sets, set_of_unit = np.unique(unit_set, return_inverse=True)
+    failed = np.arange(1 << n_features)
+    subset_index = np.zeros((len(path_sets), len(failed)), dtype=np.int64)
+    rank = np.zeros(len(path_sets), dtype=np.int64)
+    for f in range(n_features):
+        on_path = (path_sets >> f) & 1
+        subset_index += (on_path[:, None] & ~(failed[None, :] >> f) & 1) << rank[:, None]
+        rank += on_path
+
+    # The per-level layout explain() walks for each batch
+    levels = []
+    level = ensemble.roots
+    while len(level):
+        split = ~is_leaf[level] & ~is_pair[level]
+        at_pair = is_pair[level]
+        at_lone = lone[level]
+        inner = level[split | at_pair]
+        levels.append({
+            'split': np.flatnonzero(split | at_pair),
+            'feature': ensemble.feature[inner],
+            'threshold': ensemble.threshold[inner][:, None],
+            'default_left': ensemble.default_left[inner][:, None],
+            'bit': (1 << ensemble.feature[inner]).astype(np.uint16)[:, None],
+            'continues': np.flatnonzero(split[split | at_pair]),
+            'pairs': np.flatnonzero(at_pair[split | at_pair]),
+            'pair_units': np.searchsorted(units, level[at_pair]),
+            'lone': np.flatnonzero(at_lone),
+            'lone_units': np.searchsorted(units, level[at_lone])
+        })
+        level = np.concatenate([ensemble.left[level[split]], ensemble.right[level[split]]])
+
+    # Group trees so each group's slice of the table stays cache resident
+    tree_of_unit = np.searchsorted(ensemble.roots, units, side='right') - 1
+    tree_start = np.searchsorted(tree_of_unit, np.arange(ensemble.n_trees))
+    starts = [0]
+    for unit in tree_start[1:]:
+        if offsets[unit] - offsets[starts[-1]] > SHAP_GROUP_ROWS:
+            starts.append(unit)
+    groups = list(zip(starts, starts[1:] + [len(units)]))
+    group_of_unit = np.repeat(np.arange(len(groups)), [end - start for start, end in groups])
+    subset_dtype = np.uint8 if subset_index.max() < 128 else np.int32
+    return {
+        'n_features': n_features,
+        'expected': expected,
+        'levels': levels,
+        'n_units': len(units),
+        'subset_index': subset_index.ravel().astype(subset_dtype),
+        'subset_base': (set_of_unit * len(failed)).astype(np.int32)[:, None],
+        'row_base': (offsets[:-1] - offsets[starts][group_of_unit]).astype(np.int32)[:, None],
+        'group_base': offsets[starts][group_of_unit].astype(np.int32)[:, None],
+        'table': table,
+        'groups': [(start, end, table[offsets[start]:offsets[end]]) for start, end in groups]
+    }
+
+# Contribution rows of every leaf for every subset of its path features
+# (numbered by the features' order), and the first row of each leaf
+def _leaf_tables(ensemble, leaves, path_mask, z, n_features):
+    feature_bits = (path_mask[leaves, None] >> np.arange(n_features)) & 1
+    n_path = feature_bits.sum(axis=1)
+    offsets = np.concatenate([[0], np.cumsum(1 << n_path)])
+    if offsets[-1] > 1 << 26:
+        raise ValueError("Model too deep for tabulated explanations")
+    value = ensemble.value[leaves].astype(np.float64)
+    table = np.zeros((offsets[-1], n_features), dtype=np.float32)
+    for d in np.unique(n_path):
+        group = np.flatnonzero(n_path == d)
+        path_features = np.nonzero(feature_bits[group])[1].reshape(len(group), d)
+        zz = z[leaves[group, None], path_features]
+        subsets = np.arange(1 << d)
+        members = (subsets[:, None] >> np.arange(d)) & 1
+        # (A of the full path set is never looked up; its weight is left at zero)
+        weights = np.array([math.factorial(s) * math.factorial(d - s - 1) / math.factorial(d) if s < d else 0.0
+                            for s in range(d + 1)])
+        # A over all subsets at once: weighted terms, then a sum over subsets (zeta transform)
+        A = weights[members.sum(axis=1)] * np.prod(np.where(members[None, :, :] == 1, 1.0, zz[:, None, :]), axis=2)
+        for j in range(d):
+            has_j = members[:, j] == 1
+            A[:, has_j] += A[:, subsets[has_j] ^ (1 << j)]
+        v = value[group, None]
+        rows = offsets[group, None] + subsets
+        for j in range(d):
+            table[rows, path_features[:, j, None]] = np.where(
+                members[:, j] == 1, v * (1 - zz[:, j, None]) / zz[:, j, None] * A[:, subsets ^ (1 << j)], -v * A)
+    return table, offsets[:-1]
+
+def _popcount(masks):
+    masks = np.asarray(masks, dtype=np.int64)
+    return sum((masks >> f) & 1 for f in range(16))
+
+def _explain_block(X, tables):
+    from scipy.sparse import csr_matrix
+
+    X = X.T.copy()
+    n_rows = X.shape[1]
+    rows = np.empty((tables['n_units'], n_rows), dtype=np.int32)
+    subset_index, subset_base = tables['subset_index'], tables['subset_base']
+    # Failed path features (one bit each) of every node, level by level; each
+    # unit's block row is read off where it hangs
+    failed = np.zeros((len(tables['levels'][0]['lone']) + len(tables['levels'][0]['split']), n_rows),
+                      dtype=np.uint16)
+    for level in tables['levels']:
+        units = level['lone_units']
+        rows[units] = subset_index[subset_base[units] + failed[level['lone']]]
+        values = X[level['feature']]
+        go_left = values < level['threshold']
+        missing = np.isnan(values)
+        if missing.any():
+            go_left = np.where(missing, level['default_left'], go_left)
+        parent = failed[level['split']]
+        units = level['pair_units']
+        pairs = level['pairs']
+        rows[units] = 2 * subset_index[subset_base[units] + parent[pairs]] + go_left[pairs]
+        continues = level['continues']
+        parent = parent[continues]
+        went_left_bit = go_left[continues] * level['bit'][continues]
+        failed = np.concatenate([parent | (level['bit'][continues] - went_left_bit), parent | went_left_bit])
+
+    rows += tables['row_base']
+    if n_rows <= SHAP_GATHER_ROWS:
+        picked = tables['table'][rows + tables['group_base']].reshape(len(rows), -1).astype(np.float64)
+        return (np.ones(len(rows)) @ picked).reshape(n_rows, -1)
+    out = np.zeros((n_rows, tables['n_features']))
+    ones = np.ones(len(rows) * n_rows, dtype=np.float32)
+    for start, end, table in tables['groups']:
+        indices = rows[start:end].T.ravel()
+        selection = csr_matrix((ones[:len(indices)], indices, np.arange(n_rows + 1) * (end - start)),
+                               shape=(n_rows, len(table)))
+        out += selection @ table
+    return out
+
+# Depth of a single tree given its child arrays (-1 marks a leaf)
+def _tree_depth(left, right):
+    depth = 0
+    level = [0]
+    while level:
+        level = [child for node in level if left[node] != -1 for child in (left[node], right[node])]
+        if level:
+            depth += 1
+    return depth
+
+def is_compact(path):
+    with open(path, 'rb') as f:
+        return f.read(len(COMPACT_MAGIC)) == COMPACT_MAGIC
+
+# Load the native engine from either format, checking the model was trained on our feature layout
+def load_tree_ensemble(path=MODEL_PATH):
+    ensemble = TreeEnsemble.from_compact(path) if is_compact(path) else TreeEnsemble.from_json(path)
+    if ensemble.feature_names and list(ensemble.feature_names) != FEATURE_COLUMNS:
+        raise ValueError(f"Model features {ensemble.feature_names} do not match {FEATURE_COLUMNS}")
+    check_schema(ensemble.feature_schema, f"Model {path}")
+    return ensemble